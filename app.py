@@ -2,76 +2,105 @@
 import streamlit as st
 st.set_page_config(page_title="TRUCCO", page_icon="🡕", layout="wide")
 
-from dashboard import mostrar_dashboard
+from dashboard import (mostrar_dashboard, build_analytic_model, update_analytic_model,
+                       build_ventas_index, build_sales_cube, valores_filtro)
+from snapshot_cache import load_snapshot, save_snapshot
+from excel_ingest import read_sheet_streaming, read_sheets_parallel, measure_ingest
+from schema import (SCHEMAS, ORDEN_HOJAS, read_dtypes, apply_schema,
+                    encode_dimensions, frame_memory, memory_report)
+from dataset import upload_fingerprint, acquire_dataset, dataset_stats
 import pandas as pd
 import base64
 import os
+import time
 
 # Performance optimization: Set pandas options
-pd.options.mode.chained_assignment = None  # default='warn'
+# Copy-on-Write: selections and derived frames share data with the analytic model until
+# they are written, so sections never need defensive .copy() calls
+pd.options.mode.copy_on_write = True
 
 # Function to get absolute path for assets
 def get_asset_path(filename):
     current_dir = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(current_dir, "assets", filename)
 
+# Hojas del libro Excel y tipos de lectura de cada una (definidos en el registro de esquemas)
+HOJAS_EXCEL = [(SCHEMAS[nombre]["hoja"], read_dtypes(nombre)) for nombre in ORDEN_HOJAS]
+
+MODOS_CARGA = ["Estándar", "Streaming", "Paralelo"]
+
 # Cached function for loading Excel data
 @st.cache_data
-def load_excel_data(file):
-    """Cache the Excel file loading to avoid reprocessing on every interaction - OPTIMIZED VERSION"""
+def load_excel_data(file, modo="Estándar", medir_memoria=False, categorias=False):
+    """
+    Cache the Excel file loading to avoid reprocessing on every interaction - OPTIMIZED VERSION
+
+    Args:
+        file: Uploaded Excel file
+        modo: "Estándar" (pd.read_excel), "Streaming" (openpyxl read_only por bloques)
+            o "Paralelo" (las tres hojas a la vez en un pool de procesos)
+        medir_memoria: Medir memoria pico por hoja (ignora el snapshot para medir la lectura real)
+        categorias: Guardar Tienda, Familia, Talla, Temporada, Zona, Color, Tema y Código único
+            como categóricas con un diccionario compartido entre las tres hojas
+
+    Returns:
+        df_productos, df_traspasos, df_ventas, informe de carga (filas/segundo y memoria por hoja)
+    """
+    informe = []
     try:
-        # OPTIMIZATION: Use more efficient Excel reading
-        xls = pd.ExcelFile(file, engine="openpyxl")
-        
+        # OPTIMIZATION: Reuse the on-disk Parquet snapshot of an identical upload
+        inicio = time.perf_counter()
+        # The schema version is part of the key so a registry change never serves stale types
+        digest = upload_fingerprint(file.getvalue(), categorias)
+        snapshot = None if medir_memoria else load_snapshot(digest)
+        if snapshot is not None:
+            informe.append({
+                'Hoja': 'Todas',
+                'Modo': 'Snapshot',
+                'Filas': sum(len(df) for df in snapshot),
+                'Segundos': round(time.perf_counter() - inicio, 3)
+            })
+            return (*snapshot, pd.DataFrame(informe))
+
         # OPTIMIZATION: Read only necessary sheets and optimize data types
-        df_productos = pd.read_excel(
-            xls, 
-            sheet_name="Compra",
-            dtype={
-                'ACT': str,
-                'Cantidad Pedida': 'Int64',
-                'P.V.P.': 'Float64'
-            },
-            na_values=['', 'nan', 'NaN'],
-            keep_default_na=False
-        )
-        
-        df_traspasos = pd.read_excel(
-            xls, 
-            sheet_name="Traspasos de almacén a tienda",
-            dtype={
-                'ACT': str,
-                'Enviado': 'Int64'
-            },
-            na_values=['', 'nan', 'NaN'],
-            keep_default_na=False
-        )
-        
-        df_ventas = pd.read_excel(
-            xls, 
-            sheet_name="ventas 23 24 25",
-            dtype={
-                'ACT': str,
-                'Cantidad': 'Int64',
-                'P.V.P.': 'Float64',
-                'Subtotal': 'Float64'
-            },
-            na_values=['', 'nan', 'NaN'],
-            keep_default_na=False
-        )
+        if modo == "Paralelo":
+            # OPTIMIZATION: Parse all sheets concurrently in worker processes
+            hojas, stats = measure_ingest(
+                'Todas', modo, lambda: read_sheets_parallel(file.getvalue(), HOJAS_EXCEL),
+                trace_memory=medir_memoria
+            )
+            if medir_memoria:
+                # tracemalloc solo ve este proceso: el parseo ocurre en los workers
+                stats['Nota'] = 'Memoria pico solo del proceso principal (sin los workers)'
+            informe.append(stats)
+        else:
+            if modo == "Streaming":
+                # OPTIMIZATION: Stream rows in read_only mode, building typed columns per chunk
+                def leer_hoja(hoja, tipos):
+                    return read_sheet_streaming(file, hoja, dtype=tipos)
+            else:
+                # OPTIMIZATION: Use more efficient Excel reading
+                xls = pd.ExcelFile(file, engine="openpyxl")
+
+                def leer_hoja(hoja, tipos):
+                    return pd.read_excel(
+                        xls,
+                        sheet_name=hoja,
+                        dtype=tipos,
+                        na_values=['', 'nan', 'NaN'],
+                        keep_default_na=False
+                    )
+
+            hojas = []
+            for hoja, tipos in HOJAS_EXCEL:
+                df, stats = measure_ingest(hoja, modo, lambda: leer_hoja(hoja, tipos), trace_memory=medir_memoria)
+                hojas.append(df)
+                informe.append(stats)
+        df_productos, df_traspasos, df_ventas = hojas
         
-        # OPTIMIZATION: Early data cleaning and type conversion
-        for df, df_name in [(df_productos, 'Productos'), (df_traspasos, 'Traspasos'), (df_ventas, 'Ventas')]:
-            # Convert string columns to more efficient types
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    # Check if column contains mostly numeric data
-                    numeric_count = pd.to_numeric(df[col], errors='coerce').notna().sum()
-                    if numeric_count > len(df) * 0.8:  # If 80%+ is numeric
-                        df[col] = pd.to_numeric(df[col], errors='coerce')
-                    else:
-                        # Convert to string and handle NaN values
-                        df[col] = df[col].astype(str).replace('nan', '')
+        # OPTIMIZATION: Apply the declared schema once instead of sniffing every text column
+        for df, nombre in zip((df_productos, df_traspasos, df_ventas), ORDEN_HOJAS):
+            apply_schema(df, nombre)
             
             # OPTIMIZATION: Remove completely empty rows early
             df.dropna(how='all', inplace=True)
@@ -79,28 +108,22 @@ def load_excel_data(file):
             # OPTIMIZATION: Remove completely empty columns early
             df.dropna(axis=1, how='all', inplace=True)
         
-        return df_productos, df_traspasos, df_ventas
+        if categorias:
+            # OPTIMIZATION: Dictionary-encode shared dimensions so groupbys and joins work on integer codes
+            frames = dict(zip(ORDEN_HOJAS, (df_productos, df_traspasos, df_ventas)))
+            memoria_texto = frame_memory(frames)
+            encode_dimensions(frames)
+            informe.extend(memory_report(memoria_texto, frame_memory(frames)))
+        
+        # OPTIMIZATION: Persist cleaned frames so later uploads of the same file skip parsing
+        save_snapshot(digest, (df_productos, df_traspasos, df_ventas))
+        
+        return df_productos, df_traspasos, df_ventas, pd.DataFrame(informe)
         
     except Exception as e:
         st.error(f"Error loading Excel file: {str(e)}")
         # Return empty DataFrames with proper structure
-        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
-
-# Cached function for filtering data by season
-@st.cache_data
-def filter_by_season(df_ventas, temporada_seleccionada):
-    """Cache the season filtering to avoid reprocessing"""
-    if temporada_seleccionada != "Todas las temporadas":
-        return df_ventas[df_ventas["Temporada"] == temporada_seleccionada]
-    return df_ventas
-
-# Cached function for filtering data by family
-@st.cache_data
-def filter_by_family(df_ventas, familia_seleccionada):
-    """Cache the family filtering to avoid reprocessing"""
-    if familia_seleccionada != "Todas las familias":
-        return df_ventas[df_ventas["Descripción Familia"] == familia_seleccionada]
-    return df_ventas
+        return pd.DataFrame(), pd.DataFrame(), pd.DataFrame(), pd.DataFrame(informe)
 
 # Estilos CSS
 st.markdown("""
@@ -215,19 +238,75 @@ else:
         # Subida de archivo solo para análisis
         file = st.sidebar.file_uploader("Sube el archivo Excel", type=["xlsx"])
 
+        modo_carga = st.sidebar.selectbox("Modo de carga", MODOS_CARGA)
+        medir_memoria = st.sidebar.checkbox("Medir memoria de carga", value=False)
+        categorias = st.sidebar.checkbox("Columnas categóricas", value=False)
+        incremental = st.sidebar.checkbox(
+            "Carga incremental", value=False,
+            help="Añade solo las ventas nuevas a la base guardada de subidas anteriores"
+        )
+
         if file:
             try:
                 # Use session state to avoid reloading data if file hasn't changed
-                file_hash = hash(file.getvalue())
+                file_hash = (hash(file.getvalue()), modo_carga, medir_memoria, categorias, incremental)
                 if 'file_hash' not in st.session_state or st.session_state.file_hash != file_hash:
                     with st.spinner("Cargando y procesando datos..."):
                         st.session_state.file_hash = file_hash
-                        st.session_state.df_productos, st.session_state.df_traspasos, st.session_state.df_ventas = load_excel_data(file)
+                        # Fingerprint computed once per upload; every derived cache is keyed on it
+                        st.session_state.huella = upload_fingerprint(file.getvalue(), categorias)
+                        # Drop this session's reference to its previous dataset before loading
+                        st.session_state.dataset = None
+
+                        # OPTIMIZATION: Sessions share one read-only copy of each dataset per process;
+                        # if another session already loaded this upload, skip parsing and building
+                        inicio = time.perf_counter()
+                        referencia = None
+                        if not (incremental or medir_memoria):
+                            referencia = acquire_dataset(st.session_state.huella)
+                        if referencia is not None:
+                            st.session_state.informe_carga = pd.DataFrame([{
+                                'Hoja': 'Todas',
+                                'Modo': 'Compartido',
+                                'Filas': sum(len(df) for df in referencia.frames()),
+                                'Segundos': round(time.perf_counter() - inicio, 3)
+                            }])
+                        else:
+                            df_productos, df_traspasos, df_ventas, st.session_state.informe_carga = load_excel_data(
+                                file, modo_carga, medir_memoria, categorias
+                            )
+                            if incremental:
+                                # OPTIMIZATION: Only sales rows missing from the saved base are preprocessed;
+                                # the cube and rotation are extended instead of rebuilt
+                                (
+                                    df_productos, df_traspasos, df_ventas, cubo, st.session_state.huella, informe_incremental
+                                ) = update_analytic_model(df_productos, df_traspasos, df_ventas, st.session_state.huella, categorias)
+                                st.session_state.informe_carga = pd.concat(
+                                    [st.session_state.informe_carga, pd.DataFrame([informe_incremental])], ignore_index=True
+                                )
+                                referencia = acquire_dataset(
+                                    st.session_state.huella, lambda: (df_productos, df_traspasos, df_ventas)
+                                )
+                                build_sales_cube(referencia.frames()[2], st.session_state.huella, cubo)
+                            else:
+                                # OPTIMIZATION: Build the analytic model once per upload; reruns only read it
+                                referencia = acquire_dataset(
+                                    st.session_state.huella,
+                                    lambda: build_analytic_model(df_productos, df_traspasos, df_ventas, st.session_state.huella)
+                                )
+                        st.session_state.dataset = referencia
                     st.sidebar.success("Archivo cargado correctamente")
                 
-                df_productos = st.session_state.df_productos
-                df_traspasos = st.session_state.df_traspasos
-                df_ventas = st.session_state.df_ventas
+                # Rendimiento de la carga (filas/segundo y memoria pico por hoja)
+                if not st.session_state.informe_carga.empty:
+                    with st.sidebar.expander("Rendimiento de carga"):
+                        st.dataframe(st.session_state.informe_carga, hide_index=True)
+                        # Conjuntos en memoria compartidos entre sesiones
+                        st.dataframe(dataset_stats(), hide_index=True)
+
+                # Read-only views of the shared dataset (shallow copies, no data copied)
+                df_productos, df_traspasos, df_ventas = st.session_state.dataset.frames()
+                huella = st.session_state.huella
 
                 seccion = st.sidebar.selectbox("Área de Análisis", [
                     "Resumen General",
@@ -237,26 +316,37 @@ else:
                     "Análisis PVP"
                 ])
                 st.sidebar.header("Filtros")
+                # OPTIMIZATION: Temporada, Familia y canal se resuelven con el índice de bitmaps
+                # de ventas (AND de bitmaps en mostrar_dashboard) en lugar de filtrar copias
+                indice = build_ventas_index(df_ventas, huella)
+                filtros = {}
+
                 # --- Filtro de temporada ---
-                temporadas = df_ventas["Temporada"].dropna().unique().tolist()
-                temporadas.sort()
-                temporadas_opciones = ["Todas las temporadas"] + temporadas
+                temporadas_opciones = ["Todas las temporadas"] + valores_filtro(indice, "Temporada")
                 temporada_seleccionada = st.sidebar.selectbox("Temporada", temporadas_opciones)
                 if temporada_seleccionada != "Todas las temporadas":
-                    df_ventas = filter_by_season(df_ventas, temporada_seleccionada)
+                    filtros["Temporada"] = [temporada_seleccionada]
                 # --- Fin filtro de temporada ---
                 
                 # --- Filtro de familia ---
-                familias = df_ventas["Descripción Familia"].dropna().unique().tolist()
-                familias.sort()
-                familias_opciones = ["Todas las familias"] + familias
+                familias_opciones = ["Todas las familias"] + valores_filtro(indice, "Familia", filtros)
                 familia_seleccionada = st.sidebar.selectbox("Familia", familias_opciones)
                 if familia_seleccionada != "Todas las familias":
-                    df_ventas = filter_by_family(df_ventas, familia_seleccionada)
+                    filtros["Familia"] = [familia_seleccionada]
                 # --- Fin filtro de familia ---
 
+                # --- Filtro de canal ---
+                canales = {False: "Tiendas físicas", True: "Online"}
+                canales_opciones = ["Todos los canales"] + [
+                    canales[bool(es_online)] for es_online in valores_filtro(indice, "Es_Online", filtros)
+                ]
+                canal = st.sidebar.selectbox("Canal", canales_opciones)
+                if canal != "Todos los canales":
+                    filtros["Es_Online"] = [canal == "Online"]
+                # --- Fin filtro de canal ---
+
                 with st.spinner("Generando dashboard..."):
-                    mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion)
+                    mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion, huella, filtros)
 
             except Exception as e:
                 st.error(f"Error al procesar el archivo: {e}")
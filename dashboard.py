@@ -12,6 +12,14 @@ from datetime import datetime, timedelta
 import numpy as np
 from catboost import Pool
 import io
+import time
+from schema import SCHEMAS, rename_map, encode_sizes, align_categories
+from dataset import derive_fingerprint, frame_fingerprint
+from sales_cube import build_cube, merge_cubes, filter_cube, rollup, dense_grid
+from rotation import rotation_pairs, rotation_days, rotation_stats_sql, shipment_timeline
+from query_engine import duckdb_enabled
+from seasons import tema_comparison, classify_season
+from incremental import load_base, save_base, new_rows, row_hashes, same_rows
 
 # Optional spacy import for description analysis
 try:
@@ -57,29 +65,6 @@ TIENDAS_EXTRANJERAS = [
 COL_ONLINE = '#2ca02c'   # verde fuerte
 COL_OTRAS = '#ff7f0e'    # naranja
 
-def custom_sort_key(talla):
-    """
-    Clave de ordenación personalizada para tallas.
-    Prioriza: 1. Tallas numéricas, 2. Tallas de letra estándar, 3. Tallas únicas, 4. Resto.
-    """
-    talla_str = str(talla).upper().strip()
-    
-    # Prioridad 1: Tallas numéricas (e.g., '36', '38')
-    if talla_str.isdigit():
-        return (0, int(talla_str))
-    
-    # Prioridad 2: Tallas de letra estándar
-    size_order = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
-    if talla_str in size_order:
-        return (1, size_order.index(talla_str))
-        
-    # Prioridad 3: Tallas únicas
-    if talla_str in ['U', 'ÚNICA', 'UNICA', 'TU']:
-        return (2, talla_str)
-        
-    # Prioridad 4: Resto, ordenado alfabéticamente
-    return (3, talla_str)
-
 def setup_streamlit_styles():
     """Configurar estilos de Streamlit"""
     st.markdown("""
@@ -196,10 +181,124 @@ def titulo(text):
 def subtitulo(text):
     st.markdown(f"<h5 style='text-align:left;color:#666666;margin:0;padding:0;font-size:22px;font-weight:bold;'>{text}</h5>", unsafe_allow_html=True)
 
-def aplicar_filtros(df_ventas, df_traspasos):
-    if not pd.api.types.is_datetime64_any_dtype(df_ventas['Fecha venta']):
-        df_ventas['Fecha venta'] = pd.to_datetime(df_ventas['Fecha venta'], format='%d/%m/%Y', errors='coerce')
-    fecha_min, fecha_max = df_ventas['Fecha venta'].min(), df_ventas['Fecha venta'].max()
+# Columnas de ventas con un bitmap por valor en el índice de filtros
+COLUMNAS_BITMAP = ['Temporada', 'Familia', 'Tienda', 'Es_Online']
+
+@st.cache_resource(max_entries=16)
+def build_ventas_index(_df_ventas, huella):
+    """
+    Índice de filtros de ventas, construido una vez por subida.
+
+    df_ventas debe estar ordenado por 'Fecha venta' (build_analytic_model lo deja así),
+    de modo que el rango de fechas se resuelve con searchsorted. Para Temporada, Familia,
+    Tienda y Es_Online se guarda un bitmap empaquetado (1 bit por fila) por valor: una
+    combinación de filtros es un AND de bitmaps en lugar de varios filtros encadenados.
+
+    Returns:
+        Diccionario con 'n_filas', 'fechas' (datetime64 ordenado), 'codigos' y 'valores'
+        (factorize por columna) y 'bitmaps' ({columna: {valor: bitmap}})
+    """
+    n_filas = len(_df_ventas)
+    indice = {
+        'n_filas': n_filas,
+        'fechas': _df_ventas['Fecha venta'].to_numpy(),
+        'codigos': {},
+        'valores': {},
+        'bitmaps': {}
+    }
+    for columna in COLUMNAS_BITMAP:
+        if columna not in _df_ventas.columns:
+            continue
+        codigos, valores = pd.factorize(_df_ventas[columna])
+        orden = np.argsort(codigos, kind='stable')
+        limites = np.searchsorted(codigos[orden], np.arange(len(valores) + 1))
+        bitmaps = {}
+        for i, valor in enumerate(valores):
+            bits = np.zeros(n_filas, dtype=bool)
+            bits[orden[limites[i]:limites[i + 1]]] = True
+            bitmaps[valor] = np.packbits(bits)
+        indice['codigos'][columna] = codigos
+        indice['valores'][columna] = valores
+        indice['bitmaps'][columna] = bitmaps
+    return indice
+
+@st.cache_resource(max_entries=16)
+def build_sales_cube(_df_ventas, huella, _cubo=None):
+    """
+    Cubo de ventas preagregado (ver sales_cube.py), construido una vez por subida.
+
+    Se comparte entre sesiones como el índice de filtros: es de solo lectura, los
+    filtros y rollups siempre devuelven DataFrames nuevos. La carga incremental pasa
+    en _cubo el cubo ya actualizado (update_analytic_model) para que no se reconstruya.
+    """
+    if _cubo is not None:
+        return _cubo
+    return build_cube(_df_ventas)
+
+def seleccionar_bitmap(indice, filtros):
+    """
+    AND de los filtros {columna: [valores]} (OR dentro de cada columna).
+
+    Returns:
+        Bitmap empaquetado de las filas seleccionadas, o None si no hay filtros
+    """
+    seleccion = None
+    for columna, valores in filtros.items():
+        bitmaps = indice['bitmaps'][columna]
+        union = np.zeros((indice['n_filas'] + 7) // 8, dtype=np.uint8)
+        for valor in valores:
+            if valor in bitmaps:
+                np.bitwise_or(union, bitmaps[valor], out=union)
+        seleccion = union if seleccion is None else np.bitwise_and(seleccion, union, out=seleccion)
+    return seleccion
+
+def posiciones_bitmap(bitmap, inicio, fin):
+    """Posiciones de fila marcadas en el bitmap dentro del rango [inicio, fin)"""
+    primer_byte = inicio // 8
+    bits = np.unpackbits(bitmap[primer_byte:(fin + 7) // 8])
+    desplazamiento = primer_byte * 8
+    return np.flatnonzero(bits[inicio - desplazamiento:fin - desplazamiento]) + inicio
+
+def extremos_bitmap(bitmap):
+    """Primera y última fila marcadas en el bitmap, o None si está vacío"""
+    bytes_marcados = np.flatnonzero(bitmap)
+    if not len(bytes_marcados):
+        return None
+    primero, ultimo = bytes_marcados[0], bytes_marcados[-1]
+    return (primero * 8 + np.flatnonzero(np.unpackbits(bitmap[primero:primero + 1]))[0],
+            ultimo * 8 + np.flatnonzero(np.unpackbits(bitmap[ultimo:ultimo + 1]))[-1])
+
+def valores_filtro(indice, columna, filtros=None):
+    """Valores de una columna presentes en las filas que cumplen los filtros, ordenados"""
+    seleccion = seleccionar_bitmap(indice, filtros or {})
+    codigos = indice['codigos'][columna]
+    if seleccion is not None:
+        codigos = codigos[posiciones_bitmap(seleccion, 0, indice['n_filas'])]
+    presentes = np.flatnonzero(np.bincount(codigos[codigos >= 0], minlength=len(indice['valores'][columna])))
+    return sorted(indice['valores'][columna][presentes])
+
+def aplicar_filtros(df_ventas, df_traspasos, huella=None, filtros=None):
+    # Las fechas del modelo analítico ya son datetime y ventas está ordenado por fecha
+    if huella is None:
+        huella = frame_fingerprint(df_ventas)
+    filtros = filtros or {}
+    indice = build_ventas_index(df_ventas, huella)
+    cubo = build_sales_cube(df_ventas, huella)
+    fechas = indice['fechas']
+    
+    # OPTIMIZATION: Sidebar filters (Temporada, Familia, canal) resolve to one AND of bitmaps
+    base = seleccionar_bitmap(indice, filtros)
+    filas_base = None
+    if base is None:
+        limites_base = (0, len(fechas) - 1) if len(fechas) else None
+    else:
+        limites_base = extremos_bitmap(base)
+    if limites_base is None:
+        # Ninguna fila cumple los filtros: sin fechas no hay rango que elegir
+        if df_traspasos is not None:
+            return df_ventas.iloc[0:0], df_traspasos.iloc[0:0], False, [], huella, cubo.iloc[0:0]
+        return df_ventas.iloc[0:0], False, [], huella, cubo.iloc[0:0]
+    fecha_min, fecha_max = df_ventas['Fecha venta'].iloc[limites_base[0]], df_ventas['Fecha venta'].iloc[limites_base[1]]
 
     fecha_inicio, fecha_fin = st.sidebar.date_input(
         "Rango de fechas",
@@ -211,12 +310,20 @@ def aplicar_filtros(df_ventas, df_traspasos):
     if fecha_inicio > fecha_fin:
         st.sidebar.error("La fecha de inicio debe ser anterior a la fecha de fin.")
         if df_traspasos is not None:
-            return df_ventas.iloc[0:0], df_traspasos.iloc[0:0], False, []
-        return df_ventas.iloc[0:0], False, []
-
-    df_ventas_filtrado = df_ventas[(df_ventas['Fecha venta'] >= pd.to_datetime(fecha_inicio)) &
-                     (df_ventas['Fecha venta'] <= pd.to_datetime(fecha_fin))]
-    tiendas = sorted(df_ventas_filtrado['Tienda'].dropna().unique())
+            return df_ventas.iloc[0:0], df_traspasos.iloc[0:0], False, [], huella, cubo.iloc[0:0]
+        return df_ventas.iloc[0:0], False, [], huella, cubo.iloc[0:0]
+
+    # OPTIMIZATION: Binary search on the sorted dates instead of two full-column comparisons
+    inicio = np.searchsorted(fechas, pd.Timestamp(fecha_inicio).to_datetime64(), side='left')
+    fin = np.searchsorted(fechas, pd.Timestamp(fecha_fin).to_datetime64(), side='right')
+    if base is not None:
+        filas_base = posiciones_bitmap(base, inicio, fin)
+    
+    # Tiendas presentes en la selección, a partir de los códigos de tienda de esas filas
+    codigos_tienda = indice['codigos']['Tienda']
+    codigos_rango = codigos_tienda[inicio:fin] if filas_base is None else codigos_tienda[filas_base]
+    presentes = np.flatnonzero(np.bincount(codigos_rango[codigos_rango >= 0], minlength=len(indice['valores']['Tienda'])))
+    tiendas = sorted(indice['valores']['Tienda'][presentes])
     modo_tienda = st.sidebar.selectbox(
         "Modo selección tiendas",
         ["Todas las tiendas", "Seleccionar tiendas específicas"]
@@ -232,22 +339,39 @@ def aplicar_filtros(df_ventas, df_traspasos):
         if not tienda_seleccionada:
             st.sidebar.warning("Selecciona al menos una tienda para mostrar datos.")
             if df_traspasos is not None:
-                return df_ventas.iloc[0:0], df_traspasos.iloc[0:0], False, []
-            return df_ventas.iloc[0:0], False, []
+                return df_ventas.iloc[0:0], df_traspasos.iloc[0:0], False, [], huella, cubo.iloc[0:0]
+            return df_ventas.iloc[0:0], False, [], huella, cubo.iloc[0:0]
         tiendas_especificas = True
     
-    df_ventas_filtrado = df_ventas_filtrado[df_ventas_filtrado['Tienda'].isin(tienda_seleccionada)]
+    sin_tienda = len(codigos_rango) and codigos_rango.min() < 0
+    if filas_base is None and not tiendas_especificas and not sin_tienda:
+        # Sin filtros de dimensión: el rango de fechas es una vista sin copia
+        df_ventas_filtrado = df_ventas.iloc[inicio:fin]
+    elif not tiendas_especificas and not sin_tienda:
+        df_ventas_filtrado = df_ventas.iloc[filas_base]
+    else:
+        # OPTIMIZATION: AND the store bitmaps into the selection instead of an isin over all rows
+        seleccion = seleccionar_bitmap(indice, {'Tienda': tienda_seleccionada})
+        if base is not None:
+            np.bitwise_and(seleccion, base, out=seleccion)
+        df_ventas_filtrado = df_ventas.iloc[posiciones_bitmap(seleccion, inicio, fin)]
+    
+    # Los mismos filtros sobre las dimensiones del cubo de ventas
+    cubo_filtrado = filter_cube(cubo, filtros, fecha_inicio, fecha_fin, tienda_seleccionada)
+    
+    # Huella del subconjunto filtrado: origen + parámetros del filtro
+    huella_filtrada = derive_fingerprint(huella, sorted(filtros.items()), fecha_inicio, fecha_fin, tuple(tienda_seleccionada))
     
     # Aplicar filtro de tienda a traspasos si se proporciona
     if df_traspasos is not None:
-        df_traspasos_filtrado = df_traspasos.copy()
-        df_traspasos_filtrado['Fecha enviado'] = pd.to_datetime(df_traspasos_filtrado['Fecha enviado'], format='%d/%m/%Y', errors='coerce')
         # Asegurar que la columna Tienda existe en traspasos
-        if 'Tienda' in df_traspasos_filtrado.columns:
-            df_traspasos_filtrado = df_traspasos_filtrado[df_traspasos_filtrado['Tienda'].isin(tienda_seleccionada)]
-        return df_ventas_filtrado, df_traspasos_filtrado, tiendas_especificas, tienda_seleccionada
+        if 'Tienda' in df_traspasos.columns:
+            df_traspasos_filtrado = df_traspasos[df_traspasos['Tienda'].isin(tienda_seleccionada)]
+        else:
+            df_traspasos_filtrado = df_traspasos
+        return df_ventas_filtrado, df_traspasos_filtrado, tiendas_especificas, tienda_seleccionada, huella_filtrada, cubo_filtrado
     
-    return df_ventas_filtrado, tiendas_especificas, tienda_seleccionada
+    return df_ventas_filtrado, tiendas_especificas, tienda_seleccionada, huella_filtrada, cubo_filtrado
 
 
 
@@ -319,49 +443,103 @@ def viz_container(title, render_function):
     render_function()
     st.markdown('</div>', unsafe_allow_html=True)
 
-def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
+def mostrar_tema_almacen(tema, datos):
+    """
+    Pinta un tema de Entradas almacén: gráfico enviado vs ventas por talla y tabla
+    Mes Entrada x Talla.
+
+    Args:
+        tema: Tema_temporada, p.ej. 'T_OI25'
+        datos: Entrada del tema en el resultado de seasons.tema_comparison
+    """
+    st.subheader(f"Entrada Almacén - {tema}")
+
+    df_plotly = datos['comparacion']
+    if df_plotly is not None:
+        tallas = df_plotly['Talla'].drop_duplicates().tolist()
+        # Altura dinámica según el número de tallas: entre 400 y 800px
+        altura_dinamica = max(400, min(800, len(tallas) * 50))
+
+        fig = px.bar(
+            df_plotly,
+            x='Talla',
+            y='Cantidad',
+            color='Tipo',
+            text='Cantidad',
+            category_orders={'Talla': tallas},
+            color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
+            height=altura_dinamica
+        )
+
+        # Rango dinámico eje Y
+        max_cantidad = df_plotly['Cantidad'].max()
+        y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
+
+        fig.update_layout(
+            title=f"Enviado vs Ventas - {tema} ({datos['temporada']})",
+            xaxis_title="Talla",
+            yaxis_title="Cantidad",
+            barmode="group",
+            margin=dict(t=30, b=0, l=0, r=0),
+            paper_bgcolor="rgba(0,0,0,0)",
+            plot_bgcolor="rgba(0,0,0,0)",
+            yaxis=dict(
+                range=[0, y_max],
+                showgrid=True,
+                gridcolor='rgba(0,0,0,0.1)'
+            )
+        )
+        fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Tabla Mes Entrada x Talla con ceros donde no hubo entradas
+    tabla_pivot = datos['entradas']
+    if not tabla_pivot.empty:
+        st.dataframe(
+            tabla_pivot.style.format("{:,.0f}"),
+            use_container_width=True,
+            hide_index=False
+        )
+        total_temp = tabla_pivot.sum().sum()
+        st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
+    else:
+        st.info(f"No hay datos para el tema {tema}")
+
+def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion, huella=None, filtros=None):
     setup_streamlit_styles()
     
-    # Use cached preprocessing for better performance
-    df_ventas = preprocess_ventas_data(df_ventas)
-    df_productos = preprocess_productos_data(df_productos)
-    df_traspasos = preprocess_traspasos_data(df_traspasos)
+    # OPTIMIZATION: Key derived-data caches on the dataset fingerprint instead of hashing the frames
+    if huella is None:
+        huella = frame_fingerprint(df_productos, df_traspasos, df_ventas)
     
-    # Merge Precio Coste from df_productos into df_ventas using Código único
-    df_ventas = df_ventas.merge(
-        df_productos[['Código único', 'Precio Coste']],
-        on='Código único',
-        how='left',
-        suffixes=('', '_producto')
-    )
-    # Prefer Precio Coste from df_productos if available
-    if 'Precio Coste_producto' in df_ventas.columns:
-        df_ventas['Precio Coste'] = df_ventas['Precio Coste_producto'].combine_first(df_ventas['Precio Coste'])
-        df_ventas = df_ventas.drop(columns=['Precio Coste_producto'])
-
-   
-    # Calcular ranking completo de todas las tiendas ANTES de aplicar filtros
-    ventas_por_tienda_completo = calculate_store_rankings(df_ventas)
+    # Los DataFrames recibidos son el modelo analítico (build_analytic_model): ya vienen
+    # renombrados, con fechas, meses, Es_Online y Precio Coste, y no se modifican aquí
+    
+    # Calcular ranking completo de todas las tiendas ANTES de aplicar los filtros de fecha
+    # y tienda (sí con los de temporada, familia y canal)
+    filtros = filtros or {}
+    cubo_base = filter_cube(build_sales_cube(df_ventas, huella), filtros)
+    ventas_por_tienda_completo = calculate_store_rankings(cubo_base, derive_fingerprint(huella, sorted(filtros.items())))
     
-    # Aplicar filtros
-    df_ventas, df_traspasos_filtrado, tiendas_especificas, tienda_seleccionada = aplicar_filtros(df_ventas, df_traspasos)
+    # Aplicar filtros (a las filas de ventas y a las celdas del cubo)
+    df_ventas, df_traspasos_filtrado, tiendas_especificas, tienda_seleccionada, huella_filtrada, cubo = aplicar_filtros(df_ventas, df_traspasos, huella, filtros)
     if df_ventas.empty:
         st.warning("No hay datos para mostrar con los filtros seleccionados.")
         return
 
     if seccion == "Resumen General":
         try:
+            # OPTIMIZATION: KPIs y gráficos de resumen agregan las celdas del cubo, no las filas
             # Calcular KPIs
-            total_ventas_dinero = df_ventas['Beneficio'].sum()
-            total_familias = df_ventas['Familia'].nunique()
+            total_ventas_dinero = cubo['Beneficio'].sum()
+            total_familias = cubo['Familia'].nunique()
             
             # Calcular Total Devoluciones (monetary amount of negative quantities)
-            devoluciones = df_ventas[df_ventas['Cantidad'] < 0].copy()
-            total_devoluciones_dinero = abs(devoluciones['Beneficio'].sum())  # Use abs() to show positive value
+            total_devoluciones_dinero = abs(cubo['Beneficio devoluciones'].sum())  # Use abs() to show positive value
             
             # Separar tiendas físicas y online
-            ventas_fisicas = df_ventas[~df_ventas['Es_Online']]
-            ventas_online = df_ventas[df_ventas['Es_Online']]
+            ventas_fisicas = cubo[~cubo['Es_Online']]
+            ventas_online = cubo[cubo['Es_Online']]
             
             # Calcular KPIs por tipo de tienda
             ventas_fisicas_dinero = ventas_fisicas['Beneficio'].sum()
@@ -430,7 +608,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 tienda_mayor_rotacion, tienda_mayor_rotacion_dias, tienda_menor_rotacion, tienda_menor_rotacion_dias,
                 producto_mayor_rotacion, producto_mayor_rotacion_dias, producto_menor_rotacion, producto_menor_rotacion_dias,
                 promedio_global, mediana_global, std_global, total_productos_rotacion
-            ) = calculate_rotation_metrics(df_productos, df_traspasos, df_ventas)
+            ) = calculate_rotation_metrics(df_productos, df_traspasos, df_ventas, huella_filtrada)
 
             if tienda_mayor_rotacion is not None:
                 # Mostrar KPIs de rotación optimizados
@@ -500,10 +678,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             with col1b:
                 viz_title("Ventas Mensuales por Tipo de Tienda")
-                ventas_mes_tipo = df_ventas.groupby(['Mes', 'Es_Online']).agg({
-                    'Cantidad': 'sum',
-                    'Beneficio': 'sum'
-                }).reset_index()
+                ventas_mes_tipo = rollup(cubo, ['Mes', 'Es_Online'])
                 
                 ventas_mes_tipo['Tipo'] = ventas_mes_tipo['Es_Online'].map({True: 'Online', False: 'Física'})
                 
@@ -555,10 +730,10 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 viz_title("Ranking de Tiendas Seleccionadas")
                 
                 # Filtrar solo las tiendas seleccionadas del ranking completo
-                tiendas_ranking = ventas_por_tienda_completo[ventas_por_tienda_completo['Tienda'].isin(tienda_seleccionada)].copy()
+                tiendas_ranking = ventas_por_tienda_completo[ventas_por_tienda_completo['Tienda'].isin(tienda_seleccionada)]
                 
                 # Calcular la familia más vendida para cada tienda (cached)
-                familias_por_tienda = calculate_family_rankings(df_ventas)
+                familias_por_tienda = calculate_family_rankings(cubo, huella_filtrada)
                 
                 # Obtener la familia top para cada tienda seleccionada
                 familias_top = []
@@ -613,7 +788,9 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                         customdata=top_30_tiendas['Unidades Vendidas'],
                         opacity=0.8
                     )
-                    st.plotly_chart(fig, use_container_width=True)
+                    # Con 30 tiendas o menos (p.ej. solo Online) ambos gráficos coinciden:
+                    # sin key propia Streamlit los trata como el mismo elemento
+                    st.plotly_chart(fig, use_container_width=True, key="top30_tiendas")
 
                 with col3:
                     # Top 30 tiendas con menos ventas por Beneficio
@@ -643,7 +820,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                         customdata=bottom_30_tiendas['Unidades Vendidas'],
                         opacity=0.8
                     )
-                    st.plotly_chart(fig, use_container_width=True)
+                    st.plotly_chart(fig, use_container_width=True, key="bottom30_tiendas")
 
             # Col 4: Unidades Vendidas por Talla (centered)
             col4a, col4b, col4c = st.columns([1, 2, 1])
@@ -655,73 +832,30 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 if df_ventas.empty:
                     st.warning("No hay datos de ventas para la familia seleccionada.")
                 else:
-                    # Normalizar las tallas para asegurar consistencia
-                    df_ventas_temp = df_ventas.copy()
-                    df_ventas_temp['Talla'] = df_ventas_temp['Talla'].astype(str).str.upper().str.strip()
-                    
-                    #  Verificar tallas por familia
-                    if not df_ventas_temp.empty:
-                        familia_actual = df_ventas_temp['Familia'].iloc[0] if 'Familia' in df_ventas_temp.columns else 'Sin Familia'
-                        tallas_por_familia = df_ventas_temp[df_ventas_temp['Familia'] == familia_actual]['Talla'].unique()
-                        
-                    
-                    # Agrupamos por Talla y Temporada
-                    tallas_sumadas = (
-                        df_ventas_temp.groupby(['Talla', 'Temporada'])['Cantidad']
-                        .sum()
-                        .reset_index()
-                    )
-                    
-                    tallas_en_agrupado = tallas_sumadas['Talla'].unique()
+                    # Las tallas ya vienen normalizadas y ordenadas del modelo (rollup Talla x Temporada)
+                    df_ventas_temp = rollup(cubo, ['Talla', 'Temporada'], ['Cantidad'])
+                    tallas_sumadas = df_ventas_temp
                    
                     # Verificar si hay datos válidos para el gráfico
                     if not tallas_sumadas.empty and len(tallas_sumadas) > 0:
-                        # Orden personalizado de tallas
                         tallas_presentes = df_ventas_temp['Talla'].dropna().unique()
                         
                         if len(tallas_presentes) > 0:
                             try:
-                                tallas_orden = sorted(tallas_presentes, key=custom_sort_key)
-                                
-        
-                                
-                                
                                 # Asegurar que todas las tallas aparezcan en el gráfico
-                                # Crear un DataFrame completo con todas las combinaciones talla-temporada
-                                temporadas_unicas = df_ventas_temp['Temporada'].unique()
-                                tallas_completas = []
-                                
-                                for talla in tallas_orden:
-                                    for temporada in temporadas_unicas:
-                                        # Buscar si existe esta combinación
-                                        existing_data = tallas_sumadas[
-                                            (tallas_sumadas['Talla'] == talla) & 
-                                            (tallas_sumadas['Temporada'] == temporada)
-                                        ]
-                                        
-                                        if not existing_data.empty:
-                                            tallas_completas.append({
-                                                'Talla': talla,
-                                                'Temporada': temporada,
-                                                'Cantidad': existing_data.iloc[0]['Cantidad']
-                                            })
-                                        else:
-                                            # Agregar con cantidad 0 si no existe
-                                            tallas_completas.append({
-                                                'Talla': talla,
-                                                'Temporada': temporada,
-                                                'Cantidad': 0
-                                            })
-                                
-                                # Crear DataFrame completo
-                                tallas_sumadas_completo = pd.DataFrame(tallas_completas)
+                                # OPTIMIZATION: Matriz completa talla-temporada en una sola agregación (dense_grid)
+                                tallas_sumadas_completo = (
+                                    dense_grid(tallas_sumadas, 'Talla', 'Temporada', 'Cantidad')
+                                    .stack()
+                                    .reset_index(name='Cantidad')
+                                )
                                 
                                 # Verificar tallas en DataFrame completo
                                 tallas_en_completo = tallas_sumadas_completo['Talla'].unique()
                                 
                                 
                                 # Verificar cantidades por talla
-                                cantidades_por_talla = tallas_sumadas_completo.groupby('Talla')['Cantidad'].sum()
+                                cantidades_por_talla = tallas_sumadas_completo.groupby('Talla', observed=True)['Cantidad'].sum()
                                 
                                 # Gráfico de barras apiladas por Temporada
                                 temporada_colors = get_temporada_colors(df_ventas_temp)
@@ -730,8 +864,8 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                                 num_tallas = len(tallas_en_completo)  # Usar tallas del DataFrame completo
                                 altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
                                 
-                                # Ordenar tallas del DataFrame completo usando custom_sort_key
-                                tallas_orden_completo = sorted(tallas_en_completo, key=custom_sort_key)
+                                # Las tallas del DataFrame completo ya están en el orden de la categoría
+                                tallas_orden_completo = list(tallas_en_completo)
                                 
                                 
                                 # Forzar todas las tallas a string para evitar problemas de categorías mixtas
@@ -841,8 +975,8 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             # Col 5,6: Tablas por Temporada con layout dinámico
             # Preparar datos de entrada en almacén para las tablas por temporada
             # Agregar Familia a df_productos usando Código único codes de df_ventas
-            df_productos_temp = df_productos.copy()
-            df_productos_temp['Fecha almacén'] = pd.to_datetime(df_productos_temp['Fecha almacén'], format='%d/%m/%Y', errors='coerce')
+            # OPTIMIZATION: Copy-on-Write, the merge / column assignment never touch df_productos
+            df_productos_temp = df_productos
 
             # OPTIMIZACIÓN: Merge más eficiente con validación previa
             if 'Código único' in df_ventas.columns and 'Familia' in df_ventas.columns:
@@ -863,21 +997,12 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             # OPTIMIZACIÓN: Filtrar por familia una sola vez
             # Obtener la familia más común en los datos filtrados
-            familia_actual = df_ventas['Familia'].mode().iloc[0] if not df_ventas.empty else 'Sin Familia'
-            df_almacen_fam = df_productos_temp[df_productos_temp['Familia'] == familia_actual].copy()
-            
+            familia_actual = rollup(cubo, 'Familia', ['Filas']).set_index('Familia')['Filas'].idxmax() if not df_ventas.empty else 'Sin Familia'
             
             # Filtrar por la familia actual
             df_almacen_fam = df_productos_temp[
                 df_productos_temp['Familia'] == familia_actual
-            ].copy()
-            
-           
-            
-            # Identificar productos sin familia asignada
-            df_sin_familia = df_productos_temp[
-                df_productos_temp['Familia'].isna()
-            ].copy()
+            ]
             
             # Inicializar df_pendientes como DataFrame vacío
             df_pendientes = pd.DataFrame()
@@ -889,16 +1014,15 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
  
                 # Separar filas con fecha válida y sin fecha
                 df_almacen_fam_con_fecha = df_almacen_fam.dropna(subset=['Fecha almacén'])
-                df_almacen_fam_sin_fecha = df_almacen_fam[df_almacen_fam['Fecha almacén'].isna()].copy()
+                df_almacen_fam_sin_fecha = df_almacen_fam[df_almacen_fam['Fecha almacén'].isna()]
                 
                 # Agregar mes de entrada para filas con fecha válida
-                df_almacen_fam_con_fecha['Mes Entrada'] = df_almacen_fam_con_fecha['Fecha almacén'].dt.to_period('M').astype(str)
+                df_almacen_fam_con_fecha['Mes Entrada'] = df_almacen_fam_con_fecha['Mes']
                 
                 # Separar filas pendientes de entrega (sin fecha válida)
                 if not df_almacen_fam_sin_fecha.empty:
                     # Crear DataFrame separado para pendientes de entrega
-                    df_pendientes = df_almacen_fam_sin_fecha.copy()
-                    df_pendientes['Estado'] = 'Pendiente de entrega'
+                    df_pendientes = df_almacen_fam_sin_fecha.assign(Estado='Pendiente de entrega')
                 else:
                     df_pendientes = pd.DataFrame()
                 
@@ -906,14 +1030,14 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 df_almacen_fam = df_almacen_fam_con_fecha
                 
                 # Obtener el último mes de df_ventas para filtrar los datos
-                ultimo_mes_ventas = df_ventas['Mes'].max()
+                ultimo_mes_ventas = cubo['Mes'].max()
                 
                 # Preparar datos para la tabla por Temporada
                 # Buscar la columna correcta para cantidad de entrada en almacén
             
                 
                 datos_tabla = (
-                    df_almacen_fam.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
+                    df_almacen_fam.groupby(['Mes Entrada', 'Talla'], observed=True)['Cantidad pedida']
                     .sum()
                     .reset_index()
                     .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
@@ -940,613 +1064,55 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                         
                         # Si se han seleccionado tiendas específicas, mostrar tabla de análisis temporal
                         
-                        if tiendas_especificas:
-                            st.subheader("Análisis Temporal: Entrada Almacén → Envío → Primera Venta")
-                            # Preparar datos para el análisis temporal
-                            df_almacen_fam_timeline = df_almacen_fam.copy()
-                            df_traspasos_timeline = df_traspasos_filtrado.copy()
-                            df_traspasos_timeline['Fecha enviado'] = pd.to_datetime(df_traspasos_timeline['Fecha enviado'], errors='coerce')
-                            df_ventas_timeline = df_ventas.copy()
-                            df_ventas_timeline['Fecha venta'] = pd.to_datetime(df_ventas_timeline['Fecha venta'], errors='coerce')
-
-                            # 1. Solo el primer envío por tienda
-                            df_traspasos_timeline = (
-                                df_traspasos_timeline
-                                .sort_values('Fecha enviado')
-                                .drop_duplicates(subset=['Código único', 'Talla', 'Tienda'], keep='first')
-                            )
-
-                            # 2. Merge con almacén
-                            merged = pd.merge(
-                                df_almacen_fam_timeline,
-                                df_traspasos_timeline,
-                                left_on=['Código único', 'Talla'],
-                                right_on=['Código único', 'Talla'],
-                                suffixes=('_almacen', '_traspaso')
+                        # OPTIMIZATION: Grouped as-of join for every store at once (rotation.shipment_timeline)
+                        # instead of re-filtering ventas for each shipment row
+                        st.subheader("Análisis Temporal: Entrada Almacén → Envío → Primera Venta")
+                        df_timeline = shipment_timeline(df_almacen_fam, df_traspasos_filtrado, df_ventas)
+
+                        if not df_timeline.empty:
+                            st.dataframe(
+                                df_timeline,
+                                use_container_width=True,
+                                hide_index=True
                             )
-                            merged = merged[merged['Fecha enviado'] >= merged['Fecha almacén']]
-
-                            timeline_data = []
-                            for _, row in merged.iterrows():
-                                fecha_entrada = row['Fecha almacén']
-                                fecha_envio = row['Fecha enviado']
-                                codigo_unico = row['Código único'].strip()
-                                talla = row['Talla'].strip()
-                                tienda_envio = row['Tienda']
-                                tema = row['Tema']
-
-                                # 3. Solo la primera venta en esa tienda para ese producto/talla
-                                ventas_producto = df_ventas_timeline[
-                                    (df_ventas_timeline['Código único'].str.strip() == codigo_unico) &
-                                    (df_ventas_timeline['Talla'].str.strip() == talla) &
-                                    (df_ventas_timeline['Tienda'].str.strip() == tienda_envio.strip()) &
-                                    (df_ventas_timeline['Fecha venta'] >= fecha_entrada) &
-                                    (df_ventas_timeline['Cantidad'] > 0)
-                                ]
-                                if not ventas_producto.empty:
-                                    primera_venta = ventas_producto.sort_values('Fecha venta').iloc[0]
-                                    fecha_primera_venta = primera_venta['Fecha venta']
-                                    dias_entrada_venta = (fecha_primera_venta - fecha_envio).days
-                                else:
-                                    fecha_primera_venta = None
-                                    dias_entrada_venta = -1
-                                dias_entrada_envio = (fecha_envio - fecha_entrada).days
-                                timeline_data.append({
-                                    'Código único': codigo_unico,
-                                    'Tema': tema,
-                                    'Talla': talla,
-                                    'Tienda Envío': tienda_envio,
-                                    'Fecha Entrada Almacén': fecha_entrada.strftime('%d/%m/%Y'),
-                                    'Fecha enviado a tienda': fecha_envio.strftime('%d/%m/%Y'),
-                                    'Fecha Primera Venta': fecha_primera_venta.strftime('%d/%m/%Y') if fecha_primera_venta else "Sin ventas",
-                                    'Días Entrada-Envío': dias_entrada_envio,
-                                    'Días Envío-Primera Venta': dias_entrada_venta if dias_entrada_venta != -1 else -1
-                                })
-
-                            if timeline_data:
-                                df_timeline = pd.DataFrame(timeline_data)
-                                df_timeline['Fecha Entrada Almacén'] = pd.to_datetime(df_timeline['Fecha Entrada Almacén'], format='%d/%m/%Y')
-                                df_timeline = df_timeline.sort_values('Fecha Entrada Almacén', ascending=False)
-                                df_timeline['Fecha Entrada Almacén'] = df_timeline['Fecha Entrada Almacén'].dt.strftime('%d/%m/%Y')
-                                st.dataframe(
-                                    df_timeline,
-                                    use_container_width=True,
-                                    hide_index=True
-                                )
-                                col1, col2, col3 = st.columns(3)
-                                with col1:
-                                    avg_dias_envio = pd.to_numeric(df_timeline['Días Entrada-Envío'], errors='coerce').mean()
-                                    st.metric("Promedio días Entrada→Envío", f"{avg_dias_envio:.1f} días")
-                                with col2:
-                                    avg_dias_venta = pd.to_numeric(df_timeline['Días Envío-Primera Venta'].replace('Sin ventas', pd.NA), errors='coerce').mean()
-                                    st.metric("Promedio días Envío→Primera Venta", f"{avg_dias_venta:.1f} días" if not pd.isna(avg_dias_venta) else "N/A")
-                                with col3:
-                                    total_productos = len(df_timeline)
-                                    st.metric("Total productos analizados", f"{total_productos}")
-                            else:
-                                st.info("No se encontraron datos de envíos para los productos de entrada en almacén de la familia seleccionada.")
-                        
+                            col1, col2, col3 = st.columns(3)
+                            with col1:
+                                avg_dias_envio = pd.to_numeric(df_timeline['Días Entrada-Envío'], errors='coerce').mean()
+                                st.metric("Promedio días Entrada→Envío", f"{avg_dias_envio:.1f} días")
+                            with col2:
+                                avg_dias_venta = pd.to_numeric(df_timeline['Días Envío-Primera Venta'].replace('Sin ventas', pd.NA), errors='coerce').mean()
+                                st.metric("Promedio días Envío→Primera Venta", f"{avg_dias_venta:.1f} días" if not pd.isna(avg_dias_venta) else "N/A")
+                            with col3:
+                                total_productos = len(df_timeline)
+                                st.metric("Total productos analizados", f"{total_productos}")
                         else:
+                            st.info("No se encontraron datos de envíos para los productos de entrada en almacén de la familia seleccionada.")
+                        
+                        if not tiendas_especificas:
+                            # OPTIMIZATION: Enviado vs ventas por talla de todos los temas en una pasada
+                            # agrupada (seasons.tema_comparison), cacheada por familia; aquí solo se pinta
+                            comparacion_temas = calculate_tema_comparison(
+                                df_almacen_fam, df_ventas, derive_fingerprint(huella_filtrada, familia_actual)
+                            )
                             if num_temas == 1:
                                 # Un tema: centrado
                                 col5a, col5b, col5c = st.columns([1, 2, 1])
                                 with col5b:
-                                    tema = temas[0]
-                                    st.subheader(f"Entrada Almacén - {tema}")
-                                    
-                                    # Crear gráfico de comparación enviado vs ventas
-                                    if tema == 'T_OI25':
-                                        temporada_comparacion = 'I2025'
-                                    elif tema == 'T_PV25':
-                                        temporada_comparacion = 'V2025'
-                                    elif tema == 'T_PV23':
-                                        temporada_comparacion = 'V2023'
-                                    elif tema == 'T_PV24':
-                                        temporada_comparacion = 'V2024'
-                                    elif tema == 'T_OI24':
-                                        temporada_comparacion = 'I2024'
-                                    elif tema == 'T_OI23':
-                                        temporada_comparacion = 'I2023'
-                                    else:
-                                        temporada_comparacion = None
-                                    
-                                    if temporada_comparacion:
-                                        ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                        if not ventas_temporada.empty:
-                                            Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                            ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                            if not ventas_tema.empty:
-                                                ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                datos_comparacion = pd.merge(
-                                                    enviado_por_talla, 
-                                                    ventas_por_talla, 
-                                                    on='Talla', 
-                                                    how='outer'
-                                                ).fillna(0)
-                                                # Ordenar tallas
-                                                datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                
-                                                # Crear gráfico con plotly usando el mismo layout que "Unidades Vendidas por Talla"
-                                                # Calcular altura dinámica basada en la cantidad de tallas
-                                                num_tallas = len(datos_comparacion)
-                                                altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                
-                                                # Preparar datos para plotly
-                                                datos_plotly = []
-                                                for _, row in datos_comparacion.iterrows():
-                                                    datos_plotly.append({
-                                                        'Talla': row['Talla'],
-                                                        'Tipo': 'Enviado Almacén',
-                                                        'Cantidad': row['Cantidad pedida']
-                                                    })
-                                                    datos_plotly.append({
-                                                        'Talla': row['Talla'],
-                                                        'Tipo': 'Ventas',
-                                                        'Cantidad': row['Cantidad']
-                                                    })
-                                                
-                                                df_plotly = pd.DataFrame(datos_plotly)
-                                                
-                                                fig = px.bar(
-                                                    df_plotly,
-                                                    x='Talla',
-                                                    y='Cantidad',
-                                                    color='Tipo',
-                                                    text='Cantidad',
-                                                    category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                    color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                    height=altura_dinamica
-                                                )
-                                                
-                                                # Calcular rango dinámico para el eje Y
-                                                max_cantidad = df_plotly['Cantidad'].max()
-                                                min_cantidad = df_plotly['Cantidad'].min()
-                                                
-                                                # Ajustar el rango del eje Y para que se vea bien
-                                                if max_cantidad > 0:
-                                                    # Agregar un 10% de margen arriba
-                                                    y_max = max_cantidad * 1.1
-                                                    # Para el mínimo, usar 0 o un valor pequeño
-                                                    y_min = 0
-                                                else:
-                                                    y_max = 100
-                                                    y_min = 0
-                                                
-                                                fig.update_layout(
-                                                    title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                    xaxis_title="Talla",
-                                                    yaxis_title="Cantidad",
-                                                    barmode="group",
-                                                    margin=dict(t=30, b=0, l=0, r=0),
-                                                    paper_bgcolor="rgba(0,0,0,0)",
-                                                    plot_bgcolor="rgba(0,0,0,0)",
-                                                    yaxis=dict(
-                                                        range=[y_min, y_max],
-                                                        showgrid=True,
-                                                        gridcolor='rgba(0,0,0,0.1)'
-                                                    )
-                                                )
-                                                
-                                                fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                st.plotly_chart(fig, use_container_width=True)
-                                    
-                                    # Filtrar datos para este tema específico
-                                    datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                    datos_tabla_tema = (
-                                        datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                        .sum()
-                                        .reset_index()
-                                        .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                        .sort_values(['Mes Entrada', 'Talla'])
-                                    )
-                                    
-                                    if not datos_tabla_tema.empty:
-                                        # Crear tabla pivot para mejor visualización
-                                        tabla_pivot = datos_tabla_tema.pivot_table(
-                                            index='Mes Entrada',
-                                            columns='Talla',
-                                            values='Cantidad Entrada Almacén',
-                                            fill_value=0
-                                        ).round(0)
-                                        tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                        tabla_pivot = tabla_pivot[tallas_orden]
-                                        st.dataframe(
-                                            tabla_pivot.style.format("{:,.0f}"),
-                                            use_container_width=True,
-                                            hide_index=False
-                                        )
-                                        total_temp = tabla_pivot.sum().sum()
-                                        st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                    else:
-                                        st.info(f"No hay datos para el tema {tema}")
+                                    mostrar_tema_almacen(temas[0], comparacion_temas[temas[0]])
                             elif num_temas == 2:
                                 col5, col6 = st.columns(2)
-                                for i, tema in enumerate(temas):
-                                    with locals()[f'col{5+i}']:
-                                        st.subheader(f"Entrada Almacén - {tema}")
-                                        
-                                        # Crear gráfico de comparación enviado vs ventas
-                                        if tema == 'T_OI25':
-                                            temporada_comparacion = 'I2025'
-                                        elif tema == 'T_PV25':
-                                            temporada_comparacion = 'V2025'
-                                        elif tema == 'T_PV23':
-                                            temporada_comparacion = 'V2023'
-                                        elif tema == 'T_PV24':
-                                            temporada_comparacion = 'V2024'
-                                        elif tema == 'T_OI24':
-                                            temporada_comparacion = 'I2024'
-                                        elif tema == 'T_OI23':
-                                            temporada_comparacion = 'I2023'
-                                        else:
-                                            temporada_comparacion = None
-                                        
-                                        if temporada_comparacion:
-                                            ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                            if not ventas_temporada.empty:
-                                                Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                                ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                                if not ventas_tema.empty:
-                                                    ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                    enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                    enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                    datos_comparacion = pd.merge(
-                                                        enviado_por_talla, 
-                                                        ventas_por_talla, 
-                                                        on='Talla', 
-                                                        how='outer'
-                                                    ).fillna(0)
-                                                    # Ordenar tallas
-                                                    datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                    
-                                                    # Layout dinámico
-                                                    num_tallas = len(datos_comparacion)
-                                                    altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                    
-                                                    # Preparar datos para plotly
-                                                    datos_plotly = []
-                                                    for _, row in datos_comparacion.iterrows():
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Enviado Almacén',
-                                                            'Cantidad': row['Cantidad pedida']
-                                                        })
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Ventas',
-                                                            'Cantidad': row['Cantidad']
-                                                        })
-                                                    
-                                                    df_plotly = pd.DataFrame(datos_plotly)
-                                                    
-                                                    fig = px.bar(
-                                                        df_plotly,
-                                                        x='Talla',
-                                                        y='Cantidad',
-                                                        color='Tipo',
-                                                        text='Cantidad',
-                                                        category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                        color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                        height=altura_dinamica
-                                                    )
-                                                    
-                                                    # Rango dinámico eje Y
-                                                    max_cantidad = df_plotly['Cantidad'].max()
-                                                    y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
-                                                    
-                                                    fig.update_layout(
-                                                        title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                        xaxis_title="Talla",
-                                                        yaxis_title="Cantidad",
-                                                        barmode="group",
-                                                        margin=dict(t=30, b=0, l=0, r=0),
-                                                        paper_bgcolor="rgba(0,0,0,0)",
-                                                        plot_bgcolor="rgba(0,0,0,0)",
-                                                        yaxis=dict(
-                                                            range=[0, y_max],
-                                                            showgrid=True,
-                                                            gridcolor='rgba(0,0,0,0.1)'
-                                                        )
-                                                    )
-                                                    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                    st.plotly_chart(fig, use_container_width=True)
-                                        
-                                        # Filtrar datos para este tema específico
-                                        datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                        datos_tabla_tema = (
-                                            datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                            .sum()
-                                            .reset_index()
-                                            .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                            .sort_values(['Mes Entrada', 'Talla'])
-                                        )
-                                        
-                                        if not datos_tabla_tema.empty:
-                                            # Crear tabla pivot para mejor visualización
-                                            tabla_pivot = datos_tabla_tema.pivot_table(
-                                                index='Mes Entrada',
-                                                columns='Talla',
-                                                values='Cantidad Entrada Almacén',
-                                                fill_value=0
-                                            ).round(0)
-                                            tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                            tabla_pivot = tabla_pivot[tallas_orden]
-                                            st.dataframe(
-                                                tabla_pivot.style.format("{:,.0f}"),
-                                                use_container_width=True,
-                                                hide_index=False
-                                            )
-                                            total_temp = tabla_pivot.sum().sum()
-                                            st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                        else:
-                                            st.info(f"No hay datos para el tema {tema}")
+                                for columna, tema in zip((col5, col6), temas):
+                                    with columna:
+                                        mostrar_tema_almacen(tema, comparacion_temas[tema])
                             else:
                                 col5, col6 = st.columns(2)
                                 mitad = (num_temas + 1) // 2
-                                temas_col5 = temas[:mitad]
-                                temas_col6 = temas[mitad:]
                                 with col5:
-                                    for tema in temas_col5:
-                                        st.subheader(f"Entrada Almacén - {tema}")
-                                        
-                                        # Crear gráfico de comparación enviado vs ventas
-                                        if tema == 'T_OI25':
-                                            temporada_comparacion = 'I2025'
-                                        elif tema == 'T_PV25':
-                                            temporada_comparacion = 'V2025'
-                                        elif tema == 'T_PV23':
-                                            temporada_comparacion = 'V2023'
-                                        elif tema == 'T_PV24':
-                                            temporada_comparacion = 'V2024'
-                                        elif tema == 'T_OI24':
-                                            temporada_comparacion = 'I2024'
-                                        elif tema == 'T_OI23':
-                                            temporada_comparacion = 'I2023'
-                                        else:
-                                            temporada_comparacion = None
-                                        
-                                        if temporada_comparacion:
-                                            # Obtener datos de ventas para la temporada
-                                            ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                            if not ventas_temporada.empty:
-                                                # Obtener Código únicos del tema Código únicoual
-                                                Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                                
-                                                # Filtrar ventas por Código únicos del tema
-                                                ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                                
-                                                if not ventas_tema.empty:
-                                                    # Agrupar ventas por talla
-                                                    ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                    
-                                                    # Obtener datos de enviado del tema
-                                                    enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                    enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                    
-                                                    # Combinar datos
-                                                    datos_comparacion = pd.merge(
-                                                        enviado_por_talla, 
-                                                        ventas_por_talla, 
-                                                        on='Talla', 
-                                                        how='outer'
-                                                    ).fillna(0)
-                                                    
-                                                    # Ordenar tallas
-                                                    datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                    
-                                                    # Layout dinámico
-                                                    num_tallas = len(datos_comparacion)
-                                                    altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                    
-                                                    # Preparar datos para plotly
-                                                    datos_plotly = []
-                                                    for _, row in datos_comparacion.iterrows():
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Enviado Almacén',
-                                                            'Cantidad': row['Cantidad pedida']
-                                                        })
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Ventas',
-                                                            'Cantidad': row['Cantidad']
-                                                        })
-                                                    
-                                                    df_plotly = pd.DataFrame(datos_plotly)
-                                                    
-                                                    fig = px.bar(
-                                                        df_plotly,
-                                                        x='Talla',
-                                                        y='Cantidad',
-                                                        color='Tipo',
-                                                        text='Cantidad',
-                                                        category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                        color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                        height=altura_dinamica
-                                                    )
-                                                    
-                                                    # Rango dinámico eje Y
-                                                    max_cantidad = df_plotly['Cantidad'].max()
-                                                    y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
-                                                    
-                                                    fig.update_layout(
-                                                        title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                        xaxis_title="Talla",
-                                                        yaxis_title="Cantidad",
-                                                        barmode="group",
-                                                        margin=dict(t=30, b=0, l=0, r=0),
-                                                        paper_bgcolor="rgba(0,0,0,0)",
-                                                        plot_bgcolor="rgba(0,0,0,0)",
-                                                        yaxis=dict(
-                                                            range=[0, y_max],
-                                                            showgrid=True,
-                                                            gridcolor='rgba(0,0,0,0.1)'
-                                                        )
-                                                    )
-                                                    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                    st.plotly_chart(fig, use_container_width=True)
-                                        
-                                        # Filtrar datos para este tema específico
-                                        datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                        datos_tabla_tema = (
-                                            datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                            .sum()
-                                            .reset_index()
-                                            .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                            .sort_values(['Mes Entrada', 'Talla'])
-                                        )
-                                        
-                                        if not datos_tabla_tema.empty:
-                                            # Crear tabla pivot para mejor visualización
-                                            tabla_pivot = datos_tabla_tema.pivot_table(
-                                                index='Mes Entrada',
-                                                columns='Talla',
-                                                values='Cantidad Entrada Almacén',
-                                                fill_value=0
-                                            ).round(0)
-                                            tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                            tabla_pivot = tabla_pivot[tallas_orden]
-                                            st.dataframe(
-                                                tabla_pivot.style.format("{:,.0f}"),
-                                                use_container_width=True,
-                                                hide_index=False
-                                            )
-                                            total_temp = tabla_pivot.sum().sum()
-                                            st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                        else:
-                                            st.info(f"No hay datos para el tema {tema}")
+                                    for tema in temas[:mitad]:
+                                        mostrar_tema_almacen(tema, comparacion_temas[tema])
                                 with col6:
-                                    for tema in temas_col6:
-                                        st.subheader(f"Entrada Almacén - {tema}")
-                                        
-                                        # Crear gráfico de comparación enviado vs ventas
-                                        if tema == 'T_OI25':
-                                            temporada_comparacion = 'I2025'
-                                        elif tema == 'T_PV25':
-                                            temporada_comparacion = 'V2025'
-                                        elif tema == 'T_PV23':
-                                            temporada_comparacion = 'V2023'
-                                        elif tema == 'T_PV24':
-                                            temporada_comparacion = 'V2024'
-                                        elif tema == 'T_OI24':
-                                            temporada_comparacion = 'I2024'
-                                        elif tema == 'T_OI23':
-                                            temporada_comparacion = 'I2023'
-                                        else:
-                                            temporada_comparacion = None
-                                        
-                                        if temporada_comparacion:
-                                            # Obtener datos de ventas para la temporada
-                                            ventas_temporada = df_ventas[df_ventas['Temporada'] == temporada_comparacion]
-                                            if not ventas_temporada.empty:
-                                                # Obtener Código únicos del tema Código únicoual
-                                                Código_único_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]['Código único'].unique()
-                                                
-                                                # Filtrar ventas por Código únicos del tema
-                                                ventas_tema = ventas_temporada[ventas_temporada['Código único'].isin(Código_único_tema)]
-                                                
-                                                if not ventas_tema.empty:
-                                                    # Agrupar ventas por talla
-                                                    ventas_por_talla = ventas_tema.groupby('Talla')['Cantidad'].sum().reset_index()
-                                                    
-                                                    # Obtener datos de enviado del tema
-                                                    enviado_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                                    enviado_por_talla = enviado_tema.groupby('Talla')['Cantidad pedida'].sum().reset_index()
-                                                    
-                                                    # Combinar datos
-                                                    datos_comparacion = pd.merge(
-                                                        enviado_por_talla, 
-                                                        ventas_por_talla, 
-                                                        on='Talla', 
-                                                        how='outer'
-                                                    ).fillna(0)
-                                                    
-                                                    # Ordenar tallas
-                                                    datos_comparacion = datos_comparacion.sort_values('Talla', key=lambda x: x.map(custom_sort_key))
-                                                    
-                                                    # Layout dinámico
-                                                    num_tallas = len(datos_comparacion)
-                                                    altura_dinamica = max(400, min(800, num_tallas * 50))  # Entre 400 y 800px
-                                                    
-                                                    # Preparar datos para plotly
-                                                    datos_plotly = []
-                                                    for _, row in datos_comparacion.iterrows():
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Enviado Almacén',
-                                                            'Cantidad': row['Cantidad pedida']
-                                                        })
-                                                        datos_plotly.append({
-                                                            'Talla': row['Talla'],
-                                                            'Tipo': 'Ventas',
-                                                            'Cantidad': row['Cantidad']
-                                                        })
-                                                    
-                                                    df_plotly = pd.DataFrame(datos_plotly)
-                                                    
-                                                    fig = px.bar(
-                                                        df_plotly,
-                                                        x='Talla',
-                                                        y='Cantidad',
-                                                        color='Tipo',
-                                                        text='Cantidad',
-                                                        category_orders={'Talla': datos_comparacion['Talla'].tolist()},
-                                                        color_discrete_map={'Enviado Almacén': '#800080', 'Ventas': '#000080'},
-                                                        height=altura_dinamica
-                                                    )
-                                                    
-                                                    # Rango dinámico eje Y
-                                                    max_cantidad = df_plotly['Cantidad'].max()
-                                                    y_max = max_cantidad * 1.1 if max_cantidad > 0 else 100
-                                                    
-                                                    fig.update_layout(
-                                                        title=f'Enviado vs Ventas - {tema} ({temporada_comparacion})',
-                                                        xaxis_title="Talla",
-                                                        yaxis_title="Cantidad",
-                                                        barmode="group",
-                                                        margin=dict(t=30, b=0, l=0, r=0),
-                                                        paper_bgcolor="rgba(0,0,0,0)",
-                                                        plot_bgcolor="rgba(0,0,0,0)",
-                                                        yaxis=dict(
-                                                            range=[0, y_max],
-                                                            showgrid=True,
-                                                            gridcolor='rgba(0,0,0,0.1)'
-                                                        )
-                                                    )
-                                                    fig.update_traces(texttemplate='%{text:.0f}', textposition='inside', opacity=0.9)
-                                                    st.plotly_chart(fig, use_container_width=True)
-                                        
-                                        # Filtrar datos para este tema específico
-                                        datos_tema = df_almacen_fam[df_almacen_fam['Tema_temporada'] == tema]
-                                        datos_tabla_tema = (
-                                            datos_tema.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                                            .sum()
-                                            .reset_index()
-                                            .rename(columns={'Cantidad pedida': 'Cantidad Entrada Almacén'})
-                                            .sort_values(['Mes Entrada', 'Talla'])
-                                        )
-                                        
-                                        if not datos_tabla_tema.empty:
-                                            # Crear tabla pivot para mejor visualización
-                                            tabla_pivot = datos_tabla_tema.pivot_table(
-                                                index='Mes Entrada',
-                                                columns='Talla',
-                                                values='Cantidad Entrada Almacén',
-                                                fill_value=0
-                                            ).round(0)
-                                            tallas_orden = sorted(tabla_pivot.columns, key=custom_sort_key)
-                                            tabla_pivot = tabla_pivot[tallas_orden]
-                                            st.dataframe(
-                                                tabla_pivot.style.format("{:,.0f}"),
-                                                use_container_width=True,
-                                                hide_index=False
-                                            )
-                                            total_temp = tabla_pivot.sum().sum()
-                                            st.write(f"**Total Entrada Almacén:** {total_temp:,.0f}")
-                                        else:
-                                            st.info(f"No hay datos para el tema {tema}")
+                                    for tema in temas[mitad:]:
+                                        mostrar_tema_almacen(tema, comparacion_temas[tema])
                 else:
                     st.info("No hay datos de entrada en almacén disponibles para la familia seleccionada.")
 
@@ -1557,11 +1123,9 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 
                 # Preparar datos de pendientes por talla
                 datos_pendientes = (
-                    df_pendientes.groupby(['Talla'])['Cantidad pedida']
-                    .sum()
-                    .reset_index()
+                    dense_grid(df_pendientes, 'Talla', medida='Cantidad pedida')
                     .rename(columns={'Cantidad pedida': 'Cantidad Pendiente'})
-                    .sort_values('Talla', key=lambda x: x.map(custom_sort_key))
+                    .reset_index()
                 )
                 
                 if not datos_pendientes.empty:
@@ -1599,30 +1163,12 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 viz_title("Cantidad Pedida por Mes y Talla")
                 
                 if not df_almacen_fam.empty and 'Cantidad pedida' in df_almacen_fam.columns:
-                    # Preparar datos de cantidad pedida
-                    datos_pedida = (
-                        df_almacen_fam.groupby(['Mes Entrada', 'Talla'])['Cantidad pedida']
-                        .sum()
-                        .reset_index()
-                        .rename(columns={'Mes Entrada': 'Mes', 'Cantidad pedida': 'Cantidad pedida'})
-                        .sort_values(['Mes', 'Talla'])
-                    )
-                    
                     # Filtrar datos hasta el último mes de ventas
-                    datos_pedida = datos_pedida[datos_pedida['Mes'] <= ultimo_mes_ventas]
+                    datos_pedida = df_almacen_fam[df_almacen_fam['Mes Entrada'] <= ultimo_mes_ventas]
                     
                     if not datos_pedida.empty:
-                        # Crear tabla pivot para mejor visualización
-                        tabla_pedida_pivot = datos_pedida.pivot_table(
-                            index='Mes',
-                            columns='Talla',
-                            values='Cantidad pedida',
-                            fill_value=0
-                        ).round(0)
-                        
-                        # Ordenar tallas usando la función custom_sort_key
-                        tallas_orden = sorted(tabla_pedida_pivot.columns, key=custom_sort_key)
-                        tabla_pedida_pivot = tabla_pedida_pivot[tallas_orden]
+                        # Tabla Mes x Talla con ceros donde no hubo pedidos
+                        tabla_pedida_pivot = dense_grid(datos_pedida, 'Mes Entrada', 'Talla', 'Cantidad pedida').rename_axis('Mes')
                         
                         # Mostrar la tabla
                         st.dataframe(
@@ -1644,20 +1190,19 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             viz_title("Ventas vs Traspasos por Tienda")
             
             # Preparar datos de traspasos hasta la fecha máxima de ventas
-            ultimo_mes_ventas = df_ventas['Mes'].max()
-            df_traspasos_filtrado = df_traspasos_filtrado.copy()
+            ultimo_mes_ventas = cubo['Mes'].max()
             
-            # Convertir fecha de traspasos y filtrar hasta el último mes de ventas
-            df_traspasos_filtrado['Mes Enviado'] = pd.to_datetime(df_traspasos_filtrado['Fecha enviado']).dt.to_period('M').astype(str)
-            df_traspasos_filtrado = df_traspasos_filtrado[df_traspasos_filtrado['Mes Enviado'] <= ultimo_mes_ventas]
+            # Filtrar traspasos hasta el último mes de ventas (Mes es el mes de envío)
+            df_traspasos_filtrado = df_traspasos_filtrado[df_traspasos_filtrado['Mes'] <= ultimo_mes_ventas]
             
             # Agrupar ventas por tienda y temporada
-            ventas_por_tienda_temp = df_ventas.groupby(['Tienda', 'Temporada'])['Cantidad'].sum().reset_index()
+            ventas_por_tienda_temp = rollup(cubo, ['Tienda', 'Temporada'], ['Cantidad'])
             ventas_por_tienda_temp['Tipo'] = 'Ventas'
             ventas_por_tienda_temp = ventas_por_tienda_temp.rename(columns={'Cantidad': 'Cantidad Total'})
             
             # Obtener Código únicos que existen en ventas (limpiar espacios)
-            Código_único_en_ventas = df_ventas['Código único'].str.strip().unique()
+            # OPTIMIZATION: Strip the distinct codes, not every sales row
+            Código_único_en_ventas = df_ventas['Código único'].drop_duplicates().str.strip().unique()
             
             
             # Filtrar traspasos para solo incluir Código únicos que están en ventas
@@ -1678,7 +1223,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 # Limpiar temporada en traspasos para que coincida con ventas
                 df_traspasos_filtrado_código_único['Temporada'] = df_traspasos_filtrado_código_único['Temporada'].str.strip().str[:5]
                 
-                traspasos_por_tienda_temp = df_traspasos_filtrado_código_único.groupby(['Tienda', 'Temporada'])['Cantidad enviada'].sum().reset_index()
+                traspasos_por_tienda_temp = df_traspasos_filtrado_código_único.groupby(['Tienda', 'Temporada'], observed=True)['Cantidad enviada'].sum().reset_index()
                 traspasos_por_tienda_temp['Tipo'] = 'Traspasos'
                 traspasos_por_tienda_temp = traspasos_por_tienda_temp.rename(columns={'Cantidad enviada': 'Cantidad Total'})
             else:
@@ -1690,7 +1235,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             if not datos_comparacion.empty:
                 # Obtener top 30 tiendas por ventas totales
-                top_tiendas_ventas = df_ventas.groupby('Tienda')['Cantidad'].sum().nlargest(50).index.tolist()
+                top_tiendas_ventas = rollup(cubo, 'Tienda', ['Cantidad']).set_index('Tienda')['Cantidad'].nlargest(50).index.tolist()
                 
                 # Filtrar datos para top 30 tiendas
                 datos_top_tiendas = datos_comparacion[datos_comparacion['Tienda'].isin(top_tiendas_ventas)]
@@ -1698,11 +1243,11 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 if not datos_top_tiendas.empty:
                     # Crear gráfico con exCódigo únicoamente 2 barras por tienda (Ventas y Traspasos)
                     # Preparar datos para el nuevo formato
-                    ventas_data = datos_top_tiendas[datos_top_tiendas['Tipo'] == 'Ventas'].copy()
-                    traspasos_data = datos_top_tiendas[datos_top_tiendas['Tipo'] == 'Traspasos'].copy()
+                    ventas_data = datos_top_tiendas[datos_top_tiendas['Tipo'] == 'Ventas']
+                    traspasos_data = datos_top_tiendas[datos_top_tiendas['Tipo'] == 'Traspasos']
                     
                     # Obtener colores de temporada
-                    temporada_colors = get_temporada_colors(df_ventas)
+                    temporada_colors = get_temporada_colors(cubo)
                     
                     # Crear figura
                     fig = go.Figure()
@@ -1780,16 +1325,17 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     st.subheader("Resumen de Ventas vs Traspasos por Temporada")
                     
                     # Tabla con breakdown por temporada
-                    resumen_temporada = datos_top_tiendas.groupby(['Tienda', 'Tipo', 'Temporada'])['Cantidad Total'].sum().reset_index()
+                    resumen_temporada = datos_top_tiendas.groupby(['Tienda', 'Tipo', 'Temporada'], observed=True)['Cantidad Total'].sum().reset_index()
                     resumen_pivot_temp = resumen_temporada.pivot_table(
                         index=['Tienda', 'Temporada'], 
                         columns='Tipo', 
                         values='Cantidad Total', 
-                        fill_value=0
+                        fill_value=0,
+                        observed=True
                     ).reset_index()
                     
                     # Calcular totales por tienda
-                    resumen_totales = datos_top_tiendas.groupby(['Tienda', 'Tipo'])['Cantidad Total'].sum().reset_index()
+                    resumen_totales = datos_top_tiendas.groupby(['Tienda', 'Tipo'], observed=True)['Cantidad Total'].sum().reset_index()
                     resumen_pivot_totales = resumen_totales.pivot(index='Tienda', columns='Tipo', values='Cantidad Total').fillna(0)
                     resumen_pivot_totales['Diferencia'] = resumen_pivot_totales['Ventas'] - resumen_pivot_totales['Traspasos']
                     
@@ -1797,7 +1343,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     resumen_pivot_totales['Eficiencia %'] = (resumen_pivot_totales['Ventas'] / resumen_pivot_totales['Traspasos'] * 100).fillna(0)
 
                     # Calcular Devoluciones (cantidad negativa) por tienda
-                    devoluciones_por_tienda = df_ventas[df_ventas['Cantidad'] < 0].groupby('Tienda')['Cantidad'].sum().abs()
+                    devoluciones_por_tienda = rollup(cubo, 'Tienda', ['Devoluciones']).set_index('Tienda')['Devoluciones'].abs()
                     resumen_pivot_totales['Devoluciones'] = devoluciones_por_tienda.reindex(resumen_pivot_totales.index).fillna(0)
                     
                     # Calcular Ratio de devolución (Devoluciones / Ventas * 100)
@@ -1841,19 +1387,18 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
 
     elif seccion == "Geográfico y Tiendas":
         # Preparar datos
-        ventas_por_zona = df_ventas.groupby('Zona Geográfica')['Cantidad'].sum().reset_index()
-        ventas_por_tienda = df_ventas.groupby('Tienda')['Cantidad'].sum().reset_index()
-        tiendas_por_zona = df_ventas[['Tienda', 'Zona Geográfica']].drop_duplicates().groupby('Zona Geográfica').count().reset_index()
+        # OPTIMIZATION: Zonas, tiendas y mapas se agregan desde el rollup Tienda x Zona del cubo
+        ventas_zona_tienda = rollup(cubo, ['Tienda', 'Zona Geográfica'])
+        ventas_por_zona = rollup(ventas_zona_tienda, 'Zona Geográfica', ['Cantidad'])
+        ventas_por_tienda = rollup(ventas_zona_tienda, 'Tienda', ['Cantidad'])
+        tiendas_por_zona = ventas_zona_tienda[['Tienda', 'Zona Geográfica']].groupby('Zona Geográfica', observed=True).count().reset_index()
 
         # 1. KPIs: Mejor y peor tienda por zona
         viz_title("KPIs por Zona - Mejor y Peor Tienda")
         
         try:
             # Calcular ventas por tienda y zona
-            ventas_tienda_zona = df_ventas.groupby(['Zona Geográfica', 'Tienda']).agg({
-                'Cantidad': 'sum',
-                'Beneficio': 'sum'
-            }).reset_index()
+            ventas_tienda_zona = rollup(ventas_zona_tienda, ['Zona Geográfica', 'Tienda'])
             
             # Asegurar que las columnas numéricas son del tipo correcto
             ventas_tienda_zona['Cantidad'] = pd.to_numeric(ventas_tienda_zona['Cantidad'], errors='coerce').fillna(0)
@@ -1863,7 +1408,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             ventas_tienda_zona['Zona Geográfica'] = ventas_tienda_zona['Zona Geográfica'].astype(str)
             
             # Calcular media de ventas por zona
-            media_por_zona = ventas_tienda_zona.groupby('Zona Geográfica')['Cantidad'].mean().reset_index()
+            media_por_zona = ventas_tienda_zona.groupby('Zona Geográfica', observed=True)['Cantidad'].mean().reset_index()
             media_por_zona = media_por_zona.rename(columns={'Cantidad': 'Media_Zona'})
             
             # Unir con ventas por tienda
@@ -1882,7 +1427,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             peores_tiendas = []
             
             for zona in ventas_tienda_zona['Zona Geográfica'].unique():
-                zona_data = ventas_tienda_zona[ventas_tienda_zona['Zona Geográfica'] == zona].copy()
+                zona_data = ventas_tienda_zona[ventas_tienda_zona['Zona Geográfica'] == zona]
                 if not zona_data.empty and len(zona_data) > 0:
                     # Encontrar mejor tienda (máxima cantidad)
                     try:
@@ -1904,7 +1449,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             peores_tiendas = pd.DataFrame(peores_tiendas) if peores_tiendas else pd.DataFrame()
             
             # Mostrar KPIs en formato de tarjetas
-            zonas = sorted([str(z) for z in df_ventas['Zona Geográfica'].unique() if pd.notna(z)])
+            zonas = sorted([str(z) for z in cubo['Zona Geográfica'].unique() if pd.notna(z)])
             
             for zona in zonas:
                 mejor = mejores_tiendas[mejores_tiendas['Zona Geográfica'] == zona] if not mejores_tiendas.empty else pd.DataFrame()
@@ -1942,7 +1487,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             st.info("Mostrando información básica de zonas...")
             
             # Fallback: mostrar información básica
-            zonas_basicas = df_ventas.groupby('Zona Geográfica')['Cantidad'].sum().reset_index()
+            zonas_basicas = ventas_por_zona
             st.dataframe(zonas_basicas, use_container_width=True)
 
         # 2. Row: Ventas por zona y Tiendas por zona
@@ -1986,7 +1531,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
 
         # 3. Row: Evolución mensual por zona
         viz_title("Evolución Mensual por Zona")
-        zona_mes_evol = df_ventas.groupby(['Mes', 'Zona Geográfica'])['Cantidad'].sum().reset_index()
+        zona_mes_evol = rollup(cubo, ['Mes', 'Zona Geográfica'], ['Cantidad'])
         fig = px.line(zona_mes_evol, 
                      x='Mes', 
                      y='Cantidad',
@@ -2010,7 +1555,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             viz_title("Mapa de Ventas - España")
             
             # Separar datos por país
-            df_espana = df_ventas[~df_ventas['Tienda'].isin(TIENDAS_EXTRANJERAS)].copy()
+            df_espana = ventas_zona_tienda[~ventas_zona_tienda['Tienda'].isin(TIENDAS_EXTRANJERAS)]
             
             # Procesar datos de España usando Zona geográfica
             mapeo_zona_ciudad = {
@@ -2034,7 +1579,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             }
             
             # Asignar ciudad basada en zona geográfica
-            df_espana['Ciudad'] = df_espana['Zona Geográfica'].map(mapeo_zona_ciudad)
+            df_espana['Ciudad'] = df_espana['Zona Geográfica'].map(mapeo_zona_ciudad).astype(object)
             
             # Para tiendas sin zona geográfica, intentar extraer del nombre
             df_espana['Ciudad'] = df_espana['Ciudad'].fillna(
@@ -2082,7 +1627,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             df_espana = df_espana.dropna(subset=['lat', 'lon'])
 
             # Agrupar por ciudad incluyendo tanto cantidad como ventas en euros
-            ventas_ciudad_espana = df_espana.groupby(['Ciudad', 'lat', 'lon']).agg({
+            ventas_ciudad_espana = df_espana.groupby(['Ciudad', 'lat', 'lon'], observed=True).agg({
                 'Cantidad': 'sum',
                 'Beneficio': 'sum'
             }).reset_index()
@@ -2141,7 +1686,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             viz_title("Mapa de Ventas - Italia")
             
             # Separar datos por país
-            df_italia = df_ventas[df_ventas['Tienda'].isin(TIENDAS_EXTRANJERAS)].copy()
+            df_italia = ventas_zona_tienda[ventas_zona_tienda['Tienda'].isin(TIENDAS_EXTRANJERAS)]
             
             # Procesar datos de Italia
             df_italia['Ciudad'] = df_italia['Tienda'].str.extract(r'I\d{3}COIN([A-Z]+)', expand=False)
@@ -2171,7 +1716,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             df_italia = df_italia.dropna(subset=['lat', 'lon'])
 
             # Agrupar por ciudad incluyendo tanto cantidad como ventas en euros
-            ventas_ciudad_italia = df_italia.groupby(['Ciudad', 'lat', 'lon']).agg({
+            ventas_ciudad_italia = df_italia.groupby(['Ciudad', 'lat', 'lon'], observed=True).agg({
                 'Cantidad': 'sum',
                 'Beneficio': 'sum'
             }).reset_index()
@@ -2225,14 +1770,11 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
 
 
     elif seccion == "Producto, Campaña, Devoluciones y Rentabilidad":
-        devoluciones = df_ventas[df_ventas['Cantidad'] < 0].copy()
-        ventas = df_ventas[df_ventas['Cantidad'] > 0].copy()
-
-        # Calcular descuento real basado en la diferencia entre PVP y precio real de venta
-        if all(col in df_ventas.columns for col in ['PVP', 'Beneficio', 'Cantidad']):
-            df_ventas['Precio Real Unitario'] = df_ventas['Beneficio'] / df_ventas['Cantidad']
-            df_ventas['Descuento Real %'] = ((df_ventas['PVP'] - df_ventas['Precio Real Unitario']) / df_ventas['PVP'] * 100).fillna(0)
-            df_ventas['Descuento Real %'] = df_ventas['Descuento Real %'].clip(0, 100)  # Limitar entre 0 y 100%
+        # OPTIMIZATION: Returns and sales as narrow projections with only the columns the
+        # KPIs and charts below group by
+        columnas_devoluciones = [col for col in ['Tienda', 'Familia', 'Talla', 'Cantidad'] if col in df_ventas.columns]
+        devoluciones = df_ventas.loc[df_ventas['Cantidad'] < 0, columnas_devoluciones]
+        ventas = df_ventas.loc[df_ventas['Cantidad'] > 0, columnas_devoluciones]
 
         # ===== KPIs =====
         st.markdown("### 📊 **KPIs de Devoluciones, Rebajas y Margen**")
@@ -2242,12 +1784,12 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         tienda_mas_devoluciones = "Sin datos"
         ratio_devolucion_valor = 0
         if not devoluciones.empty:
-            devoluciones_por_tienda = devoluciones.groupby('Tienda').agg({'Cantidad': 'sum'}).reset_index()
+            devoluciones_por_tienda = devoluciones.groupby('Tienda', observed=True).agg({'Cantidad': 'sum'}).reset_index()
             devoluciones_por_tienda['Cantidad'] = abs(devoluciones_por_tienda['Cantidad'])
             devoluciones_por_tienda = devoluciones_por_tienda.sort_values('Cantidad', ascending=False)
             
             # Calcular ratio de devolución por tienda
-            ventas_por_tienda = ventas.groupby('Tienda')['Cantidad'].sum().reset_index()
+            ventas_por_tienda = ventas.groupby('Tienda', observed=True)['Cantidad'].sum().reset_index()
             ratio_devolucion = ventas_por_tienda.merge(devoluciones_por_tienda, on='Tienda', how='left')
             ratio_devolucion['Cantidad_y'] = ratio_devolucion['Cantidad_y'].fillna(0)
             ratio_devolucion['Ratio Devolución %'] = (ratio_devolucion['Cantidad_y'] / ratio_devolucion['Cantidad_x'] * 100).round(2)
@@ -2260,7 +1802,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         talla_mas_devuelta = "Sin datos"
         talla_devuelta_unidades = 0
         if not devoluciones.empty and 'Talla' in devoluciones.columns:
-            talla_mas_devuelta_data = devoluciones.groupby('Talla')['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
+            talla_mas_devuelta_data = devoluciones.groupby('Talla', observed=True)['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
             if not talla_mas_devuelta_data.empty:
                 talla_mas_devuelta = talla_mas_devuelta_data.index[0]
                 talla_devuelta_unidades = talla_mas_devuelta_data.iloc[0]
@@ -2272,76 +1814,58 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         if not devoluciones.empty:
             # Excluir 'GR.ART.FICTICIO' para el ranking principal
             devoluciones_sin_ficticio = devoluciones[devoluciones['Familia'] != 'GR.ART.FICTICIO']
-            familia_mas_devuelta_data = devoluciones_sin_ficticio.groupby('Familia')['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
+            familia_mas_devuelta_data = devoluciones_sin_ficticio.groupby('Familia', observed=True)['Cantidad'].sum().abs().sort_values(ascending=False).head(1)
             if not familia_mas_devuelta_data.empty:
                 familia_mas_devuelta = familia_mas_devuelta_data.index[0]
                 familia_devuelta_unidades = familia_mas_devuelta_data.iloc[0]
             # Calcular valor para 'GR.ART.FICTICIO' si existe
-            ficticio_data = devoluciones[devoluciones['Familia'] == 'GR.ART.FICTICIO'].groupby('Familia')['Cantidad'].sum().abs()
+            ficticio_data = devoluciones[devoluciones['Familia'] == 'GR.ART.FICTICIO'].groupby('Familia', observed=True)['Cantidad'].sum().abs()
             if not ficticio_data.empty:
                 familia_ficticio_unidades = ficticio_data.iloc[0]
         
-        # Rebajas 1ª (Enero y Junio)
+        # OPTIMIZATION: Month and positive-sales mask computed once for both sale periods,
+        # selecting only the rows and columns each one sums
         ventas_rebajas_1 = 0
         porcentaje_rebajas_1 = 0
-        if 'Fecha venta' in df_ventas.columns:
-            df_ventas_temp = df_ventas.copy()
-            df_ventas_temp['Fecha venta'] = pd.to_datetime(df_ventas_temp['Fecha venta'], errors='coerce')
-            df_ventas_temp['mes'] = df_ventas_temp['Fecha venta'].dt.month
-            df_ventas_temp = df_ventas_temp[df_ventas_temp['Beneficio'] > 0]
-            rebajas_1 = df_ventas_temp[df_ventas_temp['mes'].isin([1, 6])]
-            
-            if 'precio_pvp' in rebajas_1.columns:
-                rebajas_1['Precio_venta'] = rebajas_1['Beneficio'] / rebajas_1['Cantidad']
-                rebajas_1_real = rebajas_1[rebajas_1['Precio_venta'] < rebajas_1['precio_pvp']]
-                ventas_rebajas_1 = rebajas_1_real['Beneficio'].sum()
-            else:
-                ventas_rebajas_1 = rebajas_1['Beneficio'].sum()
-            
-            if df_ventas_temp['Beneficio'].sum() > 0:
-                porcentaje_rebajas_1 = (ventas_rebajas_1 / df_ventas_temp['Beneficio'].sum() * 100)
-        
-        # Rebajas 2ª (Febrero y Julio)
         ventas_rebajas_2 = 0
         porcentaje_rebajas_2 = 0
         if 'Fecha venta' in df_ventas.columns:
-            df_ventas_temp = df_ventas.copy()
-            df_ventas_temp['Fecha venta'] = pd.to_datetime(df_ventas_temp['Fecha venta'], errors='coerce')
-            df_ventas_temp['mes'] = df_ventas_temp['Fecha venta'].dt.month
-            df_ventas_temp = df_ventas_temp[df_ventas_temp['Beneficio'] > 0]
-            rebajas_2 = df_ventas_temp[df_ventas_temp['mes'].isin([2, 7])]
-            
-            if 'precio_pvp' in rebajas_2.columns:
-                rebajas_2['Precio_venta'] = rebajas_2['Beneficio'] / rebajas_2['Cantidad']
-                rebajas_2_real = rebajas_2[rebajas_2['Precio_venta'] < rebajas_2['precio_pvp']]
-                ventas_rebajas_2 = rebajas_2_real['Beneficio'].sum()
-            else:
-                ventas_rebajas_2 = rebajas_2['Beneficio'].sum()
-            
-            if df_ventas_temp['Beneficio'].sum() > 0:
-                porcentaje_rebajas_2 = (ventas_rebajas_2 / df_ventas_temp['Beneficio'].sum() * 100)
+            mes_venta = df_ventas['Fecha venta'].dt.month
+            con_beneficio = df_ventas['Beneficio'] > 0
+            beneficio_total = df_ventas.loc[con_beneficio, 'Beneficio'].sum()
+            
+            # Rebajas 1ª (Enero y Junio) y 2ª (Febrero y Julio)
+            importes_rebajas = []
+            for meses in ([1, 6], [2, 7]):
+                en_rebajas = con_beneficio & mes_venta.isin(meses)
+                if 'precio_pvp' in df_ventas.columns:
+                    en_rebajas &= df_ventas['Precio Real Unitario'] < df_ventas['precio_pvp']
+                importes_rebajas.append(df_ventas.loc[en_rebajas, 'Beneficio'].sum())
+            ventas_rebajas_1, ventas_rebajas_2 = importes_rebajas
+            
+            if beneficio_total > 0:
+                porcentaje_rebajas_1 = (ventas_rebajas_1 / beneficio_total * 100)
+                porcentaje_rebajas_2 = (ventas_rebajas_2 / beneficio_total * 100)
         
         # Margen bruto por unidad (promedio)
         
+        # OPTIMIZATION: Margin KPIs read the model's Margen Unitario column, no copies of ventas
         margen_unitario_promedio = 0
         margen_unitario_promedio_positivo = 0
-        if all(col in df_ventas.columns for col in ['PVP', 'Precio Coste']):
-            df_ventas_temp = df_ventas.copy()
-            df_ventas_temp['margen_unitario'] = df_ventas_temp['PVP'] - df_ventas_temp['Precio Coste']
-            margen_unitario_promedio = df_ventas_temp['margen_unitario'].mean()
-            margen_unitario_promedio_positivo = df_ventas_temp[df_ventas_temp['margen_unitario'] > 0]['margen_unitario'].mean()
+        if 'Margen Unitario' in df_ventas.columns:
+            margen_unitario = df_ventas['Margen Unitario']
+            margen_unitario_promedio = margen_unitario.mean()
+            margen_unitario_promedio_positivo = margen_unitario[margen_unitario > 0].mean()
         
         # Margen porcentual (promedio)
         margen_porcentual_promedio = 0
         margen_porcentual_promedio_positivo = 0
-        if all(col in df_ventas.columns for col in ['PVP', 'Precio Coste']):
-            df_ventas_temp = df_ventas.copy()
-            df_ventas_temp['margen_unitario'] = df_ventas_temp['PVP'] - df_ventas_temp['Precio Coste']
-            df_ventas_temp['margen_%'] = df_ventas_temp['margen_unitario'] / df_ventas_temp['PVP']
+        if 'Margen Unitario' in df_ventas.columns:
             # Ignorar productos con PVP = 0 para el promedio real
-            df_ventas_temp_validos = df_ventas_temp[df_ventas_temp['PVP'] != 0]
-            margen_porcentual_promedio = df_ventas_temp_validos['margen_%'].mean() * 100
-            margen_porcentual_promedio_positivo = df_ventas_temp_validos[df_ventas_temp_validos['margen_%'] > 0]['margen_%'].mean() * 100
+            pvp_valido = df_ventas['PVP'] != 0
+            margen_porcentual = df_ventas.loc[pvp_valido, 'Margen Unitario'] / df_ventas.loc[pvp_valido, 'PVP']
+            margen_porcentual_promedio = margen_porcentual.mean() * 100
+            margen_porcentual_promedio_positivo = margen_porcentual[margen_porcentual > 0].mean() * 100
         
         # KPIs in HTML style like Resumen General
         st.markdown("""
@@ -2422,13 +1946,14 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         ), unsafe_allow_html=True)
 
         # Tabla de depuración: productos con margen negativo
-        if all(col in df_ventas.columns for col in ['PVP', 'Precio Coste']):
-            df_ventas_temp = df_ventas.copy()
-            df_ventas_temp['margen_unitario'] = df_ventas_temp['PVP'] - df_ventas_temp['Precio Coste']
-            productos_margen_negativo = df_ventas_temp[df_ventas_temp['margen_unitario'] < 0]
+        if 'Margen Unitario' in df_ventas.columns:
+            productos_margen_negativo = df_ventas.loc[
+                df_ventas['Margen Unitario'] < 0,
+                ['Código único', 'Familia', 'Temporada', 'Fecha venta', 'PVP', 'Precio Coste', 'Margen Unitario']
+            ].rename(columns={'Margen Unitario': 'margen_unitario'})
             if not productos_margen_negativo.empty:
                 st.markdown('### Tabla de depuración: Productos con margen negativo (PVP < Precio Coste)')
-                st.dataframe(productos_margen_negativo[['Código único', 'Familia', 'Temporada', 'Fecha venta', 'PVP', 'Precio Coste', 'margen_unitario']], use_container_width=True, hide_index=True)
+                st.dataframe(productos_margen_negativo, use_container_width=True, hide_index=True)
 
         # ===== GRÁFICOS =====
         st.markdown("### **Análisis de Devoluciones y Temporadas**")
@@ -2438,10 +1963,10 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         
         if not devoluciones.empty:
             # Preparar datos para comparación
-            ventas_por_familia = ventas.groupby('Familia')['Cantidad'].sum().reset_index()
+            ventas_por_familia = ventas.groupby('Familia', observed=True)['Cantidad'].sum().reset_index()
             ventas_por_familia['Tipo'] = 'Ventas'
             
-            devoluciones_por_familia = devoluciones.groupby('Familia')['Cantidad'].sum().reset_index()
+            devoluciones_por_familia = devoluciones.groupby('Familia', observed=True)['Cantidad'].sum().reset_index()
             devoluciones_por_familia['Cantidad'] = abs(devoluciones_por_familia['Cantidad'])
             devoluciones_por_familia['Tipo'] = 'Devoluciones'
             
@@ -2479,8 +2004,8 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             with col_talla1:
                 # Talla más devuelta por familia
-                talla_mas_devuelta_familia = devoluciones.groupby(['Familia', 'Talla'])['Cantidad'].sum().abs().reset_index()
-                talla_mas_devuelta_familia = talla_mas_devuelta_familia.loc[talla_mas_devuelta_familia.groupby('Familia')['Cantidad'].idxmax()]
+                talla_mas_devuelta_familia = devoluciones.groupby(['Familia', 'Talla'], observed=True)['Cantidad'].sum().abs().reset_index()
+                talla_mas_devuelta_familia = talla_mas_devuelta_familia.loc[talla_mas_devuelta_familia.groupby('Familia', observed=True)['Cantidad'].idxmax()]
                 
                 fig = px.bar(
                     talla_mas_devuelta_familia,
@@ -2501,8 +2026,8 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             with col_talla2:
                 # Talla menos devuelta por familia
-                talla_menos_devuelta_familia = devoluciones.groupby(['Familia', 'Talla'])['Cantidad'].sum().abs().reset_index()
-                talla_menos_devuelta_familia = talla_menos_devuelta_familia.loc[talla_menos_devuelta_familia.groupby('Familia')['Cantidad'].idxmin()]
+                talla_menos_devuelta_familia = devoluciones.groupby(['Familia', 'Talla'], observed=True)['Cantidad'].sum().abs().reset_index()
+                talla_menos_devuelta_familia = talla_menos_devuelta_familia.loc[talla_menos_devuelta_familia.groupby('Familia', observed=True)['Cantidad'].idxmin()]
                 
                 fig = px.bar(
                     talla_menos_devuelta_familia,
@@ -2527,51 +2052,17 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         st.markdown("#### ** Análisis de Ventas por Temporada**")
         
         if 'Temporada' in df_ventas.columns:
-            # Función para determinar si un producto fue vendido fuera de su temporada
-            def vendido_fuera_temporada(row):
-                temporada = row['Temporada']
-                fecha = row['Fecha venta']
-
-                # Si la temporada no está bien definida, marcamos como fuera de temporada
-                if not isinstance(temporada, str) or len(temporada) < 5:
-                    return 1
-
-                tipo_temporada = temporada[0]   # 'I' o 'V'
-                ano_temporada_str = temporada[1:]
-
-                # Validar que ano_temporada_str es numérico y tipo_temporada es válido
-                if tipo_temporada not in ['I', 'V'] or not ano_temporada_str.isdigit():
-                    return 1
-
-                ano_temporada = int(ano_temporada_str)
-
-                if tipo_temporada == 'I':  # Invierno: sept (año-1) a feb (año)
-                    inicio = pd.Timestamp(year=ano_temporada - 1, month=9, day=1)
-                    fin = pd.Timestamp(year=ano_temporada, month=2, day=28)  # ignoramos bisiestos
-                    if inicio <= fecha <= fin:
-                        return 0  # Vendido dentro de su temporada (Invierno)
-                    else:
-                        return 1  # Vendido fuera de temporada
-
-                elif tipo_temporada == 'V':  # Verano: marzo a agosto año
-                    inicio = pd.Timestamp(year=ano_temporada, month=3, day=1)
-                    fin = pd.Timestamp(year=ano_temporada, month=8, day=31)
-                    if inicio <= fecha <= fin:
-                        return 0  # Vendido dentro de su temporada (Verano)
-                    else:
-                        return 1  # Vendido fuera de temporada
-                else:
-                    return 1  # Temporada no reconocida
-
-            # Aplicar la función al DataFrame
-            df_ventas_temp = df_ventas.copy()
-            df_ventas_temp['vendido_fuera_temporada'] = df_ventas_temp.apply(vendido_fuera_temporada, axis=1)
+            # OPTIMIZATION: 'Fuera de temporada' comes from the analytic model (seasons.classify_season,
+            # calendar windows joined once per upload) instead of a row-wise apply on every rerun
+            df_ventas_temp = df_ventas
+            if 'Fuera de temporada' not in df_ventas_temp.columns:
+                df_ventas_temp = df_ventas_temp.join(classify_season(df_ventas_temp))
             
             # Agrupar por temporada y tipo de venta
-            analisis_temporada = df_ventas_temp.groupby(['Temporada', 'vendido_fuera_temporada'])['Cantidad'].sum().reset_index()
-            analisis_temporada['Tipo_Venta'] = analisis_temporada['vendido_fuera_temporada'].map({
-                0: 'En Temporada',
-                1: 'Fuera de Temporada'
+            analisis_temporada = df_ventas_temp.groupby(['Temporada', 'Fuera de temporada'], observed=True)['Cantidad'].sum().reset_index()
+            analisis_temporada['Tipo_Venta'] = analisis_temporada['Fuera de temporada'].map({
+                False: 'En Temporada',
+                True: 'Fuera de Temporada'
             })
             
             # Crear gráfico
@@ -2601,7 +2092,8 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                 index='Temporada',
                 columns='Tipo_Venta',
                 values='Cantidad',
-                fill_value=0
+                fill_value=0,
+                observed=True
             ).reset_index()
             # Asegurar que ambas columnas existen
             for col in ['En Temporada', 'Fuera de Temporada']:
@@ -2649,23 +2141,23 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
             
             # Calcular márgenes usando Beneficio (Beneficio) como precio de venta
             # Excluir devoluciones (Cantidad < 0)
-            df_ventas_temp = df_ventas[df_ventas['Cantidad'] > 0].copy()
-            df_ventas_temp['Precio_venta'] = df_ventas_temp['Beneficio'] / df_ventas_temp['Cantidad']
-            df_ventas_temp['margen_unitario'] = df_ventas_temp['Precio_venta'] - df_ventas_temp[coste_col]
-            df_ventas_temp['margen_%'] = df_ventas_temp['margen_unitario'] / df_ventas_temp['Precio_venta']
+            # OPTIMIZATION: Narrow projection of the columns in the table, with the model's
+            # Precio Real Unitario as sale price
+            df_ventas_temp = df_ventas.loc[
+                df_ventas['Cantidad'] > 0,
+                ['Código único', 'Familia', 'Temporada', 'Fecha venta', 'Precio Real Unitario', coste_col]
+            ].rename(columns={'Precio Real Unitario': 'Precio_venta'})
+            df_ventas_temp['margen_%'] = (df_ventas_temp['Precio_venta'] - df_ventas_temp[coste_col]) / df_ventas_temp['Precio_venta']
             
             # Filtrar productos con margen bajo (incluyendo márgenes negativos)
-            productos_bajo_margen = df_ventas_temp[df_ventas_temp['margen_%'] < umbral_margen].copy()
+            productos_bajo_margen = df_ventas_temp[df_ventas_temp['margen_%'] < umbral_margen]
             
             if not productos_bajo_margen.empty:
                 # Preparar tabla con las columnas solicitadas
-                tabla_bajo_margen = productos_bajo_margen[[
-                    'Código único', 'Familia', 'Temporada', 'Fecha venta', 
-                    'Precio_venta', coste_col, 'margen_%'
-                ]].copy()
+                tabla_bajo_margen = productos_bajo_margen
                 
                 # Formatear columnas
-                tabla_bajo_margen['Fecha venta'] = pd.to_datetime(tabla_bajo_margen['Fecha venta']).dt.strftime('%d/%m/%Y')
+                tabla_bajo_margen['Fecha venta'] = tabla_bajo_margen['Fecha venta'].dt.strftime('%d/%m/%Y')
                 tabla_bajo_margen['Precio_venta'] = tabla_bajo_margen['Precio_venta'].round(2)
                 tabla_bajo_margen[coste_col] = tabla_bajo_margen[coste_col].round(2)
                 tabla_bajo_margen['margen_%'] = (tabla_bajo_margen['margen_%'] * 100).round(1)
@@ -2697,7 +2189,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                     # Calcular pérdida estimada de manera más robusta
                     try:
                         # Solo considerar productos con margen negativo o muy bajo
-                        productos_perdida = tabla_bajo_margen[tabla_bajo_margen['Margen %'] < 0].copy()
+                        productos_perdida = tabla_bajo_margen[tabla_bajo_margen['Margen %'] < 0]
                         if not productos_perdida.empty:
                             # Usar los nombres de columnas originales para el cálculo
                             coste_col_name = f'{coste_col} (€)'
@@ -2773,25 +2265,26 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
                             else:
                                 df_desc['Descripción Analizada'] = df_desc[tipo_descripcion].fillna('N/A')
                             
-                            df_desc_clean = df_desc[['Código único', 'Descripción Analizada']].copy().dropna()
+                            df_desc_clean = df_desc[['Código único', 'Descripción Analizada']].dropna()
 
                             # Antes del merge de descripciones:
                             if 'Código único' in df_ventas.columns and 'Código único' in df_desc_clean.columns:
-                                df_ventas['Codigo_merge'] = df_ventas['Código único'].astype(str).str[:13]
+                                # OPTIMIZATION: Merge only the columns the description ranking sums
+                                ventas_desc = df_ventas[['Código único', 'Familia', 'Beneficio', 'Cantidad']]
+                                ventas_desc['Codigo_merge'] = ventas_desc['Código único'].astype(str).str[:13]
                                 df_desc_clean['Código único'] = df_desc_clean['Código único'].astype(str).str.split().str[0]
-                                ventas_con_desc = df_ventas.merge(
+                                ventas_con_desc = ventas_desc.merge(
                                     df_desc_clean,
                                     left_on='Codigo_merge',
                                     right_on='Código único',
                                     how='left',
                                     suffixes=('', '_desc')
                                 )
-                                df_ventas.drop(columns=['Codigo_merge'], inplace=True)
                         
                             # FILTRO POR FAMILIA (usando el filtro global)
                             df_familia_desc = ventas_con_desc[ventas_con_desc['Familia'] == familia_actual]
                             
-                            desc_group = df_familia_desc.groupby('Descripción Analizada').agg({
+                            desc_group = df_familia_desc.groupby('Descripción Analizada', observed=True).agg({
                                 'Beneficio': 'sum',
                                 'Cantidad': 'sum'
                             }).reset_index()
@@ -2888,25 +2381,26 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         descripciones_path = "data/datos_descripciones.xlsx"
         if os.path.exists(descripciones_path):
             df_desc = pd.read_excel(descripciones_path)
-            # Ensure ACT is str and use first 13 chars for key
-            df_ventas["ACT_key"] = df_ventas["Código único"].astype(str).str[:13]
-            df_desc["ACT_key"] = df_desc["Código único"].astype(str)
-            # Merge material and percentage
-            df_ventas = pd.merge(df_ventas, df_desc[["ACT_key", "fashion_compo_material_1", "fashion_compo_percentage_1"]], on="ACT_key", how="left")
         else:
             st.error("No se encontró el archivo de descripciones.")
             return
-        # Only analyze positive sales
-        df_pos = df_ventas[df_ventas["Cantidad"] > 0].copy()
-        # Calculate PVP (Precio_venta) per row
-        df_pos["Precio_venta"] = df_pos["Beneficio"] / df_pos["Cantidad"]
+        # OPTIMIZATION: Only positive sales and the columns the summary uses go through the
+        # merge; the model already has the sale price (Precio Real Unitario)
+        df_pos = df_ventas.loc[
+            df_ventas["Cantidad"] > 0, ["Código único", "Familia", "Precio Real Unitario", "Precio Coste"]
+        ].rename(columns={"Precio Real Unitario": "Precio_venta"})
+        # Ensure ACT is str and use first 13 chars for key
+        df_pos["ACT_key"] = df_pos["Código único"].astype(str).str[:13]
+        df_desc["ACT_key"] = df_desc["Código único"].astype(str)
+        # Merge material and percentage
+        df_pos = pd.merge(df_pos, df_desc[["ACT_key", "fashion_compo_material_1", "fashion_compo_percentage_1"]], on="ACT_key", how="left")
         # Bin fashion_compo_percentage_1 into intervals (e.g., 0.80-0.85, 0.85-0.90, 0.90-0.95)
         bins = [0,60,65,70,75, 80, 85, 90, 95, 100]
         labels = ["0-60","60-65","65-70","70-75","75-85", "80-85", "85-90", "90-0.95", "95-100"]
         df_pos["compo_pct_interval"] = pd.cut(df_pos["fashion_compo_percentage_1"], bins=bins, labels=labels, include_lowest=True)
 
         # Group and aggregate
-        summary = df_pos.groupby(["Familia", "fashion_compo_material_1", "compo_pct_interval"]).agg(
+        summary = df_pos.groupby(["Familia", "fashion_compo_material_1", "compo_pct_interval"], observed=True).agg(
             max_PVP_sold=("Precio_venta", "max"),
             units_at_max_price=("Precio_venta", lambda x: (x == x.max()).sum()),
             min_PVP_sold=("Precio_venta", "min"),
@@ -2941,7 +2435,7 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
         familia_sel = st.selectbox("Filtrar por Familia", ["Todos"] + familias)
         material_sel = st.selectbox("Filtrar por Material", ["Todos"] + materiales)
         intervalo_sel = st.selectbox("Filtrar por % Intervalo", ["Todos"] + intervalos)
-        filtered = summary.copy()
+        filtered = summary
         if familia_sel != "Todos":
             filtered = filtered[filtered["Familia"] == familia_sel]
         if material_sel != "Todos":
@@ -2968,14 +2462,14 @@ def mostrar_dashboard(df_productos, df_traspasos, df_ventas, seccion):
 
 
         
+# Cached functions below receive the DataFrame as an _argument, which st.cache_data
+# does not hash, and are keyed on the dataset fingerprint (huella) instead
+
 # Cached function for calculating store rankings
 @st.cache_data
-def calculate_store_rankings(df_ventas):
-    """Cache the store ranking calculations"""
-    ventas_por_tienda = df_ventas.groupby('Tienda').agg({
-        'Cantidad': 'sum',
-        'Beneficio': 'sum'
-    }).reset_index()
+def calculate_store_rankings(_cubo, huella):
+    """Cache the store ranking calculations (from sales cube cells)"""
+    ventas_por_tienda = rollup(_cubo, 'Tienda')
     ventas_por_tienda.columns = ['Tienda', 'Unidades Vendidas', 'Beneficio']
     
     # Ordenar por Beneficio para obtener el ranking
@@ -2985,41 +2479,24 @@ def calculate_store_rankings(df_ventas):
 
 # Cached function for calculating family rankings per store
 @st.cache_data
-def calculate_family_rankings(df_ventas):
-    """Cache the family ranking calculations per store"""
-    familias_por_tienda = df_ventas.groupby(['Tienda', 'Familia'])['Cantidad'].sum().reset_index()
+def calculate_family_rankings(_cubo, huella):
+    """Cache the family ranking calculations per store (from sales cube cells)"""
+    familias_por_tienda = rollup(_cubo, ['Tienda', 'Familia'], ['Cantidad'])
     familias_por_tienda = familias_por_tienda.sort_values('Cantidad', ascending=False)
     return familias_por_tienda
 
+# Cached function for the warehouse entries vs season sales comparison per tema
 @st.cache_data
+def calculate_tema_comparison(_df_almacen_fam, _df_ventas, huella):
+    """Cache the shipped vs sold units per tema and size (keyed on filters + family)"""
+    return tema_comparison(_df_almacen_fam, _df_ventas)
+
 def preprocess_ventas_data(df_ventas):
-    """Cache the data preprocessing to avoid reprocessing on every interaction - OPTIMIZED VERSION"""
+    """Preprocess the ventas sheet for the analytic model - OPTIMIZED VERSION"""
     if df_ventas.empty:
         return df_ventas
     
-    df_ventas = df_ventas.copy()
-    column_map = {
-    "TPV": "Código Tienda",
-    "NombreTPV": "Tienda",
-    "Zona geográfica": "Zona Geográfica",
-    "Fecha Documento": "Fecha venta",
-    "Marca": "Código Marca",
-    "Descripción Marca": "Marca",
-    "Temporada": "Temporada",
-    "Genérico": "Genérico",
-    "ACT": "Código único",
-    "Artículo": "Artículo",
-    "Modelo Artículo": "Modelo Artículo",
-    "Color": "Código Color",
-    "Descripción Color": "Color",
-    "Talla": "Talla",
-    "Familia": "Código Familia",
-    "Descripción Familia": "Familia",
-    "Tema": "Tema",
-    "Cantidad": "Cantidad",
-    "P.V.P.": "PVP",
-    "Subtotal": "Beneficio"
-    }
+    column_map = rename_map("ventas")
 
     # OPTIMIZATION: Only rename columns that exist
     existing_columns = {k: v for k, v in column_map.items() if k in df_ventas.columns}
@@ -3027,14 +2504,9 @@ def preprocess_ventas_data(df_ventas):
     
     # OPTIMIZATION: Process date column more efficiently
     if 'Fecha venta' in df_ventas.columns:
-        df_ventas['Fecha venta'] = pd.to_datetime(df_ventas['Fecha venta'], format='%d/%m/%Y', errors='coerce')
+        # Dates are already parsed by the schema at load time
         df_ventas = df_ventas.dropna(subset=['Fecha venta'])
         df_ventas['Mes'] = df_ventas['Fecha venta'].dt.to_period('M').astype(str)
-
-    # OPTIMIZATION: Process code columns more efficiently
-    if 'Código único' in df_ventas.columns:
-        df_ventas['Código único'] = df_ventas['Código único'].astype(str).str.split().str[0]
-
     
     if 'Familia' in df_ventas.columns:
         df_ventas['Familia'] = df_ventas['Familia'].fillna("Sin Familia")
@@ -3067,36 +2539,12 @@ def preprocess_ventas_data(df_ventas):
     
     return df_ventas
 
-# Cached function for data preprocessing
-@st.cache_data
 def preprocess_productos_data(df_productos):
-    """Cache the data preprocessing to avoid reprocessing on every interaction - OPTIMIZED VERSION"""
+    """Preprocess the productos sheet for the analytic model - OPTIMIZED VERSION"""
     if df_productos.empty:
         return df_productos
     
-    df_productos = df_productos.copy()
-    column_map_productos = {
-        "TPV": "Código Tienda",
-        "NombreTPV": "Tienda",
-        "Fecha Presupuesto": "Fecha Presupuesto",
-        "Fecha Tope": "Fecha Tope",
-        "Marca": "Código Marca",
-        "Descripción Marca": "Marca",
-        "Generico": "Genérico",
-        "ACT": "Código único",
-        "Artículo": "Artículo",
-        "Modelo Artículo": "Modelo Artículo",
-        "Color": "Código Color",
-        "Descripción Color": "Color",
-        "Talla": "Talla",
-        "Tema": "Tema",
-        "Unnamed: 14": "Unnamed: 14",
-        "Cantidad Pedida": "Cantidad pedida",
-        "Fecha REAL entrada en almacén": "Fecha almacén",
-        "Precio Coste": "Precio Coste",
-        "P.V.P.": "PVP",
-        "Importe de Coste": "Importe de Coste"
-    }
+    column_map_productos = rename_map("productos")
     
     # OPTIMIZATION: Only rename columns that exist
     existing_columns = {k: v for k, v in column_map_productos.items() if k in df_productos.columns}
@@ -3104,14 +2552,9 @@ def preprocess_productos_data(df_productos):
     
     # OPTIMIZATION: Process date column more efficiently
     if 'Fecha almacén' in df_productos.columns:
-        df_productos['Fecha almacén'] = pd.to_datetime(df_productos['Fecha almacén'], format='%d/%m/%Y', errors='coerce')
+        # Dates are already parsed by the schema at load time
         df_productos = df_productos.dropna(subset=['Fecha almacén'])
         df_productos['Mes'] = df_productos['Fecha almacén'].dt.to_period('M').astype(str)
-
-    # OPTIMIZATION: Process code columns more efficiently
-    if 'Código único' in df_productos.columns:
-        df_productos['Código único'] = df_productos['Código único'].astype(str).str.split().str[0]
-
     
     # OPTIMIZATION: Process numeric columns more efficiently
     numeric_columns = ['Cantidad pedida', 'PVP']
@@ -3129,33 +2572,12 @@ def preprocess_productos_data(df_productos):
     
     return df_productos
 
-@st.cache_data
 def preprocess_traspasos_data(df_traspasos):
-    """Cache the data preprocessing to avoid reprocessing on every interaction - OPTIMIZED VERSION"""
+    """Preprocess the traspasos sheet for the analytic model - OPTIMIZED VERSION"""
     if df_traspasos.empty:
         return df_traspasos
     
-    df_traspasos = df_traspasos.copy()
-    column_map_traspasos = {
-        "Nº. TPV Origen": "Nº. TPV Origen",
-        "NombreTPVOrigen": "NombreTPVOrigen",
-        "Fecha Documento": "Fecha enviado",
-        "Nº. TPV Destino": "Nº. TPV Destino",
-        "NombreTpvDestino": "Tienda",
-        "Zona Geográfica": "Zona Geográfica",
-        "Marca": "Marca",
-        "Descripción Marca": "Descripción Marca",
-        "Temporada": "Temporada",
-        "Genérico": "Genérico",
-        "ACT": "Código único",
-        "Artículo": "Artículo",
-        "Modelo Artículo": "Modelo Artículo",
-        "Color": "Código Color",
-        "Descripción Color": "Descripción Color",
-        "Talla": "Talla",
-        "Enviado": "Cantidad enviada",
-        "Descripción Familia": "Familia"
-    }
+    column_map_traspasos = rename_map("traspasos")
     
     # OPTIMIZATION: Only rename columns that exist
     existing_columns = {k: v for k, v in column_map_traspasos.items() if k in df_traspasos.columns}
@@ -3163,13 +2585,10 @@ def preprocess_traspasos_data(df_traspasos):
   
     # OPTIMIZATION: Process date column more efficiently
     if 'Fecha enviado' in df_traspasos.columns:
-        df_traspasos['Fecha enviado'] = pd.to_datetime(df_traspasos['Fecha enviado'], format='%d/%m/%Y', errors='coerce')
+        # Dates are already parsed by the schema at load time
         df_traspasos = df_traspasos.dropna(subset=['Fecha enviado'])
         df_traspasos['Mes'] = df_traspasos['Fecha enviado'].dt.to_period('M').astype(str)
 
-    # OPTIMIZATION: Process code columns more efficiently
-    if 'Código único' in df_traspasos.columns:
-        df_traspasos['Código único'] = df_traspasos['Código único'].astype(str).str.split().str[0]
     
     # OPTIMIZATION: Process numeric columns more efficiently
     if 'Cantidad enviada' in df_traspasos.columns:
@@ -3181,6 +2600,238 @@ def preprocess_traspasos_data(df_traspasos):
     
     return df_traspasos
 
+def build_analytic_model(_df_productos, _df_traspasos, _df_ventas, huella):
+    """
+    Build the analytic model of an upload once (app.py keeps one copy per huella in the
+    process-wide dataset store, see dataset.acquire_dataset): renamed columns, parsed dates and month
+    keys, normalized Código único, Talla as an ordered categorical shared by the three
+    sheets, Es_Online, Precio Coste, 'Fuera de temporada', 'Semana temporada' (weeks
+    into the season window), Dias_Rotacion, 'Precio Real Unitario' (Beneficio / Cantidad)
+    and 'Margen Unitario' (PVP - Precio Coste) in ventas, which is sorted by 'Fecha venta'.
+
+    Every dashboard section reads these frames as they are; nothing downstream
+    re-parses dates or re-runs the merge, and the frames must not be modified in place
+    (the store marks their arrays read-only).
+
+    Returns:
+        df_productos, df_traspasos, df_ventas
+    """
+    df_ventas = preprocess_ventas_data(_df_ventas)
+    df_productos = preprocess_productos_data(_df_productos)
+    df_traspasos = preprocess_traspasos_data(_df_traspasos)
+    
+    # OPTIMIZATION: Talla normalized once and stored as an ordered categorical, so size
+    # charts and pivots sort by category code instead of calling custom_sort_key
+    encode_sizes([df_productos, df_traspasos, df_ventas])
+    
+    df_ventas = build_ventas_model(df_ventas, df_productos, df_traspasos)
+    
+    return df_productos, df_traspasos, df_ventas
+
+def build_ventas_model(df_ventas, df_productos, df_traspasos):
+    """
+    Ventas del modelo analítico a partir de las hojas ya preprocesadas (Talla codificada):
+    Precio Coste de productos, orden por 'Fecha venta', ventana de temporada, días de
+    rotación, precio de venta unitario y margen unitario. Vale para una subida completa y para las filas nuevas de una carga incremental.
+    """
+    # Merge Precio Coste from df_productos into df_ventas using Código único
+    if 'Código único' in df_ventas.columns and 'Precio Coste' in df_productos.columns:
+        df_ventas = df_ventas.merge(
+            df_productos[['Código único', 'Precio Coste']],
+            on='Código único',
+            how='left',
+            suffixes=('', '_producto')
+        )
+        # Prefer Precio Coste from df_productos if available
+        if 'Precio Coste_producto' in df_ventas.columns:
+            df_ventas['Precio Coste'] = df_ventas['Precio Coste_producto'].combine_first(df_ventas['Precio Coste'])
+            df_ventas = df_ventas.drop(columns=['Precio Coste_producto'])
+
+    # OPTIMIZATION: Keep ventas physically sorted by date so aplicar_filtros can binary-search it
+    if 'Fecha venta' in df_ventas.columns:
+        df_ventas = df_ventas.sort_values('Fecha venta', kind='stable', ignore_index=True)
+        # Season window of every sale, resolved once per Temporada/Marca (seasons.CALENDARIO_TEMPORADAS)
+        df_ventas = df_ventas.join(classify_season(df_ventas))
+
+    # OPTIMIZATION: Rotation days stored per sale, so filters only select rows and an
+    # incremental upload only pairs the new sales (rotation.rotation_days)
+    if rotacion_disponible(df_productos, df_traspasos, df_ventas):
+        df_ventas['Dias_Rotacion'] = rotation_days(df_productos, df_traspasos, df_ventas)
+
+    # OPTIMIZATION: Unit sale price and unit margin computed once for every section,
+    # instead of adding them to copies of ventas on each rerun
+    if {'Beneficio', 'Cantidad'} <= set(df_ventas.columns):
+        df_ventas['Precio Real Unitario'] = df_ventas['Beneficio'] / df_ventas['Cantidad']
+    if {'PVP', 'Precio Coste'} <= set(df_ventas.columns):
+        df_ventas['Margen Unitario'] = df_ventas['PVP'] - df_ventas['Precio Coste']
+
+    return df_ventas
+
+def rotacion_disponible(df_productos, df_traspasos, df_ventas):
+    """Si las hojas tienen las columnas que necesita el motor de rotación"""
+    return (
+        not df_productos.empty and 'Fecha almacén' in df_productos.columns
+        and {'Tienda', 'Fecha enviado'} <= set(df_traspasos.columns)
+        and 'Fecha venta' in df_ventas.columns
+    )
+
+def extend_analytic_model(base, df_productos, df_traspasos, df_ventas_nuevas):
+    """
+    Añade las ventas nuevas de una carga incremental al modelo analítico de la base.
+
+    Solo se preprocesan las filas nuevas; el cubo se suma celda a celda y la rotación
+    se calcula para las ventas nuevas y para las de la base cuyo par Código único +
+    Tienda aparece o desaparece en traspasos (todas si cambian entradas en almacén del
+    periodo ya cargado).
+
+    Args:
+        base: Conjunto base de incremental.load_base (se modifican sus tablas)
+        df_productos, df_traspasos: Hojas completas de la subida (load_excel_data)
+        df_ventas_nuevas: Filas de ventas de la subida que no están en la base
+
+    Returns:
+        (df_productos, df_traspasos, df_ventas, cubo, anadidas), donde anadidas son las
+        filas nuevas del modelo si quedan al final de df_ventas (None si hubo que
+        reordenar); o None si la subida cambia los costes de productos ya vendidos y hay
+        que reconstruir el modelo completo
+    """
+    df_productos = preprocess_productos_data(df_productos)
+    df_traspasos = preprocess_traspasos_data(df_traspasos)
+    base_ventas, base_cubo = base['ventas'], base['cubo']
+
+    # Precio Coste se cruza por Código único: las filas de productos de lo ya vendido
+    # deben ser las mismas, o las filas del modelo de la base ya no serían válidas
+    if 'Precio Coste' in df_productos.columns and 'Código único' in base_ventas.columns:
+        vendidos = base_ventas['Código único'].unique()
+        costes = [
+            df[df['Código único'].isin(vendidos)][['Código único', 'Precio Coste']]
+            for df in (base['productos'], df_productos)
+        ]
+        if not same_rows(*costes):
+            return None
+
+    nuevas = [preprocess_ventas_data(df_ventas_nuevas)] if not df_ventas_nuevas.empty else []
+    encode_sizes([df_productos, df_traspasos] + nuevas)
+    align_categories([df_productos, df_traspasos, base_ventas, base_cubo] + nuevas)
+
+    if rotacion_disponible(df_productos, df_traspasos, base_ventas) and 'Dias_Rotacion' in base_ventas.columns:
+        # Entradas del periodo ya cargado y pares con traspaso de la base frente a la subida
+        fecha_max = base['meta']['fecha_max']
+        entradas = []
+        for df in (base['productos'], df_productos):
+            df = df[['Código único', 'Talla', 'Fecha almacén']].dropna()
+            entradas.append(df[df['Fecha almacén'] <= fecha_max])
+        pares = [
+            pd.MultiIndex.from_frame(
+                df[['Código único', 'Tienda', 'Fecha enviado']].dropna()[['Código único', 'Tienda']].drop_duplicates()
+            )
+            for df in (base['traspasos'], df_traspasos)
+        ]
+        if same_rows(*entradas):
+            recalcular = pd.MultiIndex.from_frame(base_ventas[['Código único', 'Tienda']]).isin(
+                pares[0].symmetric_difference(pares[1])
+            )
+        else:
+            recalcular = np.ones(len(base_ventas), dtype=bool)
+        if recalcular.any():
+            base_ventas.loc[recalcular, 'Dias_Rotacion'] = rotation_days(
+                df_productos, df_traspasos, base_ventas[recalcular]
+            )
+
+    if not nuevas:
+        return df_productos, df_traspasos, base_ventas, base_cubo, base_ventas.iloc[0:0]
+
+    anadidas = build_ventas_model(nuevas[0], df_productos, df_traspasos)
+    df_ventas = pd.concat([base_ventas, anadidas], ignore_index=True)
+    cubo = merge_cubes(base_cubo, build_cube(anadidas))
+    # Las filas nuevas suelen ser posteriores a toda la base; si no, se reordena
+    if anadidas['Fecha venta'].min() < base_ventas['Fecha venta'].max():
+        df_ventas = df_ventas.sort_values('Fecha venta', kind='stable', ignore_index=True)
+        anadidas = None
+    return df_productos, df_traspasos, df_ventas, cubo, anadidas
+
+def update_analytic_model(df_productos, df_traspasos, df_ventas, huella, categorias=False):
+    """
+    Carga incremental: modelo analítico de la subida sobre el conjunto base persistido.
+
+    Las filas de ventas que ya están en la base (por fecha y huella de fila) no se
+    vuelven a procesar. Si no hay base compatible, la subida no contiene todas las
+    filas de la base (filas quitadas o corregidas, u otro libro) o cambia los costes de
+    productos ya vendidos, se construye el modelo completo de la subida y pasa a ser la
+    nueva base.
+
+    Args:
+        df_productos, df_traspasos, df_ventas: Hojas de load_excel_data
+        huella: Huella de la subida
+        categorias: Si la subida se cargó con columnas categóricas
+
+    Returns:
+        df_productos, df_traspasos, df_ventas, cubo, huella del conjunto resultante y
+        fila de informe de carga
+    """
+    inicio = time.perf_counter()
+    columna_fecha = next(
+        col for col, spec in SCHEMAS["ventas"]["columnas"].items() if spec["rename"] == 'Fecha venta'
+    )
+
+    base = load_base()
+    modelo = None
+    if (
+        base is not None
+        and base['meta']['categorias'] == categorias
+        and base['meta']['columnas'] == list(df_ventas.columns)
+    ):
+        nuevas, huellas, en_base = new_rows(df_ventas, base['filas']['huella'].to_numpy(), base['meta']['fecha_max'], columna_fecha)
+        # Solo se puede añadir si la subida contiene todas las filas de la base
+        if en_base == len(base['filas']):
+            modelo = extend_analytic_model(base, df_productos, df_traspasos, df_ventas[nuevas])
+
+    if modelo is None:
+        modo = 'Completa'
+        df_productos, df_traspasos, df_ventas_modelo = build_analytic_model(df_productos, df_traspasos, df_ventas, huella)
+        cubo = build_cube(df_ventas_modelo)
+        nuevas = np.ones(len(df_ventas), dtype=bool)
+        filas = pd.DataFrame({'huella': row_hashes(df_ventas)})
+        anadidas = None
+        ficheros = {}
+    else:
+        modo = 'Incremental'
+        base_productos, base_traspasos = base['productos'], base['traspasos']
+        df_productos, df_traspasos, df_ventas_modelo, cubo, anadidas = modelo
+        if nuevas.any() or not (same_rows(base_productos, df_productos) and same_rows(base_traspasos, df_traspasos)):
+            huella = derive_fingerprint(base['meta']['huella'], huella)
+        else:
+            # Misma base: se conserva su huella y las cachés derivadas siguen valiendo
+            huella = base['meta']['huella']
+        filas_nuevas = pd.DataFrame({'huella': huellas[nuevas]})
+        filas = pd.concat([base['filas'], filas_nuevas], ignore_index=True)
+        # OPTIMIZATION: New rows go to disk as one more part; only small tables are rewritten
+        if anadidas is not None:
+            anadidas = {'ventas': anadidas, 'filas': filas_nuevas}
+        ficheros = base['meta']['ficheros']
+
+    save_base({
+        'meta': {
+            'huella': huella,
+            'categorias': categorias,
+            'columnas': list(df_ventas.columns),
+            'fecha_max': df_ventas_modelo['Fecha venta'].max() if 'Fecha venta' in df_ventas_modelo.columns else pd.NaT,
+            'ficheros': ficheros
+        },
+        'productos': df_productos,
+        'traspasos': df_traspasos,
+        'ventas': df_ventas_modelo,
+        'cubo': cubo,
+        'filas': filas
+    }, anadidas)
+    informe = {
+        'Hoja': SCHEMAS["ventas"]["hoja"],
+        'Modo': modo,
+        'Filas': int(nuevas.sum()),
+        'Segundos': round(time.perf_counter() - inicio, 3)
+    }
+    return df_productos, df_traspasos, df_ventas_modelo, cubo, huella, informe
+
 # Cached function for consistent temporada colors
 @st.cache_data
 def get_temporada_colors(df_ventas):
@@ -3193,80 +2844,48 @@ def get_temporada_colors(df_ventas):
 
 # New cached functions for Resumen General optimization
 @st.cache_data
-def calculate_rotation_metrics(df_productos, df_traspasos, df_ventas):
+def calculate_rotation_metrics(_df_productos, _df_traspasos, _df_ventas, huella):
     """Cache the rotation calculation which is very expensive - OPTIMIZED VERSION"""
-    if df_productos.empty or 'Fecha almacén' not in df_productos.columns:
-        return None, None, None, None, None, None, None, None, None, None, None, None
-    
-    # Prepare data for rotation calculation - OPTIMIZED
-    df_productos_rotacion = df_productos[['Código único', 'Talla', 'Fecha almacén']].copy()
-    df_productos_rotacion['Fecha almacén'] = pd.to_datetime(df_productos_rotacion['Fecha almacén'], format='%d/%m/%Y', errors='coerce')
-    
-    df_traspasos_rotacion = df_traspasos[['Código único', 'Talla', 'Tienda', 'Fecha enviado']].copy()
-    df_traspasos_rotacion['Fecha enviado'] = pd.to_datetime(df_traspasos_rotacion['Fecha enviado'], format='%d/%m/%Y', errors='coerce')
-    
-    ventas_rotacion = df_ventas[['Código único', 'Talla', 'Tienda', 'Fecha venta', 'Familia']].copy()
-    ventas_rotacion['Fecha venta'] = pd.to_datetime(ventas_rotacion['Fecha venta'], format='%d/%m/%Y', errors='coerce')
-    
-    # Filter out invalid dates early for better performance
-    df_productos_rotacion = df_productos_rotacion.dropna(subset=['Fecha almacén'])
-    df_traspasos_rotacion = df_traspasos_rotacion.dropna(subset=['Fecha enviado'])
-    ventas_rotacion = ventas_rotacion.dropna(subset=['Fecha venta'])
-    
-    if df_productos_rotacion.empty or df_traspasos_rotacion.empty or ventas_rotacion.empty:
-        return None, None, None, None, None, None, None, None, None, None, None, None
-    
-    # OPTIMIZED: Use only necessary columns for merge
-    ventas_con_entrada = ventas_rotacion.merge(
-        df_productos_rotacion,
-        on=['Código único'],
-        how='inner'
-    )
-    
-    if ventas_con_entrada.empty:
-        return None, None, None, None, None, None, None, None, None, None, None, None
-    
-    # OPTIMIZED: Merge with traspasos using only necessary columns
-    rotacion_completa = ventas_con_entrada.merge(
-        df_traspasos_rotacion,
-        on=['Código único', 'Tienda'],
-        how='inner'
-    )
-    
-    if rotacion_completa.empty:
+    if _df_productos.empty or 'Fecha almacén' not in _df_productos.columns:
         return None, None, None, None, None, None, None, None, None, None, None, None
     
-    # Calculate rotation days with validation
-    rotacion_completa['Dias_Rotacion'] = (
-        rotacion_completa['Fecha venta'] - rotacion_completa['Fecha almacén']
-    ).dt.days
-    
-    # Filter valid rotation days (0-365 days to avoid extreme outliers)
-    rotacion_completa = rotacion_completa[
-        (rotacion_completa['Dias_Rotacion'] >= 0) & 
-        (rotacion_completa['Dias_Rotacion'] <= 365)
-    ]
-    
-    if rotacion_completa.empty:
-        return None, None, None, None, None, None, None, None, None, None, None, None
-    
-    # Calculate comprehensive rotation metrics by store
-    rotacion_por_tienda = rotacion_completa.groupby('Tienda').agg({
-        'Dias_Rotacion': ['mean', 'median', 'std', 'count']
-    }).reset_index()
-    rotacion_por_tienda.columns = ['Tienda', 'Dias_Promedio', 'Dias_Mediana', 'Dias_Std', 'Productos_Con_Rotacion']
-    
-    # Calculate comprehensive rotation metrics by product
-    rotacion_por_producto = rotacion_completa.groupby(['Código único', 'Familia']).agg({
-        'Dias_Rotacion': ['mean', 'median', 'std', 'count']
-    }).reset_index()
-    rotacion_por_producto.columns = ['Código único', 'Familia', 'Dias_Promedio', 'Dias_Mediana', 'Dias_Std', 'Ventas_Con_Rotacion']
-    
-    # Calculate overall statistics
-    dias_rotacion_global = rotacion_completa['Dias_Rotacion']
-    promedio_global = dias_rotacion_global.mean()
-    mediana_global = dias_rotacion_global.median()
-    std_global = dias_rotacion_global.std()
+    # OPTIMIZATION: As-of join pairs each sale with its latest prior warehouse entry
+    # (same Código único and Talla), one row per sale instead of many-to-many merges.
+    # The analytic model already stores the result per sale (Dias_Rotacion)
+    if duckdb_enabled() and 'Dias_Rotacion' in _df_ventas.columns:
+        # OPTIMIZATION: DuckDB computes the per-store, per-product and global statistics
+        # in one GROUPING SETS query over the model, without selecting rows in pandas
+        if not _df_ventas['Dias_Rotacion'].notna().any():
+            return None, None, None, None, None, None, None, None, None, None, None, None
+        rotacion_por_tienda, rotacion_por_producto, promedio_global, mediana_global, std_global, ventas_con_rotacion = \
+            rotation_stats_sql(_df_ventas)
+    else:
+        if 'Dias_Rotacion' in _df_ventas.columns:
+            rotacion_completa = _df_ventas[_df_ventas['Dias_Rotacion'].notna().to_numpy()]
+        else:
+            rotacion_completa = rotation_pairs(_df_productos, _df_traspasos, _df_ventas)
+        
+        if rotacion_completa.empty:
+            return None, None, None, None, None, None, None, None, None, None, None, None
+        
+        # Calculate comprehensive rotation metrics by store
+        rotacion_por_tienda = rotacion_completa.groupby('Tienda', observed=True).agg({
+            'Dias_Rotacion': ['mean', 'median', 'std', 'count']
+        }).reset_index()
+        rotacion_por_tienda.columns = ['Tienda', 'Dias_Promedio', 'Dias_Mediana', 'Dias_Std', 'Productos_Con_Rotacion']
+        
+        # Calculate comprehensive rotation metrics by product
+        rotacion_por_producto = rotacion_completa.groupby(['Código único', 'Familia'], observed=True).agg({
+            'Dias_Rotacion': ['mean', 'median', 'std', 'count']
+        }).reset_index()
+        rotacion_por_producto.columns = ['Código único', 'Familia', 'Dias_Promedio', 'Dias_Mediana', 'Dias_Std', 'Ventas_Con_Rotacion']
+        
+        # Calculate overall statistics
+        dias_rotacion_global = rotacion_completa['Dias_Rotacion']
+        promedio_global = dias_rotacion_global.mean()
+        mediana_global = dias_rotacion_global.median()
+        std_global = dias_rotacion_global.std()
+        ventas_con_rotacion = len(rotacion_completa)
     
     # Calculate KPIs with better logic
     tienda_mayor_rotacion = "Sin datos"
@@ -3313,7 +2932,7 @@ def calculate_rotation_metrics(df_productos, df_traspasos, df_ventas):
         tienda_menor_rotacion, tienda_menor_rotacion_dias,
         producto_mayor_rotacion, producto_mayor_rotacion_dias, 
         producto_menor_rotacion, producto_menor_rotacion_dias,
-        promedio_global, mediana_global, std_global, len(rotacion_completa)
+        promedio_global, mediana_global, std_global, ventas_con_rotacion
     )
 
 @st.cache_data
@@ -3342,7 +2961,7 @@ def calculate_basic_kpis(df_ventas):
 @st.cache_data
 def calculate_monthly_sales_data(df_ventas):
     """Cache monthly sales data calculation"""
-    ventas_mes_tipo = df_ventas.groupby(['Mes', 'Es_Online']).agg({
+    ventas_mes_tipo = df_ventas.groupby(['Mes', 'Es_Online'], observed=True).agg({
         'Cantidad': 'sum',
         'Beneficio': 'sum'
     }).reset_index()
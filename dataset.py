@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from schema import SCHEMA_VERSION
+from snapshot_cache import digest_bytes
+
+# Los DataFrames de una subida se identifican por una huella (fingerprint) que se
+# calcula una sola vez al subir el fichero. Las funciones cacheadas reciben el
+# DataFrame como argumento con guion bajo (Streamlit no lo hashea) junto con la
+# huella, así que un acierto de caché ya no exige recorrer millones de celdas.
+
+
+def upload_fingerprint(data, categorias=False):
+    """
+    Huella de una subida: contenido del fichero, versión del esquema y opciones
+    de carga que cambian los DataFrames resultantes.
+    """
+    huella = f"{digest_bytes(data)}-s{SCHEMA_VERSION}"
+    if categorias:
+        huella += "-cat"
+    return huella
+
+
+def derive_fingerprint(huella, *params):
+    """Huella de un subconjunto derivado (filtros) a partir de la huella de origen"""
+    return hashlib.sha256(repr((huella,) + params).encode()).hexdigest()
+
+
+def frame_fingerprint(*dfs):
+    """
+    Huella de contenido recorriendo los DataFrames.
+
+    Solo para llamadas que no traen huella de la subida; es una pasada vectorizada,
+    mucho más barata que el hash que hace st.cache_data, pero no gratuita.
+    """
+    h = hashlib.sha256()
+    for df in dfs:
+        h.update(repr(list(df.columns)).encode())
+        h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+# Almacén de conjuntos compartido por todas las sesiones del proceso. Cada subida se
+# guarda una sola vez por huella, con sus arrays marcados como solo lectura, y las
+# sesiones guardan en st.session_state una referencia (DatasetRef) en lugar de los
+# DataFrames. Cuando la última referencia desaparece (la sesión sube otro fichero o
+# Streamlit cierra la sesión y la recoge el recolector), el conjunto se libera.
+_ALMACEN = {}
+_CERROJO = threading.Lock()
+
+
+class DatasetRef:
+    """Referencia de una sesión a un conjunto del almacén"""
+    __slots__ = ('huella', '__weakref__')
+
+    def __init__(self, huella):
+        self.huella = huella
+
+    def frames(self):
+        """
+        Vistas de los DataFrames del conjunto para una ejecución del script.
+
+        Son copias superficiales: comparten los datos (de solo lectura) con el resto de
+        sesiones, pero añadir o quitar columnas no afecta al conjunto compartido, y con
+        Copy-on-Write una escritura copia solo el bloque escrito.
+        """
+        return tuple(df.copy(deep=False) for df in _ALMACEN[self.huella]['frames'])
+
+
+def freeze_frame(df):
+    """
+    Marca como solo lectura los arrays de un DataFrame, para que una escritura en
+    sitio sobre datos compartidos falle en lugar de cambiarlos para todas las sesiones.
+
+    Los arrays de objetos (texto) se dejan escribibles: algunas rutinas de pandas en
+    Cython (p.ej. memory_usage(deep=True)) no aceptan buffers de objetos de solo lectura.
+    """
+    for bloque in df._mgr.blocks:
+        valores = bloque.values
+        arrays = [valores] + [getattr(valores, nombre, None) for nombre in ('_ndarray', '_data', '_mask')]
+        for array in arrays:
+            if isinstance(array, np.ndarray) and array.dtype != object:
+                array.flags.writeable = False
+    return df
+
+
+def _release(huella):
+    with _CERROJO:
+        entrada = _ALMACEN.get(huella)
+        if entrada is None:
+            return
+        entrada['referencias'] -= 1
+        if entrada['referencias'] <= 0:
+            del _ALMACEN[huella]
+
+
+def acquire_dataset(huella, construir=None):
+    """
+    Referencia a un conjunto del almacén, construyéndolo si no está.
+
+    Args:
+        huella: Huella del conjunto
+        construir: Función sin argumentos que devuelve los DataFrames del conjunto, o
+            None para solo consultar
+
+    Returns:
+        DatasetRef, o None si el conjunto no está y no hay construir
+    """
+    with _CERROJO:
+        entrada = _ALMACEN.get(huella)
+        if entrada is not None:
+            entrada['referencias'] += 1
+    if entrada is None:
+        if construir is None:
+            return None
+        # Se construye fuera del cerrojo; si otra sesión lo publica antes, se usa el suyo
+        frames = tuple(freeze_frame(df) for df in construir())
+        with _CERROJO:
+            entrada = _ALMACEN.setdefault(huella, {'frames': frames, 'referencias': 0})
+            entrada['referencias'] += 1
+
+    referencia = DatasetRef(huella)
+    weakref.finalize(referencia, _release, huella)
+    return referencia
+
+
+def dataset_stats():
+    """Conjuntos del almacén con sus referencias y memoria (para el informe de carga)"""
+    with _CERROJO:
+        entradas = list(_ALMACEN.items())
+    filas = []
+    for huella, entrada in entradas:
+        if 'mb' not in entrada:
+            # Los conjuntos no cambian: la memoria se mide una vez
+            entrada['mb'] = round(sum(df.memory_usage(deep=True).sum() for df in entrada['frames']) / 1024**2, 1)
+        filas.append({'Huella': huella[:12], 'Sesiones': entrada['referencias'], 'Memoria (MB)': entrada['mb']})
+    return pd.DataFrame(filas, columns=['Huella', 'Sesiones', 'Memoria (MB)'])
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+# Caché persistente de entidades de descripciones: de una temporada a otra la mayoría
+# de las descripciones no cambian, así que el resultado de cada una se guarda en disco
+# con la huella de su texto limpio y solo las descripciones nuevas pasan por spaCy.
+# Cada entrada lleva la versión de los diccionarios y del modelo con que se extrajo;
+# al cambiar cualquiera de ellos las entradas anteriores se descartan.
+
+# Directorio de la caché (configurable por entorno)
+ENTITY_CACHE_DIR = os.environ.get(
+    "TRUCCO_ENTITY_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".entidades")
+)
+
+# Claves por consulta (límite de parámetros de SQLite)
+_LOTE_CONSULTA = 500
+
+
+def cache_version(*partes):
+    """
+    Huella de todo lo que determina el resultado de la extracción.
+
+    El orden cuenta: las partes se serializan tal cual, sin ordenar claves, porque
+    reordenar las reglas de sinónimos cambia el resultado (se aplican encadenadas).
+    Los diccionarios cuyo orden importa se pasan como lista de pares.
+
+    Args:
+        *partes: Objetos serializables en JSON (reglas de sinónimos, términos, versión
+            del modelo...)
+
+    Returns:
+        Huella SHA-256 en hexadecimal
+    """
+    contenido = json.dumps(partes, ensure_ascii=False)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def description_key(texto_limpio):
+    """Huella del texto limpio de una descripción, usada como clave de la caché"""
+    return hashlib.blake2b(texto_limpio.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _conectar():
+    os.makedirs(ENTITY_CACHE_DIR, exist_ok=True)
+    conexion = sqlite3.connect(os.path.join(ENTITY_CACHE_DIR, "entidades.sqlite"), timeout=30)
+    conexion.execute(
+        "CREATE TABLE IF NOT EXISTS entidades ("
+        "version TEXT NOT NULL, clave TEXT NOT NULL, resultado TEXT NOT NULL, "
+        "PRIMARY KEY (version, clave))"
+    )
+    return conexion
+
+
+def load_entities(claves, version):
+    """
+    Resultados guardados para las claves dadas.
+
+    Args:
+        claves: Claves (description_key) a buscar
+        version: Versión actual (cache_version)
+
+    Returns:
+        Diccionario clave -> {etiqueta: [términos]} con las claves encontradas (vacío si
+        la caché no existe o no se puede leer)
+    """
+    claves = list(claves)
+    encontradas = {}
+    try:
+        conexion = _conectar()
+        try:
+            for i in range(0, len(claves), _LOTE_CONSULTA):
+                lote = claves[i:i + _LOTE_CONSULTA]
+                filas = conexion.execute(
+                    f"SELECT clave, resultado FROM entidades WHERE version = ? "
+                    f"AND clave IN ({','.join('?' * len(lote))})",
+                    [version] + lote
+                )
+                for clave, resultado in filas:
+                    encontradas[clave] = json.loads(resultado)
+        finally:
+            conexion.close()
+    except (sqlite3.Error, OSError, ValueError):
+        # Caché corrupta o no accesible: se extrae todo de nuevo
+        return {}
+    return encontradas
+
+
+def save_entities(resultados, version):
+    """
+    Guarda resultados y descarta los de otras versiones.
+
+    Args:
+        resultados: Diccionario clave -> {etiqueta: [términos]}
+        version: Versión con la que se extrajeron (cache_version)
+    """
+    try:
+        conexion = _conectar()
+        try:
+            with conexion:
+                conexion.execute("DELETE FROM entidades WHERE version != ?", (version,))
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO entidades (version, clave, resultado) VALUES (?, ?, ?)",
+                    [(version, clave, json.dumps(resultado, ensure_ascii=False))
+                     for clave, resultado in resultados.items()]
+                )
+        finally:
+            conexion.close()
+    except (sqlite3.Error, OSError):
+        return False
+    return True
@@ -0,0 +1,243 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+# Filas que se convierten a arrays tipados de una vez en el modo streaming
+STREAM_CHUNK_ROWS = 50_000
+
+# Hojas con más filas que este umbral se reparten por rangos en el modo paralelo
+PARALLEL_SPLIT_ROWS = 200_000
+
+# Mismos valores nulos que load_excel_data pasa a pd.read_excel
+NA_VALUES = {'', 'nan', 'NaN'}
+
+
+def _convert_cell(value):
+    """Normaliza un valor de celda igual que el lector openpyxl de pandas"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return None if value in NA_VALUES else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _header_names(row):
+    """Nombres de columna con las mismas reglas que pandas (Unnamed: i, duplicados .1, .2...)"""
+    names = []
+    seen = {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is None or value == '' else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _typed_chunk(values, dtype):
+    """Convierte una lista de valores de celda en un array tipado"""
+    if dtype is str or dtype == 'str':
+        return pd.Series(
+            np.array([np.nan if v is None else str(v) for v in values], dtype=object)
+        )
+    if dtype is not None:
+        return pd.Series(pd.array(values, dtype=dtype))
+    arr = np.array([np.nan if v is None else v for v in values], dtype=object)
+    return pd.Series(arr).infer_objects()
+
+
+def read_sheet_streaming(file, sheet_name, dtype=None, chunk_rows=STREAM_CHUNK_ROWS,
+                         min_row=None, max_row=None, header=None):
+    """
+    Lee una hoja en modo read_only de openpyxl, por bloques de filas.
+
+    Cada bloque se convierte enseguida a arrays tipados por columna, de modo que la
+    memoria pico es proporcional al DataFrame resultante y no al árbol XML completo.
+
+    Args:
+        file: Ruta o fichero (BytesIO / UploadedFile) con el libro Excel
+        sheet_name: Nombre de la hoja
+        dtype: Diccionario columna -> dtype, igual que en pd.read_excel
+        chunk_rows: Filas por bloque
+        min_row, max_row: Rango de filas de la hoja a leer (1 = cabecera); max_row=None
+            lee hasta la última fila real de la hoja
+        header: Nombres de columna ya conocidos, para leer un rango que no incluye la cabecera
+
+    Returns:
+        DataFrame con la hoja
+    """
+    dtype = dtype or {}
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name]
+        # La dimensión declarada en el XML puede estar desfasada (otras herramientas la
+        # escriben mal): sin ella, max_row=None lee hasta la última fila real, igual
+        # que pd.read_excel
+        ws.reset_dimensions()
+        rows = ws.iter_rows(min_row=min_row or 1, max_row=max_row, values_only=True)
+
+        if header is None:
+            header = _header_names(next(rows, ()))
+        width = len(header)
+
+        chunks = {name: [] for name in header}
+        buffer = []
+        n_rows = 0
+
+        def flush():
+            columns = list(zip(*buffer)) if buffer else [()] * width
+            for name, values in zip(header, columns):
+                chunks[name].append(_typed_chunk(list(values), dtype.get(name)))
+            buffer.clear()
+
+        for row in rows:
+            row = tuple(_convert_cell(v) for v in row[:width])
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            buffer.append(row)
+            n_rows += 1
+            if len(buffer) >= chunk_rows:
+                flush()
+        if buffer or n_rows == 0:
+            flush()
+    finally:
+        wb.close()
+
+    data = {
+        name: pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        for name, parts in chunks.items()
+    }
+    return pd.DataFrame(data, columns=header)
+
+
+def _sheet_layout(path, sheet_name):
+    """
+    Cabecera y número de filas (según la dimensión declarada) de una hoja.
+
+    La dimensión solo sirve para planificar los rangos: puede no coincidir con las
+    filas reales, así que el último rango se lee siempre hasta el final de la hoja.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name]
+        header = _header_names(next(ws.iter_rows(max_row=1, values_only=True), ()))
+        return header, ws.max_row
+    finally:
+        wb.close()
+
+
+def _read_part(path, sheet_name, dtype, min_row, max_row, header):
+    """Tarea de un proceso worker: lee una hoja completa o un rango de filas"""
+    return read_sheet_streaming(path, sheet_name, dtype=dtype, min_row=min_row,
+                                max_row=max_row, header=header)
+
+
+def read_sheets_parallel(data, sheets, max_workers=None, split_rows=PARALLEL_SPLIT_ROWS):
+    """
+    Lee varias hojas a la vez en un pool de procesos.
+
+    El contenido subido se vuelca una sola vez a un fichero temporal que abren todos
+    los workers. Las hojas con más de split_rows filas se reparten además por rangos
+    de filas; openpyxl tiene que recorrer igualmente las filas anteriores a cada rango,
+    así que el reparto ahorra sobre todo la conversión de celdas, no el parseo del XML.
+    La memoria de los workers no es visible para tracemalloc en este proceso.
+
+    Args:
+        data: Bytes del libro Excel
+        sheets: Lista de (nombre de hoja, diccionario de dtypes)
+        max_workers: Procesos del pool (por defecto os.cpu_count())
+        split_rows: Umbral de filas para repartir una hoja por rangos
+
+    Returns:
+        Lista de DataFrames en el mismo orden que sheets
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    tmp = tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False)
+    try:
+        with tmp:
+            tmp.write(data)
+
+        # Planificar tareas: una por hoja, o varias por rangos en hojas grandes
+        tasks = []
+        for i, (sheet_name, dtype) in enumerate(sheets):
+            header, n_rows = None, None
+            if split_rows:
+                header, n_rows = _sheet_layout(tmp.name, sheet_name)
+            if n_rows and n_rows - 1 > split_rows:
+                n_parts = min(max_workers, -(-(n_rows - 1) // split_rows))
+                step = -(-(n_rows - 1) // n_parts)
+                for start in range(2, n_rows + 1, step):
+                    # El último rango queda abierto: si la dimensión declarada se queda
+                    # corta, su worker lee igualmente hasta la última fila real
+                    end = start + step - 1 if start + step <= n_rows else None
+                    tasks.append((i, (tmp.name, sheet_name, dtype, start, end, header)))
+            else:
+                tasks.append((i, (tmp.name, sheet_name, dtype, None, None, None)))
+
+        # spawn: el servidor de Streamlit tiene varios hilos y fork no es seguro en ese caso
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(tasks)),
+            mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = [(i, pool.submit(_read_part, *args)) for i, args in tasks]
+            parts = [[] for _ in sheets]
+            for i, future in futures:
+                parts[i].append(future.result())
+    finally:
+        os.remove(tmp.name)
+
+    return [p[0] if len(p) == 1 else pd.concat(p, ignore_index=True) for p in parts]
+
+
+def measure_ingest(sheet_name, mode, read_func, trace_memory=False):
+    """
+    Ejecuta read_func y devuelve (df, estadísticas) con filas/segundo y memoria pico.
+
+    read_func puede devolver un DataFrame o una lista de DataFrames (modo paralelo).
+
+    La memoria pico se mide con tracemalloc (asignaciones Python y numpy) y solo si
+    trace_memory=True, porque el trazado ralentiza la lectura.
+    """
+    started_tracing = False
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    baseline = 0
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+    try:
+        df = read_func()
+        elapsed = time.perf_counter() - start
+        peak_mb = None
+        if tracemalloc.is_tracing():
+            peak_mb = (tracemalloc.get_traced_memory()[1] - baseline) / 1024 ** 2
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    n_rows = sum(len(d) for d in df) if isinstance(df, list) else len(df)
+    stats = {
+        'Hoja': sheet_name,
+        'Modo': mode,
+        'Filas': n_rows,
+        'Segundos': round(elapsed, 3),
+        'Filas/segundo': round(n_rows / elapsed) if elapsed > 0 else None,
+        'Memoria pico (MB)': round(peak_mb, 1) if peak_mb is not None else None
+    }
+    return df, stats
@@ -0,0 +1,248 @@
+import contextlib
+import json
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from schema import align_categories
+from snapshot_cache import PYARROW_AVAILABLE
+
+# Optional fcntl import (cerrojo de la base entre sesiones y procesos; solo en POSIX)
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Carga incremental: cada mes se sube un libro que repite todo el histórico de ventas
+# más unas semanas nuevas. Se guarda en disco un conjunto base (modelo analítico de
+# ventas, cubo, productos y traspasos preprocesados y la huella de cada fila de ventas
+# original) y de cada subida solo se procesan las filas de ventas que no están en la base.
+
+# Directorio del conjunto base (configurable por entorno). No va dentro de SNAPSHOT_DIR
+# para que la política LRU de los snapshots nunca lo expulse
+BASE_DIR = os.environ.get(
+    "TRUCCO_BASE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".base")
+)
+
+# Tablas que se reescriben en cada carga (pequeñas)
+BASE_TABLES = ("productos", "traspasos", "cubo")
+
+# Tablas que crecen con cada carga: se guardan por partes y cada carga añade una
+#   ventas: modelo analítico de ventas (sin Dias_Rotacion, que se guarda aparte porque
+#           la carga puede recalcularlo en filas antiguas)
+#   filas:  huella de cada fila de ventas original ('huella')
+BASE_PARTS = ("ventas", "filas")
+
+# Columna del modelo de ventas que se reescribe entera en cada carga
+COLUMNA_ROTACION = 'Dias_Rotacion'
+
+# Versión del formato de la base; se sube al cambiar las columnas del modelo analítico
+# para que una base antigua no se mezcle con filas nuevas
+#   2: Precio Real Unitario y Margen Unitario en ventas
+BASE_VERSION = 2
+
+
+def row_hashes(df):
+    """Huella uint64 de cada fila (contenido, sin índice); igual para texto y categóricas"""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def same_rows(antes, despues):
+    """Si dos DataFrames tienen las mismas filas, en cualquier orden y con repeticiones"""
+    if len(antes) != len(despues) or list(antes.columns) != list(despues.columns):
+        return False
+    return np.array_equal(np.sort(row_hashes(antes)), np.sort(row_hashes(despues)))
+
+
+def new_rows(df, huellas_base, fecha_max, columna_fecha):
+    """
+    Filas de una subida que no están en el conjunto base.
+
+    Las filas posteriores a la última fecha de la base son nuevas sin más; las del
+    periodo ya cargado se comparan por huella, y una fila repetida solo es nueva en las
+    apariciones que superan las de la base (dos ventas idénticas el mismo día son dos
+    filas). Las filas del periodo que no son nuevas son filas de la base encontradas en
+    la subida: si son menos que las de la base, la subida ha quitado o corregido filas
+    (o es otro libro) y la base no vale.
+
+    Args:
+        df: Hoja de ventas de la subida, tal y como la deja load_excel_data
+        huellas_base: Huellas (row_hashes) de las filas de la base
+        fecha_max: Última fecha de venta de la base
+        columna_fecha: Columna de fecha de df
+
+    Returns:
+        (máscara booleana de filas nuevas, huellas de todas las filas de df, número de
+        filas de la base encontradas en df)
+    """
+    huellas = row_hashes(df)
+    nuevas = (df[columna_fecha] > fecha_max).to_numpy(copy=True)
+
+    periodo = pd.Series(huellas[~nuevas])
+    repeticion = periodo.groupby(periodo).cumcount().to_numpy()
+    en_base = pd.Series(huellas_base).value_counts()
+    nuevas_periodo = repeticion >= periodo.map(en_base).fillna(0).to_numpy()
+    nuevas[~nuevas] = nuevas_periodo
+    return nuevas, huellas, int((~nuevas_periodo).sum())
+
+
+def _leer(nombre):
+    return pd.read_parquet(os.path.join(BASE_DIR, nombre))
+
+
+@contextlib.contextmanager
+def _cerrojo(exclusivo):
+    """
+    Cerrojo de la base: compartido para leer, exclusivo para escribir.
+
+    Mientras una sesión lee, ninguna otra borra los ficheros que está leyendo; dos
+    escrituras no se solapan.
+    """
+    if not FCNTL_AVAILABLE:
+        yield
+        return
+    os.makedirs(BASE_DIR, exist_ok=True)
+    with open(os.path.join(BASE_DIR, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _leer_meta():
+    meta_path = os.path.join(BASE_DIR, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def _ficheros_meta(meta):
+    """Nombres de todos los ficheros que enumera un meta.json"""
+    if meta is None:
+        return set()
+    return {
+        nombre
+        for valor in meta.get("ficheros", {}).values()
+        for nombre in (valor if isinstance(valor, list) else [valor])
+        if nombre
+    }
+
+
+def load_base():
+    """
+    Carga el conjunto base persistido.
+
+    Returns:
+        Diccionario con las tablas de BASE_TABLES y BASE_PARTS ('filas' con la columna
+        'huella') y 'meta' (huella, categorias, columnas, fecha_max y ficheros), o None
+        si no hay base
+    """
+    if not PYARROW_AVAILABLE:
+        return None
+
+    try:
+        with _cerrojo(exclusivo=False):
+            meta = _leer_meta()
+            if meta is None or meta.get("version") != BASE_VERSION:
+                return None
+            base = {"meta": meta}
+            ficheros = meta["ficheros"]
+            for tabla in BASE_TABLES:
+                base[tabla] = _leer(ficheros[tabla])
+            for tabla in BASE_PARTS:
+                partes = [_leer(parte) for parte in ficheros[tabla]]
+                # Cada parte se codificó en su subida: mismas categorías antes de concatenar
+                align_categories(partes)
+                base[tabla] = pd.concat(partes, ignore_index=True)
+            if ficheros.get("rotacion"):
+                base["ventas"][COLUMNA_ROTACION] = _leer(ficheros["rotacion"])[COLUMNA_ROTACION].array
+    except Exception:
+        # Base corrupta o incompatible: la siguiente subida la reconstruye completa
+        return None
+    base["meta"]["fecha_max"] = pd.Timestamp(base["meta"]["fecha_max"])
+    return base
+
+
+def save_base(base, anadidas=None):
+    """
+    Guarda el conjunto base.
+
+    Los ficheros nuevos llevan un sufijo propio y meta.json, que los enumera, se
+    sustituye al final, con el cerrojo exclusivo de la base (load_base lee con el
+    compartido), así que una sesión que lea a la vez ve la base anterior o la nueva,
+    nunca una mezcla. Después se borran los ficheros del meta.json anterior que el
+    nuevo ya no usa.
+
+    Args:
+        base: Diccionario como el de load_base, con el modelo de ventas completo
+        anadidas: None para reescribir todas las partes, o diccionario con las filas
+            añadidas al final de base['ventas'] y base['filas'] (una parte nueva cada una)
+    """
+    if not PYARROW_AVAILABLE:
+        return False
+
+    sufijo = uuid.uuid4().hex
+    ficheros = {}
+
+    def escribir(tabla, df):
+        nombre = f"{tabla}-{sufijo}.parquet"
+        df.to_parquet(os.path.join(BASE_DIR, nombre))
+        return nombre
+
+    try:
+        os.makedirs(BASE_DIR, exist_ok=True)
+        with _cerrojo(exclusivo=True):
+            anterior = _leer_meta()
+            # Si otra sesión ha sustituido la base desde que se cargó, sus partes pueden
+            # no existir ya: se reescriben todas
+            if anadidas is not None and any(
+                anterior is None or anterior["ficheros"].get(tabla) != base["meta"]["ficheros"][tabla]
+                for tabla in BASE_PARTS
+            ):
+                anadidas = None
+            for tabla in BASE_TABLES:
+                ficheros[tabla] = escribir(tabla, base[tabla])
+
+            ventas = base["ventas"]
+            ficheros["rotacion"] = None
+            if COLUMNA_ROTACION in ventas.columns:
+                ficheros["rotacion"] = escribir("rotacion", ventas[[COLUMNA_ROTACION]])
+
+            for tabla in BASE_PARTS:
+                df = anadidas[tabla] if anadidas is not None else base[tabla]
+                partes = base["meta"]["ficheros"][tabla] if anadidas is not None else []
+                if anadidas is None or not df.empty:
+                    partes = partes + [escribir(tabla, df.drop(columns=[COLUMNA_ROTACION], errors='ignore'))]
+                ficheros[tabla] = partes
+
+            meta = dict(
+                base["meta"],
+                version=BASE_VERSION,
+                fecha_max=pd.Timestamp(base["meta"]["fecha_max"]).isoformat(),
+                ficheros=ficheros
+            )
+            tmp_meta = os.path.join(BASE_DIR, f".meta-{sufijo}.json")
+            with open(tmp_meta, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_meta, os.path.join(BASE_DIR, "meta.json"))
+
+            # Solo los ficheros que dejó de usar la base anterior; los de otras
+            # escrituras no se tocan
+            for nombre in _ficheros_meta(anterior) - _ficheros_meta(meta):
+                try:
+                    os.remove(os.path.join(BASE_DIR, nombre))
+                except OSError:
+                    pass
+    except Exception:
+        # Los ficheros de esta escritura no los enumera ningún meta.json
+        for entry in os.scandir(BASE_DIR):
+            if sufijo in entry.name:
+                os.remove(entry.path)
+        return False
+    return True
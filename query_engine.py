@@ -0,0 +1,61 @@
+import os
+import threading
+
+# Optional DuckDB import (motor de consultas embebido)
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+# Motor de consultas: las agregaciones que lo admiten (rotación) pueden ejecutarse en
+# una base DuckDB en memoria del proceso en lugar de en pandas. DuckDB lee los
+# DataFrames registrados sin copiarlos, ejecuta en paralelo y solo devuelve el
+# resultado, así que las tablas intermedias (semi-joins, as-of joins, filas
+# seleccionadas) no se materializan en pandas.
+
+# Motor de agregación: "pandas" (por defecto) o "duckdb" (configurable por entorno)
+MOTOR = os.environ.get("TRUCCO_MOTOR", "pandas").lower()
+
+# Hilos de DuckDB; 0 deja el valor por defecto (todos los núcleos)
+DUCKDB_THREADS = int(os.environ.get("TRUCCO_DUCKDB_THREADS", "0"))
+
+_conexion = None
+_cerrojo = threading.Lock()
+
+
+def duckdb_enabled():
+    """Si las agregaciones deben ejecutarse en DuckDB"""
+    return DUCKDB_AVAILABLE and MOTOR == "duckdb"
+
+
+def _cursor():
+    global _conexion
+    with _cerrojo:
+        if _conexion is None:
+            _conexion = duckdb.connect(":memory:")
+            if DUCKDB_THREADS:
+                _conexion.execute(f"SET threads TO {DUCKDB_THREADS}")
+    # Cada cursor es una conexión propia a la misma base: las tablas registradas son
+    # temporales de ese cursor, así que sesiones concurrentes no se pisan
+    return _conexion.cursor()
+
+
+def run_query(sql, **tablas):
+    """
+    Ejecuta una consulta sobre DataFrames registrados como tablas.
+
+    Args:
+        sql: Consulta; las tablas se nombran como los argumentos de tablas
+        **tablas: nombre -> DataFrame (se leen en sitio, sin copiarlos)
+
+    Returns:
+        DataFrame con el resultado
+    """
+    cursor = _cursor()
+    try:
+        for nombre, df in tablas.items():
+            cursor.register(nombre, df)
+        return cursor.execute(sql).df()
+    finally:
+        cursor.close()
@@ -0,0 +1,258 @@
+import pandas as pd
+
+from query_engine import duckdb_enabled, run_query
+
+# Motor de rotación de stock: empareja cada venta con la entrada en almacén más
+# reciente anterior a la venta del mismo Código único y Talla (merge_asof sobre las
+# fechas ordenadas). El resultado tiene como mucho una fila por venta, a diferencia
+# de los merges muchos-a-muchos por Código único, que multiplican cada venta por
+# todas las entradas y traspasos del producto.
+
+# Días máximos de rotación considerados (para descartar outliers)
+DIAS_ROTACION_MAX = 365
+
+
+def rotation_pairs(df_productos, df_traspasos, df_ventas):
+    """
+    Una fila por venta con la fecha de su entrada en almacén y los días de rotación.
+
+    Solo se consideran ventas de productos traspasados a la tienda de la venta
+    (Código único + Tienda presentes en traspasos) y rotaciones entre 0 y
+    DIAS_ROTACION_MAX días.
+
+    Args:
+        df_productos: Modelo de productos (Código único, Talla, Fecha almacén)
+        df_traspasos: Modelo de traspasos (Código único, Tienda, Fecha enviado)
+        df_ventas: Modelo de ventas (Código único, Talla, Tienda, Fecha venta, Familia)
+
+    Returns:
+        DataFrame con fila (índice de la venta en df_ventas), Código único, Talla, Tienda,
+        Familia, Fecha venta, Fecha almacén y Dias_Rotacion (vacío si no hay
+        emparejamientos)
+    """
+    claves = ['Código único', 'Talla']
+    entradas = df_productos[claves + ['Fecha almacén']].dropna()
+    traspasos = df_traspasos[['Código único', 'Tienda', 'Fecha enviado']].dropna()
+    ventas = df_ventas[claves + ['Tienda', 'Fecha venta', 'Familia']].dropna(
+        subset=['Código único', 'Fecha venta']
+    ).rename_axis('fila').reset_index()
+
+    # Ventas de productos traspasados a esa tienda: semi-join, sin multiplicar filas
+    pares_traspaso = pd.MultiIndex.from_frame(traspasos[['Código único', 'Tienda']].drop_duplicates())
+    ventas = ventas[pd.MultiIndex.from_frame(ventas[['Código único', 'Tienda']]).isin(pares_traspaso)]
+
+    if entradas.empty or ventas.empty:
+        return ventas.iloc[0:0].assign(**{'Fecha almacén': pd.NaT, 'Dias_Rotacion': 0})
+
+    # merge_asof necesita ambas tablas ordenadas por la fecha de emparejamiento
+    if not ventas['Fecha venta'].is_monotonic_increasing:
+        ventas = ventas.sort_values('Fecha venta', kind='stable')
+    entradas = entradas.sort_values('Fecha almacén', kind='stable')
+
+    rotacion = pd.merge_asof(
+        ventas,
+        entradas,
+        left_on='Fecha venta',
+        right_on='Fecha almacén',
+        by=claves,
+        direction='backward'
+    ).dropna(subset=['Fecha almacén'])
+
+    rotacion['Dias_Rotacion'] = (rotacion['Fecha venta'] - rotacion['Fecha almacén']).dt.days
+    return rotacion[rotacion['Dias_Rotacion'] <= DIAS_ROTACION_MAX]
+
+
+# Los mismos emparejamientos que rotation_pairs como consulta DuckDB: semi-join con los
+# pares Código único + Tienda de traspasos y ASOF JOIN hacia atrás con las entradas
+SQL_ROTACION = """
+WITH entradas AS (
+    SELECT CAST("Código único" AS VARCHAR) AS codigo, CAST("Talla" AS VARCHAR) AS talla,
+           "Fecha almacén" AS fecha_almacen
+    FROM productos
+    WHERE "Código único" IS NOT NULL AND "Talla" IS NOT NULL AND "Fecha almacén" IS NOT NULL
+), pares AS (
+    SELECT DISTINCT CAST("Código único" AS VARCHAR) AS codigo, CAST("Tienda" AS VARCHAR) AS tienda
+    FROM traspasos
+    WHERE "Código único" IS NOT NULL AND "Tienda" IS NOT NULL AND "Fecha enviado" IS NOT NULL
+), vendidas AS (
+    SELECT fila, CAST("Código único" AS VARCHAR) AS codigo, CAST("Talla" AS VARCHAR) AS talla,
+           CAST("Tienda" AS VARCHAR) AS tienda, "Fecha venta" AS fecha_venta
+    FROM ventas
+    WHERE "Código único" IS NOT NULL AND "Fecha venta" IS NOT NULL
+)
+SELECT v.fila, v.fecha_venta AS "Fecha venta", e.fecha_almacen AS "Fecha almacén"
+FROM vendidas v
+SEMI JOIN pares USING (codigo, tienda)
+ASOF JOIN entradas e
+    ON v.codigo = e.codigo AND v.talla = e.talla AND v.fecha_venta >= e.fecha_almacen
+"""
+
+
+def rotation_pairs_sql(df_productos, df_traspasos, df_ventas):
+    """
+    Emparejamientos de rotation_pairs calculados en DuckDB (query_engine).
+
+    Returns:
+        DataFrame con fila (índice de la venta en df_ventas), Fecha venta, Fecha almacén
+        y Dias_Rotacion, con las mismas filas que rotation_pairs
+    """
+    rotacion = run_query(
+        SQL_ROTACION,
+        productos=df_productos[['Código único', 'Talla', 'Fecha almacén']],
+        traspasos=df_traspasos[['Código único', 'Tienda', 'Fecha enviado']],
+        ventas=df_ventas[['Código único', 'Talla', 'Tienda', 'Fecha venta']].rename_axis('fila').reset_index()
+    )
+    # Los días se calculan en pandas, con la misma semántica que rotation_pairs
+    rotacion['Dias_Rotacion'] = (rotacion['Fecha venta'] - rotacion['Fecha almacén']).dt.days
+    return rotacion[rotacion['Dias_Rotacion'] <= DIAS_ROTACION_MAX]
+
+
+def rotation_days(df_productos, df_traspasos, df_ventas):
+    """
+    Días de rotación de cada venta como columna alineada con df_ventas.
+
+    El resultado de una venta solo depende de esa venta, de las entradas en almacén y
+    de los traspasos, así que se puede calcular por partes (p.ej. solo para las ventas
+    añadidas en una carga incremental).
+
+    Returns:
+        Serie Int16 con el índice de df_ventas; nula en las ventas sin emparejamiento
+    """
+    if duckdb_enabled():
+        pares = rotation_pairs_sql(df_productos, df_traspasos, df_ventas)
+    else:
+        pares = rotation_pairs(df_productos, df_traspasos, df_ventas)
+    dias = pd.Series(pd.NA, index=df_ventas.index, dtype='Int16')
+    dias.loc[pares['fila']] = pares['Dias_Rotacion'].to_numpy()
+    return dias
+
+
+# Estadísticas de Dias_Rotacion por tienda, por producto y globales en una sola consulta
+# (GROUPING SETS). quantile_cont y stddev_samp son la mediana y la desviación de pandas
+SQL_ESTADISTICAS_ROTACION = """
+SELECT "Tienda", "Código único", "Familia", GROUPING("Tienda", "Código único", "Familia") AS nivel,
+       avg(dias) AS "Dias_Promedio", quantile_cont(dias, 0.5) AS "Dias_Mediana",
+       stddev_samp(dias) AS "Dias_Std", count(dias) AS "Filas"
+FROM (
+    SELECT "Tienda", "Código único", "Familia", CAST("Dias_Rotacion" AS DOUBLE) AS dias
+    FROM ventas
+    WHERE "Dias_Rotacion" IS NOT NULL
+)
+GROUP BY GROUPING SETS (("Tienda"), ("Código único", "Familia"), ())
+ORDER BY nivel, "Tienda", "Código único", "Familia"
+"""
+
+
+def rotation_stats_sql(df_ventas):
+    """
+    Agregados de rotación de las ventas con Dias_Rotacion, calculados en DuckDB.
+
+    Returns:
+        (por tienda: Tienda, Dias_Promedio, Dias_Mediana, Dias_Std, Productos_Con_Rotacion;
+        por producto: Código único, Familia, Dias_Promedio, Dias_Mediana, Dias_Std,
+        Ventas_Con_Rotacion; media, mediana y desviación globales; ventas con rotación),
+        con las tablas ordenadas por sus claves como un groupby de pandas
+    """
+    resultado = run_query(
+        SQL_ESTADISTICAS_ROTACION,
+        ventas=df_ventas[['Tienda', 'Código único', 'Familia', 'Dias_Rotacion']]
+    )
+    medidas = ['Dias_Promedio', 'Dias_Mediana', 'Dias_Std']
+    # nivel es la máscara de columnas agregadas de GROUPING: 3 = por tienda, 4 = por producto
+    por_tienda = resultado[(resultado['nivel'] == 3) & resultado['Tienda'].notna()]
+    por_tienda = por_tienda[['Tienda'] + medidas + ['Filas']].rename(columns={'Filas': 'Productos_Con_Rotacion'})
+    por_producto = resultado[
+        (resultado['nivel'] == 4) & resultado['Código único'].notna() & resultado['Familia'].notna()
+    ]
+    por_producto = por_producto[['Código único', 'Familia'] + medidas + ['Filas']].rename(columns={'Filas': 'Ventas_Con_Rotacion'})
+    total = resultado[resultado['nivel'] == 7].iloc[0]
+    return (
+        por_tienda.reset_index(drop=True), por_producto.reset_index(drop=True),
+        total['Dias_Promedio'], total['Dias_Mediana'], total['Dias_Std'], int(total['Filas'])
+    )
+
+
+def _clave_limpia(serie):
+    """Claves de texto sin espacios (strip) sobre los valores únicos, no fila a fila"""
+    codigos, valores = pd.factorize(serie)
+    limpios = pd.Index(valores.astype(str)).str.strip()
+    return pd.Series(limpios.take(codigos), index=serie.index).where(codigos >= 0)
+
+
+def shipment_timeline(df_almacen, df_traspasos, df_ventas):
+    """
+    Línea temporal Entrada almacén → primer envío a tienda → primera venta.
+
+    Para cada entrada en almacén y cada tienda a la que se envió ese Código único y
+    Talla (primer envío por tienda, no anterior a la entrada), busca la primera venta
+    con Cantidad > 0 en esa tienda desde la fecha de entrada. La búsqueda es un único
+    merge_asof hacia delante agrupado por Código único, Talla y Tienda, así que vale
+    para todas las tiendas a la vez.
+
+    Args:
+        df_almacen: Entradas en almacén (Código único, Talla, Tema, Fecha almacén)
+        df_traspasos: Traspasos (Código único, Talla, Tienda, Fecha enviado)
+        df_ventas: Ventas (Código único, Talla, Tienda, Fecha venta, Cantidad)
+
+    Returns:
+        DataFrame con una fila por entrada y tienda, ordenado por fecha de entrada
+        descendente; 'Fecha Primera Venta' es "Sin ventas" y 'Días Envío-Primera Venta'
+        es -1 cuando no hay ventas
+    """
+    claves = ['Código único', 'Talla']
+
+    # 1. Solo el primer envío por tienda
+    envios = (
+        df_traspasos[claves + ['Tienda', 'Fecha enviado']]
+        .sort_values('Fecha enviado')
+        .drop_duplicates(subset=claves + ['Tienda'], keep='first')
+    )
+
+    # 2. Entradas en almacén con los envíos posteriores de ese producto/talla
+    merged = df_almacen[claves + ['Tema', 'Fecha almacén']].merge(envios, on=claves)
+    merged = merged[merged['Fecha enviado'] >= merged['Fecha almacén']].reset_index(drop=True)
+
+    # 3. Primera venta en esa tienda para ese producto/talla desde la entrada
+    por_clave = ['Código único limpio', 'Talla limpia', 'Tienda limpia']
+    izquierda = pd.DataFrame({
+        'Código único limpio': _clave_limpia(merged['Código único']),
+        'Talla limpia': _clave_limpia(merged['Talla']),
+        'Tienda limpia': _clave_limpia(merged['Tienda']),
+        'Fecha almacén': merged['Fecha almacén'],
+        'fila': merged.index
+    }).dropna(subset=por_clave).sort_values('Fecha almacén', kind='stable')
+
+    # Solo las columnas de la búsqueda, y cada combinación una vez antes de limpiar las claves
+    vendidas = df_ventas.loc[
+        (df_ventas['Cantidad'] > 0).fillna(False).to_numpy(dtype=bool),
+        ['Código único', 'Talla', 'Tienda', 'Fecha venta']
+    ].drop_duplicates()
+    derecha = pd.DataFrame({
+        'Código único limpio': _clave_limpia(vendidas['Código único']),
+        'Talla limpia': _clave_limpia(vendidas['Talla']),
+        'Tienda limpia': _clave_limpia(vendidas['Tienda']),
+        'Fecha venta': vendidas['Fecha venta']
+    }).dropna().drop_duplicates().sort_values('Fecha venta', kind='stable')
+
+    primera_venta = pd.merge_asof(
+        izquierda,
+        derecha,
+        left_on='Fecha almacén',
+        right_on='Fecha venta',
+        by=por_clave,
+        direction='forward'
+    ).set_index('fila')['Fecha venta'].reindex(merged.index)
+
+    dias_venta = (primera_venta - merged['Fecha enviado']).dt.days
+    df_timeline = pd.DataFrame({
+        'Código único': _clave_limpia(merged['Código único']).astype(object),
+        'Tema': merged['Tema'].astype(object),
+        'Talla': _clave_limpia(merged['Talla']).astype(object),
+        'Tienda Envío': merged['Tienda'].astype(object),
+        'Fecha Entrada Almacén': merged['Fecha almacén'].dt.strftime('%d/%m/%Y'),
+        'Fecha enviado a tienda': merged['Fecha enviado'].dt.strftime('%d/%m/%Y'),
+        'Fecha Primera Venta': primera_venta.dt.strftime('%d/%m/%Y').fillna("Sin ventas"),
+        'Días Entrada-Envío': (merged['Fecha enviado'] - merged['Fecha almacén']).dt.days,
+        'Días Envío-Primera Venta': dias_venta.fillna(-1).astype('int64')
+    })
+    return df_timeline.loc[merged['Fecha almacén'].sort_values(ascending=False).index]
@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+# Cubo de ventas preagregado: una celda por combinación de dimensiones presente en
+# ventas, con las medidas ya sumadas. Los gráficos de resumen agregan las celdas del
+# cubo (miles) en lugar de las filas de ventas (millones tras el merge de costes).
+
+# Grano del cubo. Mes, Es_Online y Zona Geográfica dependen del día o de la tienda,
+# así que no multiplican el número de celdas
+DIMENSIONES_CUBO = ['Fecha venta', 'Mes', 'Tienda', 'Es_Online', 'Zona Geográfica',
+                    'Familia', 'Talla', 'Temporada']
+
+# Medidas sumadas por celda
+#   Devoluciones:           Cantidad de las filas con Cantidad < 0 (valor negativo)
+#   Beneficio devoluciones: Beneficio de esas mismas filas
+#   Filas:                  número de filas de ventas de la celda
+MEDIDAS_CUBO = ['Cantidad', 'Beneficio', 'Devoluciones', 'Beneficio devoluciones', 'Filas']
+
+
+def build_cube(df_ventas):
+    """
+    Materializa el cubo de ventas a partir del modelo analítico.
+
+    Las filas con alguna dimensión nula se conservan (dropna=False), de modo que los
+    totales del cubo coinciden con los de ventas.
+
+    Returns:
+        DataFrame con las columnas de DIMENSIONES_CUBO presentes y MEDIDAS_CUBO,
+        ordenado por Fecha venta
+    """
+    dimensiones = [col for col in DIMENSIONES_CUBO if col in df_ventas.columns]
+    devolucion = (df_ventas['Cantidad'] < 0).fillna(False).to_numpy(dtype=bool)
+    medidas = pd.DataFrame({
+        'Cantidad': df_ventas['Cantidad'],
+        'Beneficio': df_ventas['Beneficio'],
+        'Devoluciones': df_ventas['Cantidad'].where(devolucion),
+        'Beneficio devoluciones': df_ventas['Beneficio'].where(devolucion),
+        'Filas': np.ones(len(df_ventas), dtype=np.int64)
+    }, index=df_ventas.index)
+    claves = [df_ventas[col] for col in dimensiones]
+    return medidas.groupby(claves, observed=True, dropna=False).sum().reset_index()
+
+
+def merge_cubes(*cubos):
+    """
+    Suma las celdas de varios cubos, p.ej. el de la base y el de las ventas añadidas
+    en una carga incremental. Todas las medidas son sumas, así que el resultado es el
+    cubo de la unión de las ventas.
+
+    Los cubos deben tener las categóricas alineadas (schema.align_categories).
+    """
+    cubo = pd.concat(cubos, ignore_index=True)
+    dimensiones = [col for col in DIMENSIONES_CUBO if col in cubo.columns]
+    return cubo.groupby(dimensiones, observed=True, dropna=False)[MEDIDAS_CUBO].sum().reset_index()
+
+
+def filter_cube(cubo, filtros=None, fecha_inicio=None, fecha_fin=None, tiendas=None):
+    """
+    Aplica los filtros del dashboard directamente sobre las dimensiones del cubo.
+
+    Args:
+        cubo: Cubo de build_cube
+        filtros: Diccionario columna -> lista de valores (Temporada, Familia, Es_Online...)
+        fecha_inicio, fecha_fin: Rango de fechas (inclusive) sobre 'Fecha venta'
+        tiendas: Lista de tiendas seleccionadas, o None para no filtrar
+
+    Returns:
+        Subconjunto de celdas del cubo
+    """
+    mascara = np.ones(len(cubo), dtype=bool)
+    for columna, valores in (filtros or {}).items():
+        mascara &= cubo[columna].isin(valores).to_numpy()
+    if fecha_inicio is not None:
+        mascara &= (cubo['Fecha venta'] >= pd.Timestamp(fecha_inicio)).to_numpy()
+    if fecha_fin is not None:
+        mascara &= (cubo['Fecha venta'] <= pd.Timestamp(fecha_fin)).to_numpy()
+    if tiendas is not None:
+        mascara &= cubo['Tienda'].isin(tiendas).to_numpy()
+    return cubo[mascara]
+
+
+def rollup(cubo, dimensiones, medidas=('Cantidad', 'Beneficio')):
+    """
+    Agrega el cubo a un subconjunto de sus dimensiones, como un groupby sobre ventas.
+
+    Args:
+        cubo: Cubo (o subconjunto filtrado) de build_cube
+        dimensiones: Columna o lista de columnas de agrupación
+        medidas: Medidas a sumar
+
+    Returns:
+        DataFrame con las dimensiones y las medidas sumadas
+    """
+    if isinstance(dimensiones, str):
+        dimensiones = [dimensiones]
+    return cubo.groupby(list(dimensiones), observed=True)[list(medidas)].sum().reset_index()
+
+
+def dense_grid(df, filas, columnas=None, medida='Cantidad'):
+    """
+    Matriz filas x columnas con la medida sumada y ceros en las combinaciones sin datos.
+
+    Es una sola agregación agrupada seguida de un reindex al producto de los valores
+    presentes en cada eje; los ejes quedan ordenados (las categóricas, como Talla, por
+    el orden de sus categorías).
+
+    Args:
+        df: DataFrame (filas de un modelo, celdas del cubo o un rollup)
+        filas: Columna del eje de filas, p.ej. 'Talla' o 'Mes Entrada'
+        columnas: Columna del eje de columnas, o None para una sola columna con la medida
+        medida: Columna a sumar
+
+    Returns:
+        DataFrame con índice filas y una columna por valor de columnas (o la medida)
+    """
+    claves = [filas] if columnas is None else [filas, columnas]
+    suma = df.groupby(claves, observed=True)[medida].sum()
+    if columnas is None:
+        return suma.to_frame()
+    ejes = [suma.index.get_level_values(clave).unique().sort_values() for clave in claves]
+    completa = suma.reindex(pd.MultiIndex.from_product(ejes, names=claves), fill_value=0)
+    return completa.unstack(columnas)
@@ -0,0 +1,333 @@
+import numpy as np
+import pandas as pd
+
+# Versión del registro: forma parte de la clave de los snapshots, así que cualquier
+# cambio en tipos o reglas de parseo debe incrementarla
+SCHEMA_VERSION = 1
+
+# Formato de fecha de las hojas del Excel
+FORMATO_FECHA = '%d/%m/%Y'
+
+# Regla para columnas de texto que no están en el registro
+TEXTO = {"dtype": "str", "nullable": False}
+
+
+def _texto(rename):
+    return {"rename": rename, "dtype": "str", "nullable": False}
+
+
+# Registro de esquemas por hoja: columna original del Excel -> reglas
+#   rename:   nombre de la columna en el dashboard
+#   dtype:    "str", "Int64", "Float64", "float64" o "datetime"
+#   nullable: si False, los nulos de texto se guardan como ''
+#   parse:    "codigo" (primer token del ACT) o "fecha" (dd/mm/aaaa)
+SCHEMAS = {
+    "productos": {
+        "hoja": "Compra",
+        "columnas": {
+            "TPV": _texto("Código Tienda"),
+            "NombreTPV": _texto("Tienda"),
+            "Fecha Presupuesto": _texto("Fecha Presupuesto"),
+            "Fecha Tope": _texto("Fecha Tope"),
+            "Marca": _texto("Código Marca"),
+            "Descripción Marca": _texto("Marca"),
+            "Generico": _texto("Genérico"),
+            "ACT": {"rename": "Código único", "dtype": "str", "nullable": True, "parse": "codigo"},
+            "Artículo": _texto("Artículo"),
+            "Modelo Artículo": _texto("Modelo Artículo"),
+            "Color": _texto("Código Color"),
+            "Descripción Color": _texto("Color"),
+            "Talla": _texto("Talla"),
+            "Tema": _texto("Tema"),
+            "Unnamed: 14": _texto("Unnamed: 14"),
+            "Cantidad Pedida": {"rename": "Cantidad pedida", "dtype": "Int64", "nullable": True},
+            "Fecha REAL entrada en almacén": {"rename": "Fecha almacén", "dtype": "datetime", "nullable": True, "parse": "fecha"},
+            "Precio Coste": {"rename": "Precio Coste", "dtype": "float64", "nullable": True},
+            "P.V.P.": {"rename": "PVP", "dtype": "Float64", "nullable": True},
+            "Importe de Coste": {"rename": "Importe de Coste", "dtype": "float64", "nullable": True}
+        }
+    },
+    "traspasos": {
+        "hoja": "Traspasos de almacén a tienda",
+        "columnas": {
+            "Nº. TPV Origen": _texto("Nº. TPV Origen"),
+            "NombreTPVOrigen": _texto("NombreTPVOrigen"),
+            "Fecha Documento": {"rename": "Fecha enviado", "dtype": "datetime", "nullable": True, "parse": "fecha"},
+            "Nº. TPV Destino": _texto("Nº. TPV Destino"),
+            "NombreTpvDestino": _texto("Tienda"),
+            "Zona Geográfica": _texto("Zona Geográfica"),
+            "Marca": _texto("Marca"),
+            "Descripción Marca": _texto("Descripción Marca"),
+            "Temporada": _texto("Temporada"),
+            "Genérico": _texto("Genérico"),
+            "ACT": {"rename": "Código único", "dtype": "str", "nullable": True, "parse": "codigo"},
+            "Artículo": _texto("Artículo"),
+            "Modelo Artículo": _texto("Modelo Artículo"),
+            "Color": _texto("Código Color"),
+            "Descripción Color": _texto("Descripción Color"),
+            "Talla": _texto("Talla"),
+            "Enviado": {"rename": "Cantidad enviada", "dtype": "Int64", "nullable": True},
+            "Descripción Familia": _texto("Familia")
+        }
+    },
+    "ventas": {
+        "hoja": "ventas 23 24 25",
+        "columnas": {
+            "TPV": _texto("Código Tienda"),
+            "NombreTPV": _texto("Tienda"),
+            "Zona geográfica": _texto("Zona Geográfica"),
+            "Fecha Documento": {"rename": "Fecha venta", "dtype": "datetime", "nullable": True, "parse": "fecha"},
+            "Marca": _texto("Código Marca"),
+            "Descripción Marca": _texto("Marca"),
+            "Temporada": _texto("Temporada"),
+            "Genérico": _texto("Genérico"),
+            "ACT": {"rename": "Código único", "dtype": "str", "nullable": True, "parse": "codigo"},
+            "Artículo": _texto("Artículo"),
+            "Modelo Artículo": _texto("Modelo Artículo"),
+            "Color": _texto("Código Color"),
+            "Descripción Color": _texto("Color"),
+            "Talla": _texto("Talla"),
+            "Familia": _texto("Código Familia"),
+            "Descripción Familia": _texto("Familia"),
+            "Tema": _texto("Tema"),
+            "Cantidad": {"rename": "Cantidad", "dtype": "Int64", "nullable": True},
+            "P.V.P.": {"rename": "PVP", "dtype": "Float64", "nullable": True},
+            "Subtotal": {"rename": "Beneficio", "dtype": "Float64", "nullable": True}
+        }
+    }
+}
+
+# Orden en que load_excel_data devuelve las hojas
+ORDEN_HOJAS = ("productos", "traspasos", "ventas")
+
+# Dimensiones que se pueden guardar como categóricas, con las columnas (hoja, columna
+# original) que comparten un mismo diccionario de categorías
+DIMENSIONES = {
+    "Tienda": [("productos", "NombreTPV"), ("traspasos", "NombreTpvDestino"), ("ventas", "NombreTPV")],
+    "Familia": [("traspasos", "Descripción Familia"), ("ventas", "Descripción Familia")],
+    "Talla": [("productos", "Talla"), ("traspasos", "Talla"), ("ventas", "Talla")],
+    "Temporada": [("traspasos", "Temporada"), ("ventas", "Temporada")],
+    "Zona Geográfica": [("traspasos", "Zona Geográfica"), ("ventas", "Zona geográfica")],
+    "Color": [("productos", "Descripción Color"), ("traspasos", "Descripción Color"), ("ventas", "Descripción Color")],
+    "Tema": [("productos", "Tema"), ("ventas", "Tema")],
+    "Código único": [("productos", "ACT"), ("traspasos", "ACT"), ("ventas", "ACT")]
+}
+
+# Valores que el dashboard asigna después de la carga y que deben existir como categoría
+CATEGORIAS_CENTINELA = {
+    "Familia": ["Sin Familia"],
+    "Temporada": ["Sin Temporada"],
+    "Color": ["Desconocido"]
+}
+
+
+def rename_map(nombre):
+    """Mapa columna original -> nombre en el dashboard para una hoja"""
+    return {col: spec["rename"] for col, spec in SCHEMAS[nombre]["columnas"].items()}
+
+
+def read_dtypes(nombre):
+    """
+    Tipos que se pasan directamente al lector de Excel.
+
+    Solo se incluyen los que no pueden fallar al leer (texto y enteros/decimales
+    nullable); fechas y float64 se convierten después con coerción.
+    """
+    dtypes = {}
+    for col, spec in SCHEMAS[nombre]["columnas"].items():
+        if spec["dtype"] == "str":
+            dtypes[col] = str
+        elif spec["dtype"] in ("Int64", "Float64"):
+            dtypes[col] = spec["dtype"]
+    return dtypes
+
+
+def _convertir(serie, spec):
+    dtype = spec["dtype"]
+    parse = spec.get("parse")
+
+    if dtype == "datetime":
+        if pd.api.types.is_datetime64_any_dtype(serie):
+            return serie
+        return pd.to_datetime(serie, format=FORMATO_FECHA, errors='coerce')
+
+    if dtype == "str":
+        if parse == "codigo":
+            serie = serie.astype(str).where(serie.notna()).str.split().str[0]
+        if not spec.get("nullable", True):
+            serie = serie.fillna('')
+        if serie.dtype != object:
+            serie = serie.astype(str)
+        return serie
+
+    # Numéricas: solo se convierten si el lector no las dejó ya con el tipo final
+    if serie.dtype == dtype:
+        return serie
+    return pd.to_numeric(serie, errors='coerce').astype(dtype)
+
+
+def apply_schema(df, nombre):
+    """
+    Aplica tipos, nulos y reglas de parseo de una hoja en una sola pasada por columna.
+
+    Las columnas de texto que no están en el registro se tratan como texto no nulo,
+    igual que hacía la limpieza anterior, pero sin escanearlas para adivinar su tipo.
+    """
+    columnas = SCHEMAS[nombre]["columnas"]
+    for col in df.columns:
+        spec = columnas.get(col)
+        if spec is None:
+            if df[col].dtype != object:
+                continue
+            spec = TEXTO
+        df[col] = _convertir(df[col], spec)
+    return df
+
+
+def encode_dimensions(frames):
+    """
+    Convierte las columnas de DIMENSIONES en categóricas con un diccionario compartido.
+
+    Todas las columnas de una dimensión reciben el mismo CategoricalDtype (unión ordenada
+    de los valores de las tres hojas), de modo que los merges entre hojas, p.ej. ventas y
+    traspasos por Código único y Tienda, comparan códigos enteros en lugar de cadenas.
+
+    Args:
+        frames: Diccionario nombre de hoja -> DataFrame ya pasado por apply_schema
+
+    Returns:
+        Diccionario dimensión -> CategoricalDtype aplicado
+    """
+    tipos = {}
+    for dimension, columnas in DIMENSIONES.items():
+        presentes = [(frames[hoja], col) for hoja, col in columnas if col in frames[hoja].columns]
+        if not presentes:
+            continue
+        valores = set(CATEGORIAS_CENTINELA.get(dimension, []))
+        for df, col in presentes:
+            valores.update(df[col].dropna().unique())
+        tipos[dimension] = pd.CategoricalDtype(sorted(valores))
+        for df, col in presentes:
+            df[col] = df[col].astype(tipos[dimension])
+    return tipos
+
+
+def custom_sort_key(talla):
+    """
+    Clave de ordenación personalizada para tallas.
+    Prioriza: 1. Tallas numéricas, 2. Tallas de letra estándar, 3. Tallas únicas, 4. Resto.
+    """
+    talla_str = str(talla).upper().strip()
+    
+    # Prioridad 1: Tallas numéricas (e.g., '36', '38')
+    if talla_str.isdigit():
+        return (0, int(talla_str))
+    
+    # Prioridad 2: Tallas de letra estándar
+    size_order = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+    if talla_str in size_order:
+        return (1, size_order.index(talla_str))
+        
+    # Prioridad 3: Tallas únicas
+    if talla_str in ['U', 'ÚNICA', 'UNICA', 'TU']:
+        return (2, talla_str)
+        
+    # Prioridad 4: Resto, ordenado alfabéticamente
+    return (3, talla_str)
+
+
+def normalize_size(talla):
+    """Talla normalizada (mayúsculas, sin espacios), la forma que se ordena con custom_sort_key"""
+    return str(talla).upper().strip()
+
+
+def encode_sizes(frames, columna='Talla'):
+    """
+    Convierte la columna de talla en una categórica ordenada compartida por todas las hojas.
+
+    Cada valor distinto se normaliza una sola vez (normalize_size) y las categorías se
+    ordenan con custom_sort_key, de modo que ordenar, agrupar o pivotar por talla usa
+    los códigos enteros de la categoría en lugar de llamar a Python por cada valor.
+
+    Args:
+        frames: Lista de DataFrames; se modifican los que tienen la columna
+        columna: Nombre de la columna de talla
+
+    Returns:
+        CategoricalDtype ordenado aplicado, o None si ningún DataFrame tiene la columna
+    """
+    presentes = []
+    for df in frames:
+        if columna in df.columns:
+            codigos, valores = pd.factorize(df[columna])
+            presentes.append((df, codigos, [normalize_size(v) for v in valores]))
+    if not presentes:
+        return None
+
+    tallas = set()
+    for _, _, normalizadas in presentes:
+        tallas.update(normalizadas)
+    tipo = pd.CategoricalDtype(sorted(tallas, key=custom_sort_key), ordered=True)
+
+    for df, codigos, normalizadas in presentes:
+        posiciones = np.append(tipo.categories.get_indexer(normalizadas), -1)
+        df[columna] = pd.Categorical.from_codes(posiciones[codigos], dtype=tipo)
+    return tipo
+
+
+def align_categories(frames):
+    """
+    Da el mismo CategoricalDtype a las columnas categóricas del mismo nombre.
+
+    Necesario antes de concatenar o cruzar DataFrames codificados en subidas distintas:
+    con categorías diferentes pandas pasaría la columna a texto. Las categorías son la
+    unión, ordenada como en encode_dimensions (o con custom_sort_key si la columna es
+    ordenada, como Talla).
+
+    Args:
+        frames: Lista de DataFrames; se modifican en el sitio
+    """
+    columnas = {}
+    for df in frames:
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                columnas.setdefault(col, []).append(df)
+    for col, dfs in columnas.items():
+        tipos = [df[col].dtype for df in dfs]
+        if all(tipo == tipos[0] for tipo in tipos[1:]):
+            continue
+        valores = set()
+        for tipo in tipos:
+            valores.update(tipo.categories)
+        ordenada = tipos[0].ordered
+        tipo = pd.CategoricalDtype(
+            sorted(valores, key=custom_sort_key) if ordenada else sorted(valores),
+            ordered=ordenada
+        )
+        for df in dfs:
+            df[col] = df[col].astype(tipo)
+
+
+def frame_memory(frames):
+    """Memoria (deep) en bytes de cada DataFrame de un diccionario nombre -> DataFrame"""
+    return {nombre: df.memory_usage(deep=True).sum() for nombre, df in frames.items()}
+
+
+def memory_report(antes, despues):
+    """
+    Filas de informe por hoja con la memoria antes y después de codificar las dimensiones.
+
+    Args:
+        antes, despues: Diccionarios nombre de hoja -> bytes (ver frame_memory)
+    """
+    filas = []
+    for nombre in ORDEN_HOJAS:
+        mb_antes = antes[nombre] / 1024 ** 2
+        mb_despues = despues[nombre] / 1024 ** 2
+        filas.append({
+            'Hoja': SCHEMAS[nombre]["hoja"],
+            'Modo': 'Categorías',
+            'Memoria texto (MB)': round(mb_antes, 1),
+            'Memoria categórica (MB)': round(mb_despues, 1)
+        })
+    return filas
@@ -0,0 +1,215 @@
+import numpy as np
+import pandas as pd
+
+from sales_cube import dense_grid
+
+# Temporadas comerciales: relación entre los temas de compra (Tema_temporada, p.ej.
+# 'T_OI25') y las temporadas de venta ('I2025'), comparación de lo enviado por el
+# almacén con lo vendido en la temporada de cada tema, y calendario con la ventana de
+# venta de cada temporada para clasificar las ventas en / fuera de temporada.
+
+# Prefijo de campaña del tema -> letra de la temporada de ventas
+#   OI: otoño-invierno -> I
+#   PV: primavera-verano -> V
+CAMPANAS_TEMA = {'OI': 'I', 'PV': 'V'}
+
+# Calendario de temporadas: ventana de venta de cada campaña como (desplazamiento del
+# año de la temporada, mes, día) de inicio y de fin, ambos incluidos
+#   I2025: 1 de septiembre de 2024 a 28 de febrero de 2025 (sin bisiestos)
+#   V2025: 1 de marzo a 31 de agosto de 2025
+CALENDARIO_TEMPORADAS = {
+    'I': {'inicio': (-1, 9, 1), 'fin': (0, 2, 28)},
+    'V': {'inicio': (0, 3, 1), 'fin': (0, 8, 31)}
+}
+
+# Ventanas propias de un mercado, con el mismo formato por campaña. La clave es
+# (Marca, País); None vale para cualquier marca o país. Se usa la más específica:
+# (marca, país), (marca, None), (None, país) y por último CALENDARIO_TEMPORADAS
+CALENDARIO_MERCADOS = {}
+
+# Columnas de ventas que identifican el mercado, si existen
+COLUMNAS_MERCADO = ['Marca', 'País']
+
+
+def tema_temporada(temas):
+    """
+    Temporada de ventas de cada tema: 'T_OI25' -> 'I2025', 'T_PV24' -> 'V2024'.
+
+    Args:
+        temas: Serie (o lista) de valores de Tema_temporada
+
+    Returns:
+        Serie con la temporada, o None para los temas sin formato T_<campaña><año>
+    """
+    temas = pd.Series(temas, dtype=object)
+    partes = temas.str.extract(r'^T_([A-Z]{2})(\d{2})$')
+    letra = partes[0].map(CAMPANAS_TEMA)
+    temporada = letra + '20' + partes[1]
+    return temporada.astype(object).where(temporada.notna(), None)
+
+
+def tema_comparison(df_almacen, df_ventas):
+    """
+    Enviado por el almacén frente a vendido en la temporada del tema, por talla.
+
+    Una sola agregación agrupada por tema para todas las entradas y otra para las
+    ventas; cada venta se asigna a los temas cuyos Código único coinciden y cuya
+    temporada es la de la venta.
+
+    Args:
+        df_almacen: Entradas en almacén (Tema_temporada, Código único, Talla,
+            Mes Entrada, Cantidad pedida)
+        df_ventas: Ventas (Código único, Temporada, Talla, Cantidad)
+
+    Returns:
+        Diccionario tema -> {'temporada': temporada de ventas o None,
+        'comparacion': formato largo Talla/Tipo/Cantidad ('Enviado Almacén' y
+        'Ventas') o None si el tema no tiene ventas en su temporada,
+        'entradas': tabla Mes Entrada x Talla con la Cantidad pedida (dense_grid)},
+        con los temas ordenados
+    """
+    temas = sorted(df_almacen['Tema_temporada'].unique())
+    temporadas = dict(zip(temas, tema_temporada(temas)))
+
+    # Entradas: una agregación por tema, mes y talla
+    entradas = dict(tuple(
+        df_almacen.groupby(['Tema_temporada', 'Mes Entrada', 'Talla'], observed=True)['Cantidad pedida']
+        .sum()
+        .reset_index()
+        .groupby('Tema_temporada')
+    ))
+    enviado = df_almacen.groupby(['Tema_temporada', 'Talla'], observed=True)['Cantidad pedida'].sum()
+
+    # Ventas: se agregan antes de cruzarlas con los Código único de cada tema
+    pares = df_almacen[['Código único', 'Tema_temporada']].drop_duplicates()
+    pares = pares.assign(Temporada=pares['Tema_temporada'].map(temporadas)).dropna(subset=['Temporada'])
+    ventas = (
+        df_ventas.groupby(['Código único', 'Temporada', 'Talla'], observed=True, dropna=False)['Cantidad']
+        .sum()
+        .reset_index()
+    )
+    ventas['Temporada'] = ventas['Temporada'].astype(object)
+    ventas_tema = ventas.merge(pares, on=['Código único', 'Temporada'])
+    temas_con_ventas = set(ventas_tema['Tema_temporada'])
+    vendido = ventas_tema.groupby(['Tema_temporada', 'Talla'], observed=True)['Cantidad'].sum()
+    por_talla = pd.concat({'Enviado Almacén': enviado, 'Ventas': vendido}, axis=1).fillna(0)
+    temas_con_ventas &= set(por_talla.index.get_level_values('Tema_temporada'))
+
+    resultado = {}
+    for tema in temas:
+        tabla = pd.DataFrame()
+        if tema in entradas:
+            tabla = dense_grid(entradas[tema], 'Mes Entrada', 'Talla', 'Cantidad pedida')
+        comparacion = None
+        if tema in temas_con_ventas:
+            comparacion = por_talla.loc[tema].sort_index().reset_index().melt(
+                id_vars='Talla', var_name='Tipo', value_name='Cantidad'
+            )
+        resultado[tema] = {
+            'temporada': temporadas[tema],
+            'comparacion': comparacion,
+            'entradas': tabla
+        }
+    return resultado
+
+
+def _ventanas_mercado(marca=None, pais=None):
+    """Ventanas por campaña que aplican a un mercado (ver CALENDARIO_MERCADOS)"""
+    ventanas = dict(CALENDARIO_TEMPORADAS)
+    for clave in ((None, pais), (marca, None), (marca, pais)):
+        if clave in CALENDARIO_MERCADOS:
+            ventanas.update(CALENDARIO_MERCADOS[clave])
+    return ventanas
+
+
+def _fecha_ventana(ano, regla):
+    desplazamiento, mes, dia = regla
+    try:
+        return pd.Timestamp(year=ano + desplazamiento, month=mes, day=dia)
+    except (ValueError, OverflowError):
+        return pd.NaT
+
+
+def season_calendar(claves):
+    """
+    Tabla del calendario de temporadas para las combinaciones dadas.
+
+    Las temporadas válidas son una campaña de CALENDARIO_TEMPORADAS seguida del año
+    ('I2025', 'V2024'); el resto ('Sin Temporada', códigos mal formados) no tiene
+    ventana.
+
+    Args:
+        claves: DataFrame con Temporada y, opcionalmente, Marca y País (una fila por
+            combinación; se resuelve en Python, así que deben ser los valores únicos)
+
+    Returns:
+        claves con 'Inicio temporada' y 'Fin temporada' (NaT sin ventana)
+    """
+    sin_mercado = pd.Series(None, index=claves.index, dtype=object)
+    marcas = claves['Marca'] if 'Marca' in claves.columns else sin_mercado
+    paises = claves['País'] if 'País' in claves.columns else sin_mercado
+
+    inicios, fines = [], []
+    for temporada, marca, pais in zip(claves['Temporada'], marcas, paises):
+        ventana = None
+        if isinstance(temporada, str) and len(temporada) >= 5 and temporada[1:].isdigit():
+            ventana = _ventanas_mercado(marca, pais).get(temporada[0])
+        if ventana is None:
+            inicios.append(pd.NaT)
+            fines.append(pd.NaT)
+        else:
+            ano = int(temporada[1:])
+            inicios.append(_fecha_ventana(ano, ventana['inicio']))
+            fines.append(_fecha_ventana(ano, ventana['fin']))
+    return claves.assign(**{
+        'Inicio temporada': pd.DatetimeIndex(inicios),
+        'Fin temporada': pd.DatetimeIndex(fines)
+    })
+
+
+def classify_season(df_ventas, fecha='Fecha venta'):
+    """
+    Clasifica cada venta como en temporada o fuera de temporada.
+
+    El calendario se resuelve una vez por combinación distinta de Temporada (y Marca /
+    País si existen) y se lleva a las filas con los códigos de factorize; la
+    clasificación son comparaciones de arrays de fechas.
+
+    Args:
+        df_ventas: Ventas con Temporada y la columna de fecha
+        fecha: Columna con la fecha de la venta
+
+    Returns:
+        DataFrame con el índice de df_ventas y las columnas
+        'Fuera de temporada' (bool; también las ventas sin ventana o sin fecha) y
+        'Semana temporada' (semanas completas desde el inicio de la ventana, negativas
+        antes del inicio; nulo sin ventana)
+    """
+    claves = ['Temporada'] + [col for col in COLUMNAS_MERCADO if col in df_ventas.columns]
+
+    # Código de combinación a partir de los códigos de cada columna (los nulos, -1,
+    # pasan a ser el último valor), sin materializar tuplas por fila
+    codigos = np.zeros(len(df_ventas), dtype=np.int64)
+    valores = []
+    for col in claves:
+        codigos_col, unicos = pd.factorize(df_ventas[col])
+        unicos = np.append(np.asarray(unicos, dtype=object), None)
+        codigos = codigos * len(unicos) + np.where(codigos_col < 0, len(unicos) - 1, codigos_col)
+        valores.append(unicos)
+    codigos, combinados = pd.factorize(codigos)
+
+    columnas = {}
+    for col, unicos in zip(reversed(claves), reversed(valores)):
+        combinados, posicion = np.divmod(combinados, len(unicos))
+        columnas[col] = unicos[posicion]
+    calendario = season_calendar(pd.DataFrame(columnas)[claves])
+    inicio = calendario['Inicio temporada'].to_numpy()[codigos]
+    fin = calendario['Fin temporada'].to_numpy()[codigos]
+    fechas = df_ventas[fecha].to_numpy()
+
+    en_temporada = (inicio <= fechas) & (fechas <= fin)
+    dias = pd.Series(fechas - inicio, index=df_ventas.index).dt.days
+    return pd.DataFrame({
+        'Fuera de temporada': ~en_temporada,
+        'Semana temporada': (dias // 7).astype('Int16')
+    }, index=df_ventas.index)
@@ -0,0 +1,123 @@
+import hashlib
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+
+# Optional pyarrow import (Parquet snapshots)
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Directorio y tamaño máximo de los snapshots (configurables por entorno)
+SNAPSHOT_DIR = os.environ.get(
+    "TRUCCO_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots")
+)
+SNAPSHOT_MAX_BYTES = int(os.environ.get("TRUCCO_SNAPSHOT_MAX_MB", "2048")) * 1024 * 1024
+
+# Orden de las hojas tal y como las devuelve load_excel_data
+SNAPSHOT_SHEETS = ("productos", "traspasos", "ventas")
+
+
+def digest_bytes(data):
+    """Huella SHA-256 del contenido subido, usada como clave del snapshot"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _snapshot_path(digest):
+    return os.path.join(SNAPSHOT_DIR, digest)
+
+
+def _dir_size(path):
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+def load_snapshot(digest):
+    """
+    Carga los DataFrames limpios de un snapshot previo.
+
+    Returns:
+        Tupla (df_productos, df_traspasos, df_ventas) o None si no existe el snapshot
+    """
+    if not PYARROW_AVAILABLE:
+        return None
+
+    path = _snapshot_path(digest)
+    files = [os.path.join(path, f"{sheet}.parquet") for sheet in SNAPSHOT_SHEETS]
+    if not all(os.path.exists(f) for f in files):
+        return None
+
+    try:
+        frames = tuple(pd.read_parquet(f) for f in files)
+    except Exception:
+        # Snapshot corrupto o incompatible: se descarta y se vuelve a generar
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+    # Marcar como usado recientemente para la política LRU
+    now = time.time()
+    os.utime(path, (now, now))
+    return frames
+
+
+def save_snapshot(digest, frames):
+    """Guarda los DataFrames limpios como Parquet y aplica la política de expulsión"""
+    if not PYARROW_AVAILABLE:
+        return False
+
+    path = _snapshot_path(digest)
+    if os.path.exists(path):
+        return True
+
+    # Escribir en un directorio temporal y renombrar para que otra sesión
+    # nunca lea un snapshot a medio escribir
+    tmp_path = os.path.join(SNAPSHOT_DIR, f".tmp-{digest}-{uuid.uuid4().hex}")
+    try:
+        os.makedirs(tmp_path, exist_ok=True)
+        for sheet, df in zip(SNAPSHOT_SHEETS, frames):
+            df.to_parquet(os.path.join(tmp_path, f"{sheet}.parquet"))
+        os.replace(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return False
+
+    evict_snapshots(keep=digest)
+    return True
+
+
+def evict_snapshots(max_bytes=None, keep=None):
+    """
+    Elimina los snapshots menos usados recientemente hasta quedar por debajo de max_bytes.
+
+    Args:
+        max_bytes: Tamaño máximo del directorio (por defecto SNAPSHOT_MAX_BYTES)
+        keep: Digest que nunca se elimina (el que se acaba de escribir)
+    """
+    if max_bytes is None:
+        max_bytes = SNAPSHOT_MAX_BYTES
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return
+
+    snapshots = []
+    for entry in os.scandir(SNAPSHOT_DIR):
+        if entry.is_dir() and not entry.name.startswith(".tmp-"):
+            snapshots.append((entry.stat().st_mtime, entry.name, _dir_size(entry.path)))
+
+    total = sum(size for _, _, size in snapshots)
+    # Más antiguos primero
+    for _, name, size in sorted(snapshots):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(_snapshot_path(name), ignore_errors=True)
+        total -= size